@@ -0,0 +1,107 @@
+"""Per-chat administrator rosters, fetched in one call and kept fresh."""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet
+
+from pyrogram import Client, enums
+from pyrogram.errors import RPCError
+
+from config import ADMIN_ROSTER_CACHE_SIZE, ADMIN_ROSTER_TTL
+
+logger = logging.getLogger(__name__)
+
+ADMIN_STATUSES = (enums.ChatMemberStatus.ADMINISTRATOR, enums.ChatMemberStatus.OWNER)
+# How long a roster that failed to refresh is served before trying again.
+RETRY_AFTER = 60.0
+
+
+@dataclass(slots=True)
+class _Roster:
+    admins: FrozenSet[int]
+    fetched_at: float
+
+
+class AdminRoster:
+    """Administrator IDs per chat from ``get_chat_members(filter=ADMINISTRATORS)``.
+
+    A roster older than ``ttl`` seconds is still answered from, while a
+    background task fetches a new one, so admin checks never wait once a
+    chat is known.  :meth:`apply_member_update` keeps rosters current
+    between refreshes.  At most ``max_chats`` rosters are kept.
+    """
+
+    def __init__(self, *, ttl: float, max_chats: int) -> None:
+        self.ttl = ttl
+        self.max_chats = max(1, max_chats)
+        self._rosters: "OrderedDict[int, _Roster]" = OrderedDict()
+        self._pending: Dict[int, "asyncio.Task[_Roster]"] = {}
+
+    async def is_admin(self, client: Client, chat_id: int, user_id: int) -> bool:
+        roster = self._rosters.get(chat_id)
+        if roster is None:
+            roster = await asyncio.shield(self._refresh(client, chat_id))
+        else:
+            self._rosters.move_to_end(chat_id)
+            if time.monotonic() - roster.fetched_at > self.ttl:
+                self._refresh(client, chat_id)
+        return user_id in roster.admins
+
+    def invalidate(self, chat_id: int) -> None:
+        self._rosters.pop(chat_id, None)
+
+    def apply_member_update(self, chat_id: int, user_id: int, is_admin: bool) -> None:
+        """Record a promotion or demotion seen in a ChatMemberUpdated event."""
+        roster = self._rosters.get(chat_id)
+        if roster is None:
+            return
+        if is_admin:
+            roster.admins = roster.admins | {user_id}
+        else:
+            roster.admins = roster.admins - {user_id}
+
+    def _refresh(self, client: Client, chat_id: int) -> "asyncio.Task[_Roster]":
+        """Start fetching the roster of ``chat_id`` unless a fetch is under way."""
+        task = self._pending.get(chat_id)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(client, chat_id))
+            self._pending[chat_id] = task
+            task.add_done_callback(lambda _: self._pending.pop(chat_id, None))
+        return task
+
+    async def _fetch(self, client: Client, chat_id: int) -> _Roster:
+        try:
+            admins = frozenset(
+                [
+                    member.user.id
+                    async for member in client.get_chat_members(
+                        chat_id, filter=enums.ChatMembersFilter.ADMINISTRATORS
+                    )
+                    if member.user
+                ]
+            )
+        except RPCError as err:
+            logger.warning("Could not fetch the administrators of %s: %s", chat_id, err)
+            # Keep answering from the stale (or an empty) roster and retry a
+            # little later rather than on every message.
+            retry_at = time.monotonic() - self.ttl + RETRY_AFTER
+            roster = self._rosters.get(chat_id)
+            if roster is None:
+                return self._store(chat_id, _Roster(frozenset(), retry_at))
+            roster.fetched_at = retry_at
+            return roster
+        return self._store(chat_id, _Roster(admins, time.monotonic()))
+
+    def _store(self, chat_id: int, roster: _Roster) -> _Roster:
+        self._rosters[chat_id] = roster
+        self._rosters.move_to_end(chat_id)
+        while len(self._rosters) > self.max_chats:
+            self._rosters.popitem(last=False)
+        return roster
+
+
+admin_roster = AdminRoster(ttl=ADMIN_ROSTER_TTL, max_chats=ADMIN_ROSTER_CACHE_SIZE)
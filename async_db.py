@@ -0,0 +1,296 @@
+"""Awaitable versions of the :mod:`db` helpers for use from handlers.
+
+pymongo is blocking, so every call runs in a bounded thread pool
+(``DB_POOL_SIZE`` workers) and is limited to ``DB_CALL_TIMEOUT`` seconds,
+both on the server (``pymongo.timeout``) and while waiting for a free worker.
+Lookups that the channel cache can answer return without leaving the loop,
+and action log entries and recent posts are buffered by a :class:`BulkWriter`.
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+import pymongo
+from bson import ObjectId
+from pymongo.collection import Collection
+from pymongo.errors import PyMongoError
+
+import db
+from config import (
+    ACTION_LOG_BATCH_SIZE,
+    ACTION_LOG_FLUSH_INTERVAL,
+    ACTION_LOG_MAX_PENDING,
+    ACTION_LOG_OVERFLOW,
+    DB_CALL_TIMEOUT,
+    DB_POOL_SIZE,
+    RECENT_POSTS_FLUSH_INTERVAL,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_executor = ThreadPoolExecutor(
+    max_workers=max(1, DB_POOL_SIZE), thread_name_prefix="mongo"
+)
+
+
+def _call_with_timeout(timeout: float, func: Callable[..., T], *args: Any) -> T:
+    with pymongo.timeout(timeout):
+        return func(*args)
+
+
+async def run(func: Callable[..., T], *args: Any, timeout: Optional[float] = None) -> T:
+    """Run a blocking ``db`` function in the pool and await its result.
+
+    Raises ``asyncio.TimeoutError`` if no worker picks the call up in time
+    and a ``pymongo.errors.PyMongoError`` if the operation itself times out.
+    """
+    timeout = DB_CALL_TIMEOUT if timeout is None else timeout
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(
+        _executor, functools.partial(_call_with_timeout, timeout, func, *args)
+    )
+    # Leave pymongo a moment to report its own timeout before giving up here.
+    return await asyncio.wait_for(future, timeout + 1)
+
+
+def shutdown() -> None:
+    _executor.shutdown(wait=True)
+
+
+# ----------------------------------------------------------------------
+# Buffered writes
+# ----------------------------------------------------------------------
+class BulkWriter:
+    """Batch inserts into one collection with ``insert_many(ordered=False)``.
+
+    Documents are flushed once ``batch_size`` are buffered or every
+    ``flush_interval`` seconds.  At most ``max_pending`` documents are held,
+    including the batch being written; beyond that ``add`` either drops the
+    document (``overflow="drop"``) or waits for room (``overflow="block"``).
+    A batch that fails to write is kept and retried on the next flush.
+    Every document gets its ``_id`` before the first attempt, so when an
+    attempt that timed out here still completes in the pool, the retry only
+    hits duplicate keys instead of inserting the batch twice.
+    """
+
+    def __init__(
+        self,
+        collection: Collection,
+        *,
+        batch_size: int = 100,
+        flush_interval: float = 2.0,
+        max_pending: int = 10_000,
+        overflow: str = "drop",
+    ) -> None:
+        if overflow not in ("drop", "block"):
+            raise ValueError(f"Unknown overflow policy {overflow!r}")
+        self.collection = collection
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_pending = max(self.batch_size, max_pending)
+        self.overflow = overflow
+        self.dropped = 0
+        self._buffer: List[Dict[str, Any]] = []
+        self._in_flight = 0
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._space: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer) + self._in_flight
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background flusher and write whatever is still buffered."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.flush()
+        if self._buffer:
+            logger.warning(
+                "Discarding %d unwritten %s documents",
+                len(self._buffer),
+                self.collection.name,
+            )
+
+    async def add(self, document: Dict[str, Any]) -> bool:
+        """Queue ``document``; returns ``False`` if it was dropped."""
+        self.start()
+        while self.pending >= self.max_pending:
+            if self.overflow == "drop":
+                self.dropped += 1
+                if self.dropped == 1 or self.dropped % 1000 == 0:
+                    logger.warning(
+                        "%s writer is full; %d documents dropped so far",
+                        self.collection.name,
+                        self.dropped,
+                    )
+                return False
+            self._space.clear()
+            self._wakeup.set()
+            await self._space.wait()
+        self._buffer.append(document)
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    async def flush(self) -> None:
+        if self._flush_lock is None:
+            return
+        async with self._flush_lock:
+            while self._buffer:
+                batch = self._buffer[: self.batch_size]
+                del self._buffer[: self.batch_size]
+                for document in batch:
+                    document.setdefault("_id", ObjectId())
+                self._in_flight = len(batch)
+                try:
+                    await run(db.insert_many_unordered, self.collection, batch)
+                except (PyMongoError, asyncio.TimeoutError) as err:
+                    logger.warning(
+                        "Failed to write %d %s documents, will retry: %s",
+                        len(batch),
+                        self.collection.name,
+                        err,
+                    )
+                    self._buffer[:0] = batch
+                    return
+                finally:
+                    self._in_flight = 0
+                    self._space.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Unexpected error flushing %s", self.collection.name)
+
+
+action_log_writer = BulkWriter(
+    db.action_logs,
+    batch_size=ACTION_LOG_BATCH_SIZE,
+    flush_interval=ACTION_LOG_FLUSH_INTERVAL,
+    max_pending=ACTION_LOG_MAX_PENDING,
+    overflow=ACTION_LOG_OVERFLOW,
+)
+# Losing a few recent posts only weakens duplicate detection after a restart,
+# so this writer never makes a handler wait.
+recent_post_writer = BulkWriter(
+    db.recent_posts,
+    batch_size=500,
+    flush_interval=RECENT_POSTS_FLUSH_INTERVAL,
+    max_pending=20_000,
+    overflow="drop",
+)
+reply_timer_writer = BulkWriter(
+    db.reply_timers,
+    batch_size=500,
+    flush_interval=2.0,
+    max_pending=50_000,
+    overflow="drop",
+)
+
+
+async def get_or_create_user(
+    user_id: int, first_name: str | None = None, username: str | None = None
+) -> Dict[str, Any]:
+    return await run(db.get_or_create_user, user_id, first_name, username)
+
+
+async def add_channel(
+    user_id: int, channel_id: int, channel_username: str | None, title: str
+) -> Dict[str, Any]:
+    return await run(db.add_channel, user_id, channel_id, channel_username, title)
+
+
+async def ensure_channel_settings(channel_id: int, owner_user_id: int) -> Dict[str, Any]:
+    return await run(db.ensure_channel_settings, channel_id, owner_user_id)
+
+
+async def list_channels(user_id: int) -> List[Dict[str, Any]]:
+    return await run(db.list_channels, user_id)
+
+
+async def get_channel(channel_id: int) -> Optional[Dict[str, Any]]:
+    channel_doc = db.cached_channel(channel_id)
+    if channel_doc is not db.CACHE_MISS:
+        return channel_doc
+    return await run(db.get_channel, channel_id)
+
+
+async def remove_channel(user_id: int, channel_id: int) -> bool:
+    return await run(db.remove_channel, user_id, channel_id)
+
+
+async def get_channel_settings(channel_id: int) -> Optional[Dict[str, Any]]:
+    settings = db.cached_channel_settings(channel_id)
+    if settings is not db.CACHE_MISS:
+        return settings
+    return await run(db.get_channel_settings, channel_id)
+
+
+async def update_channel_settings(
+    channel_id: int, settings_dict: Dict[str, Any]
+) -> Dict[str, Any]:
+    return await run(db.update_channel_settings, channel_id, settings_dict)
+
+
+async def get_dup_scan(channel_id: int) -> Optional[Dict[str, Any]]:
+    return await run(db.get_dup_scan, channel_id)
+
+
+async def save_dup_scan(state: Dict[str, Any]) -> None:
+    await run(db.save_dup_scan, state)
+
+
+async def log_action(
+    channel_id: int, owner_user_id: int, action: str, meta: Dict[str, Any] | None = None
+) -> None:
+    """Queue an action log entry; it is written by ``action_log_writer``."""
+    await action_log_writer.add(
+        db.build_action_log(channel_id, owner_user_id, action, meta)
+    )
+
+
+async def find_recent_posts(
+    *, channel_id: int | None = None, owner_id: int | None = None, limit: int
+) -> List[Dict[str, Any]]:
+    return await run(
+        functools.partial(
+            db.find_recent_posts, channel_id=channel_id, owner_id=owner_id, limit=limit
+        )
+    )
+
+
+async def load_reply_timers() -> List[Dict[str, Any]]:
+    return await run(db.load_reply_timers)
+
+
+async def delete_reply_timers(keys: List[Dict[str, int]]) -> int:
+    return await run(db.delete_reply_timers, keys)
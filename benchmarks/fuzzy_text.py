@@ -0,0 +1,121 @@
+"""Time fuzzy_text lookups against a full window of long posts.
+
+Run from the repository root::
+
+    python benchmarks/fuzzy_text.py [window] [length] [threshold]
+
+Defaults to a 500-post window of 1200-character posts and the default
+threshold of 0.9.  Posts are random sentences of the Python documentation
+(English prose, as in most channels).  Each lookup compares a new post with the
+whole window, either by verifying every pair with SequenceMatcher (how
+fuzzy_text worked before the filter) or through FuzzyQuery first.  The
+second part edits window posts at random and checks that every copy at or
+above the threshold is still found.
+"""
+from __future__ import annotations
+
+import random
+import re
+import sys
+import time
+from difflib import SequenceMatcher
+from pathlib import Path
+from pydoc_data.topics import topics
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from fuzzy_text import FuzzyQuery, GramSketch, similar  # noqa: E402
+
+DEFAULT_WINDOW = 500
+DEFAULT_LENGTH = 1200
+DEFAULT_THRESHOLD = 0.9
+FULL_SCAN_LOOKUPS = 3
+LOOKUPS = 50
+EDITED_COPIES = 300
+
+
+def build_posts(count: int, length: int, rng: random.Random) -> list:
+    prose = " ".join(" ".join(text.split()) for _, text in sorted(topics.items()))
+    prose = re.sub(r"[^A-Za-z0-9 .,;:'()-]", "", prose)
+    sentences = [sentence for sentence in prose.split(". ") if len(sentence) > 20]
+    posts = []
+    for _ in range(count):
+        post = ""
+        while len(post) < length:
+            post += rng.choice(sentences) + ". "
+        posts.append(post[:length])
+    return posts
+
+
+def edit(text: str, rng: random.Random) -> str:
+    chars = list(text)
+    if rng.random() < 0.5:
+        # Scattered single-character edits.
+        for _ in range(rng.randint(1, len(chars) // 15)):
+            position = rng.randrange(len(chars))
+            if rng.random() < 0.5:
+                chars[position] = rng.choice("abcdefghijklmnopqrstuvwxyz ")
+            else:
+                del chars[position]
+    else:
+        # A few replaced passages (a changed link, an added line).
+        for _ in range(rng.randint(1, 4)):
+            position = rng.randrange(len(chars))
+            chars[position : position + rng.randint(5, 60)] = "x" * rng.randint(0, 60)
+    return "".join(chars)
+
+
+def lookup(text: str, window: list, sketches: list, threshold: float) -> bool:
+    query = FuzzyQuery(text, threshold)
+    return any(
+        similar(text, other, threshold)
+        for other, sketch in zip(window, sketches)
+        if query.may_match(other, sketch)
+    )
+
+
+def main() -> None:
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_WINDOW
+    length = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_LENGTH
+    threshold = float(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_THRESHOLD
+    rng = random.Random(7)
+    posts = build_posts(size + LOOKUPS, length, rng)
+    window, new_posts = posts[:size], posts[size:]
+    print(f"window: {len(window)} posts of {length} characters, threshold {threshold}")
+
+    started = time.perf_counter()
+    sketches = [GramSketch.of(text) for text in window]
+    print(f"sketching the window {(time.perf_counter() - started) * 1e3:8.1f} ms (once)")
+
+    started = time.perf_counter()
+    for text in new_posts[:FULL_SCAN_LOOKUPS]:
+        any(similar(text, other, threshold) for other in window)
+    elapsed = (time.perf_counter() - started) / FULL_SCAN_LOOKUPS
+    print(f"verify every pair     {elapsed * 1e3:8.1f} ms/post")
+
+    started = time.perf_counter()
+    for text in new_posts:
+        lookup(text, window, sketches, threshold)
+    elapsed = (time.perf_counter() - started) / len(new_posts)
+    print(f"FuzzyQuery first      {elapsed * 1e3:8.1f} ms/post")
+
+    found = missed = duplicate_time = 0.0
+    for _ in range(EDITED_COPIES):
+        original = rng.choice(window)
+        copy = edit(original, rng)
+        if SequenceMatcher(None, copy, original, autojunk=False).ratio() < threshold:
+            continue
+        started = time.perf_counter()
+        if lookup(copy, window, sketches, threshold):
+            found += 1
+        else:
+            missed += 1
+        duplicate_time += time.perf_counter() - started
+    print(
+        f"edited copies         {duplicate_time / max(1, found + missed) * 1e3:8.1f} ms/post, "
+        f"{int(found)} found, {int(missed)} missed"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Compare the reply tracker with the legacy per-thread deques.
+
+Run from the repository root::
+
+    python benchmarks/reply_tracker.py [threads] [replies]
+
+Defaults to 10k active threads in 200 channels receiving 500k replies.
+Thread popularity is skewed (a few hot posts get most replies), about one
+reply in ten is from an admin, and channels are split between the
+keep_latest and delete_if_count_gt_n (n=3) modes.
+"""
+from __future__ import annotations
+
+import random
+import sys
+import time
+import tracemalloc
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from reply_tracker import ReplyTracker  # noqa: E402
+
+DEFAULT_THREADS = 10_000
+DEFAULT_REPLIES = 500_000
+CHANNELS = 200
+MAX_PER_THREAD = 500
+MAX_REPLIES = 200_000
+MAX_COUNT = 3
+
+Reply = Tuple[int, int, int, bool, str]
+
+
+def build_replies(threads: int, count: int) -> List[Reply]:
+    rng = random.Random(7)
+    weights = [1 / (rank + 1) for rank in range(threads)]
+    roots = rng.choices(range(threads), weights=weights, k=count)
+    replies = []
+    for message_id, root in enumerate(roots, start=1):
+        channel_id = -1000 - root % CHANNELS
+        mode = "keep_latest" if channel_id % 2 else "delete_if_count_gt_n"
+        replies.append((channel_id, root, message_id, rng.random() < 0.1, mode))
+    return replies
+
+
+def run_legacy(replies: List[Reply]) -> Callable[[], int]:
+    """The deque-per-thread logic process_replies used before ReplyTracker."""
+    tracker: Dict[Tuple[int, int], Deque[Dict[str, Any]]] = defaultdict(deque)
+    for channel_id, root, message_id, is_admin, mode in replies:
+        key = (channel_id, root)
+        entry = {"message_id": message_id, "from_user_id": 1, "is_admin": is_admin, "date": None}
+        thread = tracker[key]
+        thread.append(entry)
+        if len(thread) > MAX_PER_THREAD:
+            thread.popleft()
+        to_delete: List[int] = []
+        if mode == "keep_latest":
+            for prev in list(thread)[:-1]:
+                if prev["is_admin"]:
+                    continue
+                to_delete.append(prev["message_id"])
+        else:
+            candidates = [p for p in thread if not p["is_admin"]]
+            while len(candidates) > MAX_COUNT:
+                to_delete.append(candidates.pop(0)["message_id"])
+        if to_delete:
+            tracker[key] = deque(
+                [p for p in thread if p["message_id"] not in to_delete], maxlen=MAX_PER_THREAD
+            )
+    return lambda: sum(len(thread) for thread in tracker.values())
+
+
+def run_current(replies: List[Reply]) -> Callable[[], int]:
+    tracker = ReplyTracker(max_replies=MAX_REPLIES, max_per_thread=MAX_PER_THREAD)
+    for channel_id, root, message_id, is_admin, mode in replies:
+        tracker.add(channel_id, root, message_id, protected=is_admin)
+        if mode == "keep_latest":
+            tracker.keep_latest(channel_id, root, message_id)
+        else:
+            tracker.keep_newest(channel_id, root, MAX_COUNT)
+    return lambda: tracker.size
+
+
+def measure(runner: Callable[[List[Reply]], Callable[[], int]], replies: List[Reply]) -> None:
+    started = time.perf_counter()
+    runner(replies)
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    size = runner(replies)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(
+        f"{runner.__name__:12} {elapsed / len(replies) * 1e6:6.2f} us/reply  "
+        f"{memory / 1024 / 1024:7.1f} MiB  {size():8d} replies tracked"
+    )
+
+
+def main() -> None:
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_THREADS
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_REPLIES
+    replies = build_replies(threads, count)
+    print(f"threads: {threads}  replies: {count}")
+    measure(run_legacy, replies)
+    measure(run_current, replies)
+
+
+if __name__ == "__main__":
+    main()
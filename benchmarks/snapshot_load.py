@@ -0,0 +1,84 @@
+"""Compare ConfigStore load times for the JSON and binary snapshot formats.
+
+Run from the repository root::
+
+    python benchmarks/snapshot_load.py [count,count,...]
+
+Defaults to 10k, 100k and 1M tasks spread over one task per 20 owners.
+"""
+from __future__ import annotations
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from config_store import ConfigStore, ForwardTask, media_mask_from_types  # noqa: E402
+
+DEFAULT_COUNTS = [10_000, 100_000, 1_000_000]
+TASKS_PER_OWNER = 20
+
+
+def build_users(count: int) -> Dict[int, Dict[str, object]]:
+    users: Dict[int, Dict[str, object]] = {}
+    mask = media_mask_from_types(["photo", "video", "text"])
+    for index in range(count):
+        owner_id = 100_000 + index // TASKS_PER_OWNER
+        payload = users.setdefault(owner_id, {"next_task_id": 1, "tasks": {}})
+        task_id = int(payload["next_task_id"])
+        payload["next_task_id"] = task_id + 1
+        payload["tasks"][task_id] = ForwardTask(
+            task_id=task_id,
+            owner_id=owner_id,
+            source_id=-1001000000000 - index % 5000,
+            source_name=f"Source channel {index % 5000}",
+            target_id=-1002000000000 - index % 3000,
+            target_name=f"Target channel {index % 3000}",
+            media_mask=mask,
+            caption="Join us!" if index % 4 == 0 else None,
+            max_media_size=4000 * 1024 * 1024,
+        )
+    return users
+
+
+def time_load(path: Path, snapshot_format: str) -> float:
+    store = ConfigStore(path, snapshot_format=snapshot_format)
+    started = time.perf_counter()
+    store.load()
+    return time.perf_counter() - started
+
+
+def run(count: int, workdir: Path) -> List[str]:
+    users = build_users(count)
+    rows: List[str] = []
+    for snapshot_format in ("json", "binary"):
+        path = workdir / f"config-{count}.{snapshot_format}"
+        store = ConfigStore(path, backups=0, snapshot_format=snapshot_format)
+        store.users = users
+        store.save()
+        elapsed = time_load(path, snapshot_format)
+        size_mb = path.stat().st_size / (1024 * 1024)
+        rows.append(
+            f"{count:>9} {snapshot_format:>7} {elapsed:>9.3f}s {size_mb:>9.1f} MB"
+        )
+    return rows
+
+
+def main() -> None:
+    counts = (
+        [int(value) for value in sys.argv[1].split(",")]
+        if len(sys.argv) > 1
+        else DEFAULT_COUNTS
+    )
+    print(f"{'tasks':>9} {'format':>7} {'load':>10} {'size':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in counts:
+            for row in run(count, Path(tmp)):
+                print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Measure the memory used per ForwardTask.
+
+Run from the repository root::
+
+    python benchmarks/task_memory.py [count]
+
+The legacy layout (a plain dataclass with a per-task ``media_types`` list) is
+measured alongside the current slotted task for comparison.
+"""
+from __future__ import annotations
+
+import sys
+import tracemalloc
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from config_store import ForwardTask, media_mask_from_types  # noqa: E402
+
+
+@dataclass
+class LegacyForwardTask:
+    task_id: int
+    owner_id: int
+    source_id: int
+    source_name: str
+    target_id: int
+    target_name: str
+    media_types: List[str] = field(default_factory=lambda: ["all"])
+    caption: Optional[str] = None
+    forward_replies: bool = True
+    min_media_size: Optional[int] = None
+    max_media_size: Optional[int] = None
+    skip_duplicates: bool = False
+    remove_links: bool = False
+
+
+def chat_name(index: int) -> str:
+    # Built at runtime so every task gets its own string object, as it does
+    # when tasks are parsed from JSON.
+    return "".join(["Channel ", str(index % 500)])
+
+
+def build_legacy(index: int) -> object:
+    return LegacyForwardTask(
+        task_id=index,
+        owner_id=index % 1000,
+        source_id=-1000000000000 - index % 5000,
+        source_name=chat_name(index),
+        target_id=-1000000000000 - index % 700,
+        target_name=chat_name(index + 1),
+        media_types=["photo", "video"],
+        max_media_size=4000 * 1024 * 1024,
+    )
+
+
+def build_current(index: int) -> object:
+    return ForwardTask(
+        task_id=index,
+        owner_id=index % 1000,
+        source_id=-1000000000000 - index % 5000,
+        source_name=chat_name(index),
+        target_id=-1000000000000 - index % 700,
+        target_name=chat_name(index + 1),
+        media_mask=media_mask_from_types(["photo", "video"]),
+        max_media_size=4000 * 1024 * 1024,
+    )
+
+
+def measure(factory: Callable[[int], object], count: int) -> float:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tasks = [factory(index) for index in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del tasks
+    return (after - before) / count
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    legacy = measure(build_legacy, count)
+    current = measure(build_current, count)
+    print(f"tasks: {count}")
+    print(f"legacy dataclass: {legacy:8.1f} bytes/task")
+    print(f"slotted task:     {current:8.1f} bytes/task")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""Run the auto-forward bot with ``python -m bot``."""
+from __future__ import annotations
+
+import asyncio
+
+from pyrogram import idle
+
+import metrics
+from config_watcher import ConfigWatcher
+
+from . import APP
+from .config import CONFIG_HOT_RELOAD, METRICS_LOG_INTERVAL, STORE, logger
+from .handlers import FORWARD_DISPATCHER
+
+
+async def main() -> None:
+    watcher = ConfigWatcher(STORE)
+    await APP.start()
+    if CONFIG_HOT_RELOAD:
+        watcher.start()
+    metrics_task = asyncio.create_task(metrics.log_periodically(METRICS_LOG_INTERVAL))
+    logger.info("Auto-forward bot started")
+    try:
+        await idle()
+    finally:
+        metrics_task.cancel()
+        await watcher.stop()
+        await FORWARD_DISPATCHER.stop()
+        await APP.stop()
+
+
+if __name__ == "__main__":
+    APP.run(main())
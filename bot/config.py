@@ -6,7 +6,9 @@ from pathlib import Path
 
 from pyrogram import Client
 
+import metrics
 from config_store import ConfigStore
+from config_store_sqlite import SQLiteConfigStore
 
 
 logging.basicConfig(level=logging.INFO)
@@ -31,5 +33,35 @@ APP = Client(
 )
 
 CONFIG_PATH = Path("data/config.json")
-STORE = ConfigStore(CONFIG_PATH)
-STORE.load()
+CONFIG_BINARY_PATH = Path("data/config.bin")
+CONFIG_DB_PATH = Path("data/config.sqlite3")
+CONFIG_BACKEND = os.environ.get("CONFIG_BACKEND", "json").strip().lower()
+CONFIG_HOT_RELOAD = os.environ.get("CONFIG_HOT_RELOAD", "1").strip() != "0"
+# Accept a snapshot edited by hand while the bot was stopped instead of
+# treating the checksum mismatch as damage and loading the newest backup.
+CONFIG_ACCEPT_EDITS = os.environ.get("CONFIG_ACCEPT_EDITS", "0").strip() == "1"
+METRICS_LOG_INTERVAL = float(os.environ.get("METRICS_LOG_INTERVAL", "600"))
+# Source chats whose messages are forwarded at the same time; messages of one
+# chat are always forwarded in order.
+DISPATCH_WORKERS = int(os.environ.get("DISPATCH_WORKERS", "16"))
+
+if CONFIG_BACKEND == "sqlite":
+    # Existing JSON configuration is imported the first time the database is created.
+    STORE: ConfigStore = SQLiteConfigStore(
+        CONFIG_DB_PATH,
+        legacy_path=CONFIG_PATH,
+        owner_cache_size=int(os.environ.get("CONFIG_OWNER_CACHE_SIZE", "256")),
+    )
+elif CONFIG_BACKEND == "binary":
+    STORE = ConfigStore(
+        CONFIG_BINARY_PATH, snapshot_format="binary", legacy_path=CONFIG_PATH
+    )
+elif CONFIG_BACKEND == "json":
+    STORE = ConfigStore(CONFIG_PATH)
+else:
+    raise RuntimeError(
+        f"Unknown CONFIG_BACKEND {CONFIG_BACKEND!r}; use 'json', 'binary' or 'sqlite'."
+    )
+STORE.load(accept_edits=CONFIG_ACCEPT_EDITS)
+metrics.register_gauge("config.routing_version", lambda: STORE.routing.version)
+metrics.register_gauge("config.routed_sources", lambda: len(STORE.routing.routes))
@@ -1,18 +1,26 @@
 from __future__ import annotations
 
+import asyncio
+import json
 from contextlib import suppress
 from dataclasses import replace
-from typing import Dict, Optional, Set
+from typing import Dict, List, Optional, Set, Tuple, Union
 
 from pyrogram import Client, filters
 from pyrogram.enums import ChatType, ParseMode
-from pyrogram.errors import RPCError
+from pyrogram.errors import FloodWait, RPCError
 from pyrogram.types import CallbackQuery, InlineKeyboardMarkup, Message
 
-from config_store import DEFAULT_MAX_MEDIA_SIZE, ForwardTask
+from config_store import (
+    DEFAULT_MAX_MEDIA_SIZE,
+    ForwardTask,
+    media_mask_from_types,
+    task_json_errors,
+)
+from keyed_dispatch import KeyedDispatcher
 
 from . import callbacks
-from .config import APP, STORE, logger
+from .config import APP, DISPATCH_WORKERS, STORE, logger
 from .state import ChatAccessInfo, PENDING_ACTIONS
 from .tasks import (
     clear_duplicate_history,
@@ -715,7 +723,7 @@ async def handle_add_prompt_cancel(client: Client, query: CallbackQuery) -> None
     await query.answer("Nothing to cancel.", show_alert=True)
 
 
-async def fetch_chat(client: Client, identifier: str) -> ChatAccessInfo:
+async def fetch_chat(client: Client, identifier: Union[int, str]) -> ChatAccessInfo:
     chat = await client.get_chat(identifier)
     title = chat.title or chat.first_name or chat.username or str(chat.id)
     is_public = bool(getattr(chat, "username", None))
@@ -774,7 +782,7 @@ def persist_filter_selection(state: Dict[str, object], selected: Set[str]) -> Fo
     else:
         media_types = sorted(selected)
 
-    updated = replace(task, media_types=media_types)
+    updated = replace(task, media_mask=media_mask_from_types(media_types))
     STORE.update_task(updated)
     state["task"] = updated
     return updated
@@ -1475,6 +1483,193 @@ async def set_size_handler(client: Client, message: Message) -> None:
     }
 
 
+APPLY_ALL_USAGE = (
+    "Usage: /applyall <filters|caption|size> <value>\n"
+    "Examples:\n"
+    "/applyall filters photo,video\n"
+    "/applyall caption Join us!  (use - to remove)\n"
+    "/applyall size 1mb-50mb  (use - to reset)"
+)
+IMPORT_TASKS_MAX_ENTRIES = 200
+IMPORT_TASKS_USAGE = (
+    "Send a JSON file with the caption /importtasks, or reply to one with it.\n"
+    'The file holds a list of tasks, e.g. [{"source_id": -100123, "target_id": '
+    '-100456, "media_types": ["photo", "video"]}]. Optional keys: '
+    "caption, forward_replies, min_media_size, max_media_size, skip_duplicates, "
+    "remove_links. Chats may also be given by username; the bot must be able to "
+    f"access every source and target. At most {IMPORT_TASKS_MAX_ENTRIES} tasks per file."
+)
+IMPORT_TASKS_MAX_BYTES = 1024 * 1024
+IMPORT_TASKS_MAX_ERRORS = 20
+# Seconds between the chat lookups of an import, so a large file does not
+# trigger a flood wait; waits longer than IMPORT_MAX_FLOOD_WAIT abort the import.
+IMPORT_LOOKUP_INTERVAL = 0.5
+IMPORT_MAX_FLOOD_WAIT = 60
+
+
+@APP.on_message(filters.private & filters.command("applyall"))
+async def apply_all_handler(client: Client, message: Message) -> None:
+    parts = (message.text or "").split(maxsplit=2)
+    if len(parts) != 3:
+        await message.reply(APPLY_ALL_USAGE)
+        return
+
+    setting, value = parts[1].lower(), parts[2].strip()
+    if setting == "filters":
+        media_types = normalise_media_types(value.split(","))
+        if not media_types:
+            await message.reply("Invalid media types. Try again.")
+            return
+        changes: Dict[str, object] = {"media_mask": media_mask_from_types(media_types)}
+    elif setting == "caption":
+        changes = {"caption": None if value == "-" else value}
+    elif setting == "size":
+        try:
+            min_size, max_size = parse_size_limits(value)
+        except ValueError as err:
+            await message.reply(str(err))
+            return
+        changes = {"min_media_size": min_size, "max_media_size": max_size}
+    else:
+        await message.reply(APPLY_ALL_USAGE)
+        return
+
+    tasks = STORE.list_tasks(message.from_user.id)
+    if not tasks:
+        await message.reply("You have not configured any forwarding tasks yet.")
+        return
+
+    with STORE.batch():
+        for task in tasks:
+            STORE.update_task(replace(task, **changes))
+    await message.reply(f"Updated {setting} on {len(tasks)} tasks.")
+
+
+@APP.on_message(filters.private & filters.command("importtasks"))
+async def import_tasks_handler(client: Client, message: Message) -> None:
+    document = message.document
+    if document is None and message.reply_to_message is not None:
+        document = message.reply_to_message.document
+    if document is None:
+        await message.reply(IMPORT_TASKS_USAGE)
+        return
+    if document.file_size and document.file_size > IMPORT_TASKS_MAX_BYTES:
+        await message.reply("The file is too large to import.")
+        return
+
+    try:
+        buffer = await client.download_media(document, in_memory=True)
+        data = json.loads(bytes(buffer.getbuffer()).decode("utf-8"))
+    except (RPCError, ValueError) as err:
+        await message.reply(f"Could not read the file: {err}")
+        return
+
+    # Accept a bare list or a ConfigStore-style {"tasks": [...]} object.
+    entries: List[Dict[str, object]] = (
+        data.get("tasks", []) if isinstance(data, dict) else data
+    )
+    if not isinstance(entries, list):
+        await message.reply(IMPORT_TASKS_USAGE)
+        return
+    if len(entries) > IMPORT_TASKS_MAX_ENTRIES:
+        await message.reply(
+            f"At most {IMPORT_TASKS_MAX_ENTRIES} tasks can be imported at once."
+        )
+        return
+
+    # Check every field first so no chat is looked up for a file that is rejected.
+    errors = [
+        f"Row {row}: {'; '.join(problems)}"
+        for row, problems in enumerate(
+            (task_json_errors(entry, check_ids=False) for entry in entries), start=1
+        )
+        if problems
+    ]
+    if errors:
+        await reply_import_errors(message, "Invalid task entries", errors)
+        return
+
+    try:
+        entries, errors = await resolve_import_chats(client, entries)
+    except FloodWait as err:
+        await message.reply(
+            f"Telegram asked to wait {err.value} seconds; nothing was imported. "
+            "Try again later."
+        )
+        return
+    if errors:
+        await reply_import_errors(message, "Could not access these chats", errors)
+        return
+
+    try:
+        added = STORE.import_tasks(message.from_user.id, entries)
+    except ValueError as err:
+        await reply_import_errors(message, "Invalid task entries", str(err).splitlines())
+        return
+    await message.reply(
+        f"Imported {len(added)} tasks: "
+        + (", ".join(f"#{task.task_id}" for task in added) or "none")
+    )
+
+
+async def reply_import_errors(message: Message, reason: str, errors: List[str]) -> None:
+    shown = errors[:IMPORT_TASKS_MAX_ERRORS]
+    if len(errors) > len(shown):
+        shown.append(f"… and {len(errors) - len(shown)} more")
+    await message.reply(f"{reason}, nothing was imported:\n" + "\n".join(shown))
+
+
+async def resolve_import_chats(
+    client: Client, entries: List[Dict[str, object]]
+) -> Tuple[List[Dict[str, object]], List[str]]:
+    """Check the bot can access every chat of ``entries``, like the add wizard does.
+
+    Returns the entries with the resolved chat IDs and names filled in, and
+    one line per row whose source or target could not be fetched.  Lookups
+    are ``IMPORT_LOOKUP_INTERVAL`` apart; a longer flood wait than
+    ``IMPORT_MAX_FLOOD_WAIT`` is raised as :class:`FloodWait`.
+    """
+    resolved: Dict[object, Union[ChatAccessInfo, RPCError]] = {}
+    checked: List[Dict[str, object]] = []
+    errors: List[str] = []
+    for row, entry in enumerate(entries, start=1):
+        entry = dict(entry)
+        for role in ("source", "target"):
+            identifier = entry.get(f"{role}_id")
+            if not isinstance(identifier, (int, str)) or isinstance(identifier, bool):
+                errors.append(f"Row {row}: missing {role}_id")
+                continue
+            if isinstance(identifier, str) and identifier.lstrip("-").isdigit():
+                identifier = int(identifier)
+            if identifier not in resolved:
+                if resolved:
+                    await asyncio.sleep(IMPORT_LOOKUP_INTERVAL)
+                resolved[identifier] = await _fetch_import_chat(client, role, identifier)
+            info = resolved[identifier]
+            if isinstance(info, RPCError):
+                errors.append(f"Row {row}: cannot access {role} {identifier} ({info.ID or info})")
+                continue
+            entry[f"{role}_id"] = info.chat_id
+            entry[f"{role}_name"] = info.display_name
+        checked.append(entry)
+    return checked, errors
+
+
+async def _fetch_import_chat(
+    client: Client, role: str, identifier: Union[int, str]
+) -> Union[ChatAccessInfo, RPCError]:
+    while True:
+        try:
+            return await fetch_chat(client, identifier)
+        except FloodWait as err:
+            if err.value > IMPORT_MAX_FLOOD_WAIT:
+                raise
+            await asyncio.sleep(err.value)
+        except RPCError as err:
+            logger.warning("Failed to fetch imported %s chat %s: %s", role, identifier, err)
+            return err
+
+
 @APP.on_message(filters.private)
 async def private_message_router(client: Client, message: Message) -> None:
     user_id = message.from_user.id
@@ -1737,7 +1932,7 @@ async def handle_filters_command_input(
         await message.reply("Invalid media types. Try again.")
         return
 
-    updated = replace(task, media_types=list(media_types))
+    updated = replace(task, media_mask=media_mask_from_types(media_types))
     STORE.update_task(updated)
     await reset_action_with_cleanup(client, message.from_user.id)
     await message.reply(
@@ -1852,11 +2047,24 @@ async def handle_size_input(
     )
 
 
+# Duplicate skipping and reply mapping depend on earlier messages of the same
+# source having been forwarded, so each source chat is forwarded in order.
+FORWARD_DISPATCHER = KeyedDispatcher(workers=DISPATCH_WORKERS, name="forward.dispatch")
+
+
 @APP.on_message(~filters.private)
 async def forward_router(client: Client, message: Message) -> None:
     if message.chat.type not in {ChatType.SUPERGROUP, ChatType.GROUP, ChatType.CHANNEL}:
         return
+    # Most updates come from chats nothing is forwarded from; keep them out
+    # of the dispatcher so they do not hold its slots.
+    if not STORE.get_tasks_for_source(message.chat.id):
+        return
+
+    await FORWARD_DISPATCHER.dispatch(message.chat.id, route_message, client, message)
+
 
+async def route_message(client: Client, message: Message) -> None:
     tasks = STORE.get_tasks_for_source(message.chat.id)
     if not tasks:
         return
@@ -12,6 +12,7 @@ from config_store import (
     DEFAULT_MAX_MEDIA_SIZE,
     DEFAULT_MAX_MEDIA_SIZE_MB,
     ForwardTask,
+    TaskRoute,
 )
 
 from .config import logger
@@ -32,11 +33,11 @@ URL_PATTERN = re.compile(
 )
 
 
-def resolve_history_key(task: ForwardTask) -> ForwardKey:
+def resolve_history_key(task: TaskRoute) -> ForwardKey:
     return (task.task_id, task.source_id, task.target_id)
 
 
-def register_forwarded_message(task: ForwardTask, original: Message, forwarded: Message) -> None:
+def register_forwarded_message(task: TaskRoute, original: Message, forwarded: Message) -> None:
     key = resolve_history_key(task)
     history = FORWARD_HISTORY[key]
     history.append((original.id, forwarded.id))
@@ -84,7 +85,7 @@ def clear_duplicate_history(task_id: int) -> None:
     DEDUPLICATION_CACHE.pop(task_id, None)
 
 
-def find_forwarded_reply(task: ForwardTask, message: Message) -> Optional[int]:
+def find_forwarded_reply(task: TaskRoute, message: Message) -> Optional[int]:
     if not task.forward_replies:
         return None
 
@@ -147,7 +148,7 @@ def get_message_media_size(message: Message) -> Optional[int]:
     return getattr(media, "file_size", None)
 
 
-def within_size_limits(message: Message, task: ForwardTask) -> bool:
+def within_size_limits(message: Message, task: TaskRoute) -> bool:
     min_size = task.min_media_size
     max_size = task.max_media_size
     if min_size is None and max_size is None:
@@ -164,20 +165,15 @@ def within_size_limits(message: Message, task: ForwardTask) -> bool:
     return True
 
 
-def matches_media_filter(message: Message, task: ForwardTask) -> bool:
-    media_types = task.media_types or []
-    if not media_types:
+def matches_media_filter(message: Message, task: TaskRoute) -> bool:
+    if not task.media_mask:
+        return False
+    if not task.accepts(message_category(message)):
         return False
-    if "all" not in media_types:
-        category = message_category(message)
-        if category == "other":
-            return False
-        if category not in media_types:
-            return False
     return within_size_limits(message, task)
 
 
-def build_caption(message: Message, task: ForwardTask) -> Optional[str]:
+def build_caption(message: Message, task: TaskRoute) -> Optional[str]:
     if not task.caption:
         return message.caption
 
@@ -190,7 +186,7 @@ def build_caption(message: Message, task: ForwardTask) -> Optional[str]:
     return task.caption
 
 
-def sanitize_text(text: Optional[str], task: ForwardTask) -> Optional[str]:
+def sanitize_text(text: Optional[str], task: TaskRoute) -> Optional[str]:
     if not text:
         return text
     if not task.remove_links:
@@ -203,7 +199,7 @@ def sanitize_text(text: Optional[str], task: ForwardTask) -> Optional[str]:
     return cleaned or None
 
 
-async def send_forward(client: Client, message: Message, task: ForwardTask) -> Optional[Message]:
+async def send_forward(client: Client, message: Message, task: TaskRoute) -> Optional[Message]:
     if not matches_media_filter(message, task):
         return None
 
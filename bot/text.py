@@ -185,6 +185,8 @@ GUIDE_TXT = """🕷️ <b>𝙰𝚞𝚝𝚘–𝙵𝚘𝚛𝚠𝚊𝚛𝚍 𝙱
 /setsize <id>   — 𝚂𝚎𝚝 𝚜𝚒𝚣𝚎  
 /setfilters <id>— 𝙴𝚍𝚒𝚝 𝚏𝚒𝚕𝚝𝚎𝚛𝚜  
 /setcaption <id>— 𝙲𝚞𝚜𝚝𝚘𝚖 𝚌𝚊𝚙𝚝𝚒𝚘𝚗  
+/applyall       — 𝙰𝚙𝚙𝚕𝚢 𝚝𝚘 𝚊𝚕𝚕 𝚝𝚊𝚜𝚔𝚜  
+/importtasks    — 𝙸𝚖𝚙𝚘𝚛𝚝 𝚝𝚊𝚜𝚔𝚜 𝚏𝚛𝚘𝚖 𝙹𝚂𝙾𝙽  
 
 🎉 <b>𝙵𝚎𝚊𝚝𝚞𝚛𝚎𝚜</b>  
 𝚂𝚝𝚊𝚢𝚜 𝚊𝚌𝚝𝚒𝚟𝚎 𝚊𝚏𝚝𝚎𝚛 𝚛𝚎𝚜𝚝𝚊𝚛𝚝 • 𝙵𝚒𝚕𝚝𝚎𝚛𝚜 • 𝙲𝚞𝚜𝚝𝚘𝚖 𝚌𝚊𝚙𝚝𝚒𝚘𝚗𝚜 • 𝚂𝚔𝚒𝚙 𝚍𝚞𝚙𝚕𝚒𝚌𝚊𝚝𝚎𝚜 • 𝚂𝚢𝚗𝚌 𝚛𝚎𝚙𝚕𝚒𝚎𝚜/𝚎𝚍𝚒𝚝𝚜
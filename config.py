@@ -10,9 +10,57 @@ API_HASH: Final[str] = os.getenv("API_HASH", "")
 MONGO_URI: Final[str] = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 MONGO_DB_NAME: Final[str] = os.getenv("MONGO_DB_NAME", "channel_management_bot")
 LOG_LEVEL: Final[str] = os.getenv("LOG_LEVEL", "INFO")
+# Worker threads that run blocking Mongo calls, and the per-call timeout in seconds.
+DB_POOL_SIZE: Final[int] = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_CALL_TIMEOUT: Final[float] = float(os.getenv("DB_CALL_TIMEOUT", "10"))
+# action_logs entries are written in batches of ACTION_LOG_BATCH_SIZE at least
+# every ACTION_LOG_FLUSH_INTERVAL seconds.  When ACTION_LOG_MAX_PENDING entries
+# are waiting, new ones are dropped ("drop") or the caller waits ("block").
+ACTION_LOG_BATCH_SIZE: Final[int] = int(os.getenv("ACTION_LOG_BATCH_SIZE", "100"))
+ACTION_LOG_FLUSH_INTERVAL: Final[float] = float(os.getenv("ACTION_LOG_FLUSH_INTERVAL", "2"))
+ACTION_LOG_MAX_PENDING: Final[int] = int(os.getenv("ACTION_LOG_MAX_PENDING", "10000"))
+ACTION_LOG_OVERFLOW: Final[str] = os.getenv("ACTION_LOG_OVERFLOW", "drop").strip().lower()
+# Processes that compute perceptual image hashes, and how many hashes are kept.
+PHASH_WORKERS: Final[int] = int(os.getenv("PHASH_WORKERS", "2"))
+PHASH_CACHE_SIZE: Final[int] = int(os.getenv("PHASH_CACHE_SIZE", "10000"))
+# How long a chat that is not managed stays cached as such, and how many are kept.
+UNMANAGED_CHAT_CACHE_TTL: Final[float] = float(os.getenv("UNMANAGED_CHAT_CACHE_TTL", "300"))
+UNMANAGED_CHAT_CACHE_SIZE: Final[int] = int(os.getenv("UNMANAGED_CHAT_CACHE_SIZE", "10000"))
+# Channels (and owners) whose recent posts are kept for duplicate detection;
+# the least recently active are dropped first.
+RECENT_CACHE_MAX_CHANNELS: Final[int] = int(os.getenv("RECENT_CACHE_MAX_CHANNELS", "5000"))
+# Recent posts are also written to a capped collection of RECENT_POSTS_SIZE_MB
+# megabytes, every RECENT_POSTS_FLUSH_INTERVAL seconds, so duplicate detection
+# survives restarts.  0 keeps them in memory only.
+RECENT_POSTS_SIZE_MB: Final[int] = int(os.getenv("RECENT_POSTS_SIZE_MB", "256"))
+RECENT_POSTS_FLUSH_INTERVAL: Final[float] = float(os.getenv("RECENT_POSTS_FLUSH_INTERVAL", "5"))
+# Telegram calls per second that background jobs (history scans, batched
+# deletions) may make between them.
+API_CALLS_PER_SECOND: Final[float] = float(os.getenv("API_CALLS_PER_SECOND", "5"))
+# Seconds that deletions in one chat are gathered for before one
+# delete_messages call removes them all (up to 100 IDs).
+DELETE_COALESCE_DELAY: Final[float] = float(os.getenv("DELETE_COALESCE_DELAY", "0.5"))
+# Seconds a channel's administrator list is trusted before it is refreshed in
+# the background, and how many channels' lists are kept.
+ADMIN_ROSTER_TTL: Final[float] = float(os.getenv("ADMIN_ROSTER_TTL", "600"))
+ADMIN_ROSTER_CACHE_SIZE: Final[int] = int(os.getenv("ADMIN_ROSTER_CACHE_SIZE", "10000"))
+# Replies remembered for reply cleanup across all channels; the threads that
+# have been quiet longest are forgotten first.
+REPLY_TRACKER_MAX_REPLIES: Final[int] = int(os.getenv("REPLY_TRACKER_MAX_REPLIES", "200000"))
+# Channels whose posts are processed at the same time; posts of one channel
+# are always handled one after another.
+DISPATCH_WORKERS: Final[int] = int(os.getenv("DISPATCH_WORKERS", "16"))
+# Seconds between metrics log lines (per-stage timings and errors); 0 disables them.
+METRICS_LOG_INTERVAL: Final[float] = float(os.getenv("METRICS_LOG_INTERVAL", "600"))
 
 if not BOT_TOKEN:
     raise RuntimeError("BOT_TOKEN is required. Set it via environment variable.")
 
 if not API_ID or not API_HASH:
     raise RuntimeError("API_ID and API_HASH are required for Pyrogram bots.")
+
+if API_CALLS_PER_SECOND <= 0:
+    raise RuntimeError("API_CALLS_PER_SECOND must be positive.")
+
+if ACTION_LOG_OVERFLOW not in ("drop", "block"):
+    raise RuntimeError("ACTION_LOG_OVERFLOW must be 'drop' or 'block'.")
@@ -1,26 +1,124 @@
 from __future__ import annotations
 
+import hashlib
 import json
-from dataclasses import dataclass, field
+import logging
+import os
+import shutil
+import struct
+import sys
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Set, Tuple
 
 
+logger = logging.getLogger(__name__)
+
 DEFAULT_MAX_MEDIA_SIZE_MB = 4000
 DEFAULT_MAX_MEDIA_SIZE = DEFAULT_MAX_MEDIA_SIZE_MB * 1024 * 1024
 
+# Number of previous snapshots kept next to the live config file
+# (``config.json.1`` is the newest backup).
+DEFAULT_SNAPSHOT_BACKUPS = 3
+# Binary snapshots start with a checksum line.  JSON snapshots stay plain
+# JSON for operators and tooling; their checksum is kept in a sidecar file
+# (``config.json.sha256``).  JSON snapshots of earlier versions had the header.
+CHECKSUM_HEADER_PREFIX = b"#sha256="
+CHECKSUM_SUFFIX = ".sha256"
+
+SNAPSHOT_FORMATS = ("json", "binary")
+BINARY_SNAPSHOT_MAGIC = b"FTSNAP"
+BINARY_SNAPSHOT_VERSION = 1
+
+# Bit assigned to every media type a task can filter on.  Names are listed
+# alphabetically so decoding a mask yields the same sorted list the UI stores.
+MEDIA_TYPE_BITS: Dict[str, int] = {
+    name: 1 << index
+    for index, name in enumerate(
+        (
+            "all",
+            "animation",
+            "audio",
+            "document",
+            "photo",
+            "sticker",
+            "text",
+            "video",
+            "voice",
+        )
+    )
+}
+MEDIA_ALL = MEDIA_TYPE_BITS["all"]
+
+
+def media_mask_from_types(media_types: Iterable[str]) -> int:
+    mask = 0
+    for name in media_types:
+        mask |= MEDIA_TYPE_BITS.get(name, 0)
+    return mask
+
+
+@lru_cache(maxsize=None)
+def media_types_from_mask(mask: int) -> Tuple[str, ...]:
+    return tuple(name for name, bit in MEDIA_TYPE_BITS.items() if mask & bit)
+
+
+def _is_int(value: object) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def task_json_errors(entry: object, *, check_ids: bool = True) -> List[str]:
+    """Describe what is wrong with a task given in the JSON task format.
+
+    Entries from outside the bot (such as /importtasks files) must be checked
+    with this before they reach :meth:`ConfigStore.import_tasks`; the loaders
+    coerce values and would store a malformed field as is.  ``check_ids``
+    can be turned off while source and target are still usernames.
+    """
+    if not isinstance(entry, dict):
+        return ["not an object"]
+    errors: List[str] = []
+    if check_ids:
+        for key in ("source_id", "target_id"):
+            if not _is_int(entry.get(key)):
+                errors.append(f"{key} must be a chat ID")
+    for key in ("source_name", "target_name"):
+        if key in entry and not isinstance(entry[key], str):
+            errors.append(f"{key} must be text")
+    media_types = entry.get("media_types", ["all"])
+    if (
+        not isinstance(media_types, list)
+        or not media_types
+        or not all(isinstance(name, str) and name in MEDIA_TYPE_BITS for name in media_types)
+    ):
+        errors.append(f"media_types must be a list of: {', '.join(MEDIA_TYPE_BITS)}")
+    if entry.get("caption") is not None and not isinstance(entry["caption"], str):
+        errors.append("caption must be text or null")
+    for key in ("forward_replies", "skip_duplicates", "remove_links"):
+        if key in entry and not isinstance(entry[key], bool):
+            errors.append(f"{key} must be true or false")
+    for key in ("min_media_size", "max_media_size"):
+        value = entry.get(key)
+        if value is not None and (not _is_int(value) or value < 0):
+            errors.append(f"{key} must be a number of bytes or null")
+    return errors
 
-@dataclass
-class ForwardTask:
-    """Represents a single forwarding rule configured by a user."""
+
+@dataclass(frozen=True, slots=True)
+class TaskRoute:
+    """The part of a forwarding rule needed to forward a message.
+
+    Routing indexes hold these so that chat names and other display-only
+    details do not have to stay in memory for every task.
+    """
 
     task_id: int
     owner_id: int
     source_id: int
-    source_name: str
     target_id: int
-    target_name: str
-    media_types: List[str] = field(default_factory=lambda: ["all"])
+    media_mask: int = MEDIA_ALL
     caption: Optional[str] = None
     forward_replies: bool = True
     min_media_size: Optional[int] = None
@@ -28,58 +126,464 @@ class ForwardTask:
     skip_duplicates: bool = False
     remove_links: bool = False
 
+    @property
+    def media_types(self) -> Tuple[str, ...]:
+        return media_types_from_mask(self.media_mask)
+
+    def accepts(self, media_type: str) -> bool:
+        return bool(self.media_mask & (MEDIA_ALL | MEDIA_TYPE_BITS.get(media_type, 0)))
+
+
+@dataclass(frozen=True, slots=True)
+class ForwardTask(TaskRoute):
+    """Represents a single forwarding rule configured by a user.
+
+    Instances are immutable and slotted (about 270 bytes each, see
+    ``benchmarks/task_memory.py``); use :func:`dataclasses.replace` to derive
+    an updated task.  Media filters are stored as a bitmask and exposed as a
+    tuple through :attr:`media_types`.
+    """
+
+    source_name: str = field(kw_only=True)
+    target_name: str = field(kw_only=True)
+
+    def __post_init__(self) -> None:
+        # The same chat names repeat across many tasks; share one string each.
+        object.__setattr__(self, "source_name", sys.intern(self.source_name))
+        object.__setattr__(self, "target_name", sys.intern(self.target_name))
+
+    def route(self) -> TaskRoute:
+        return TaskRoute(
+            task_id=self.task_id,
+            owner_id=self.owner_id,
+            source_id=self.source_id,
+            target_id=self.target_id,
+            media_mask=self.media_mask,
+            caption=self.caption,
+            forward_replies=self.forward_replies,
+            min_media_size=self.min_media_size,
+            max_media_size=self.max_media_size,
+            skip_duplicates=self.skip_duplicates,
+            remove_links=self.remove_links,
+        )
+
+
+# The routing map is split into this many shards.  Publishing a change
+# copies the shard table and the shards it touched, about
+# ROUTE_SHARDS + sources / ROUTE_SHARDS references, instead of the map.
+ROUTE_SHARDS = 256
+
+RouteBucket = Tuple[TaskRoute, ...]
+
+
+class RouteTable(Mapping[int, RouteBucket]):
+    """An immutable ``source_id -> routes`` map stored as hash shards.
+
+    Shards are plain dicts that are never modified once the table is built;
+    :meth:`edit` returns a draft that copies a shard the first time it
+    changes it, so consecutive versions share every untouched shard.
+    """
+
+    __slots__ = ("_shards", "_size")
+
+    def __init__(self, shards: Tuple[Dict[int, RouteBucket], ...], size: int) -> None:
+        self._shards = shards
+        self._size = size
+
+    def __getitem__(self, source_id: int) -> RouteBucket:
+        return self._shards[source_id % ROUTE_SHARDS][source_id]
+
+    def get(  # type: ignore[override]
+        self, source_id: int, default: Optional[RouteBucket] = None
+    ) -> Optional[RouteBucket]:
+        return self._shards[source_id % ROUTE_SHARDS].get(source_id, default)
+
+    def __contains__(self, source_id: object) -> bool:
+        return isinstance(source_id, int) and source_id in self._shards[source_id % ROUTE_SHARDS]
+
+    def __iter__(self) -> Iterator[int]:
+        for shard in self._shards:
+            yield from shard
+
+    def __len__(self) -> int:
+        return self._size
+
+    def edit(self) -> "RouteDraft":
+        return RouteDraft(self)
+
+
+class RouteDraft:
+    """Pending changes to a :class:`RouteTable`, published by :meth:`freeze`."""
+
+    __slots__ = ("_shards", "_copied", "_size")
+
+    def __init__(self, table: RouteTable) -> None:
+        self._shards: List[Dict[int, RouteBucket]] = list(table._shards)
+        self._copied: Set[int] = set()
+        self._size = table._size
+
+    def get(self, source_id: int) -> RouteBucket:
+        return self._shards[source_id % ROUTE_SHARDS].get(source_id, ())
+
+    def set(self, source_id: int, routes: RouteBucket) -> None:
+        """Replace the routes of ``source_id``; an empty tuple removes it."""
+        index = source_id % ROUTE_SHARDS
+        shard = self._shards[index]
+        if index not in self._copied:
+            shard = self._shards[index] = dict(shard)
+            self._copied.add(index)
+        if routes:
+            if source_id not in shard:
+                self._size += 1
+            shard[source_id] = routes
+        elif shard.pop(source_id, None) is not None:
+            self._size -= 1
+
+    def freeze(self) -> RouteTable:
+        return RouteTable(tuple(self._shards), self._size)
+
+
+EMPTY_ROUTES = RouteTable(tuple({} for _ in range(ROUTE_SHARDS)), 0)
+
+
+@dataclass(frozen=True, slots=True)
+class RoutingSnapshot:
+    """An immutable ``source_id -> routes`` view published by ConfigStore.
+
+    Writers never modify a published snapshot: they build a new one and swap
+    ``ConfigStore.routing`` in a single assignment, so readers can hold on to
+    a snapshot across awaits without copying or locking.
+    """
+
+    version: int
+    routes: RouteTable
+
+    def get(self, source_id: int) -> Tuple[TaskRoute, ...]:
+        return self.routes.get(source_id, ())
+
+
+EMPTY_ROUTING = RoutingSnapshot(0, EMPTY_ROUTES)
+
 
 class ConfigStore:
     """Persistent storage for per-user forwarding tasks."""
 
-    def __init__(self, path: Path) -> None:
+    # Snapshot files can be edited externally and re-applied by ConfigWatcher.
+    supports_hot_reload = True
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        backups: int = DEFAULT_SNAPSHOT_BACKUPS,
+        snapshot_format: str = "json",
+        legacy_path: Optional[Path] = None,
+    ) -> None:
+        if snapshot_format not in SNAPSHOT_FORMATS:
+            raise ValueError(f"Unknown snapshot format {snapshot_format!r}")
         self.path = path
+        self.backups = max(0, backups)
+        self.snapshot_format = snapshot_format
+        # Imported once when ``path`` holds no snapshot yet.
+        self.legacy_path = legacy_path
+        # (mtime_ns, size) of the snapshot this process last read or wrote;
+        # lets the config watcher ignore our own saves.
+        self.snapshot_stat: Optional[Tuple[int, int]] = None
+        # ``users[owner_id]["tasks"]`` maps task_id -> task in creation order.
         self.users: Dict[int, Dict[str, object]] = {}
-        self.source_index: Dict[int, List[ForwardTask]] = {}
+        self.routing: RoutingSnapshot = EMPTY_ROUTING
+        # Pending changes to the published routes.
+        self._draft_routes: Optional[RouteDraft] = None
+        self._batch_depth = 0
+
+    @property
+    def source_index(self) -> Mapping[int, Tuple[TaskRoute, ...]]:
+        return self.routing.routes
 
     # ------------------------------------------------------------------
     # Helpers for loading / saving
     # ------------------------------------------------------------------
-    def load(self) -> None:
-        if not self.path.exists():
-            self.path.parent.mkdir(parents=True, exist_ok=True)
+    def load(self, *, accept_edits: bool = False) -> None:
+        """Load the newest snapshot that verifies.
+
+        A JSON snapshot that no longer matches its checksum is treated as
+        damaged and the newest verified backup is loaded instead, unless
+        ``accept_edits`` is set: then a snapshot edited by hand while the bot
+        was stopped is accepted if it parses.
+        """
+        newest = self._read_newest_snapshot(accept_edits=accept_edits)
+        users, signed = newest if newest is not None else (None, False)
+        if users is None and self.legacy_path is not None and self.legacy_path.exists():
+            users = self._read_snapshot(self.legacy_path, accept_edits=accept_edits)
+            logger.info("Imported configuration from %s", self.legacy_path)
+
+        self.users = users or {}
+        self._rebuild_index()
+        if not signed:
+            # New, imported, recovered from a backup or accepted edit:
+            # write a signed live snapshot.
             self._save_to_disk()
-            return
+        else:
+            self.snapshot_stat = self.stat_snapshot()
 
-        with self.path.open("r", encoding="utf-8") as f:
-            raw_data = json.load(f)
+    def reload(self) -> Tuple[int, int, int]:
+        """Re-read the live snapshot, apply only what changed and re-sign it."""
+        counts = self.apply_users(self.read_live_snapshot())
+        self.save()
+        return counts
 
-        self.users = {}
-        for user_id_str, payload in raw_data.get("users", {}).items():
-            user_id = int(user_id_str)
-            next_id = int(payload.get("next_task_id", 1))
-            tasks_payload = payload.get("tasks", [])
-            tasks = [self._task_from_json(user_id, task_json) for task_json in tasks_payload]
-            self.users[user_id] = {
-                "next_task_id": next_id,
-                "tasks": tasks,
-            }
+    def read_live_snapshot(self) -> Dict[int, Dict[str, object]]:
+        """Parse the live snapshot without touching the loaded configuration.
 
-        self._rebuild_index()
+        This is how external edits are applied, so a JSON snapshot that does
+        not match its checksum is accepted as long as it parses.
+        """
+        return self._read_snapshot(self.path, accept_edits=True)
+
+    def apply_users(self, users: Dict[int, Dict[str, object]]) -> Tuple[int, int, int]:
+        """Replace the configuration with ``users``, updating the index in place.
+
+        Only added, removed and changed tasks touch ``source_index``; tasks
+        that are unchanged keep their existing objects.  The method never
+        awaits, so handlers on the event loop observe either the old or the
+        new configuration.  Returns ``(added, removed, changed)`` counts.
+        """
+        added = removed = changed = 0
+        for owner_id, payload in self.users.items():
+            new_payload = users.get(owner_id)
+            new_tasks = new_payload["tasks"] if new_payload else {}
+            for task_id, task in payload["tasks"].items():
+                if task_id not in new_tasks:
+                    self._unindex_task(owner_id, task_id, task.source_id)
+                    removed += 1
+
+        for owner_id, payload in users.items():
+            old_payload = self.users.get(owner_id)
+            old_tasks = old_payload["tasks"] if old_payload else {}
+            new_tasks = payload["tasks"]
+            for task_id, task in new_tasks.items():
+                existing = old_tasks.get(task_id)
+                if existing is None:
+                    self._index_task(task)
+                    added += 1
+                elif existing != task:
+                    self._unindex_task(owner_id, task_id, existing.source_id)
+                    self._index_task(task)
+                    changed += 1
+                else:
+                    new_tasks[task_id] = existing
+
+        self.users = users
+        self._publish_routes()
+        return added, removed, changed
+
+    def stat_snapshot(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
 
     def save(self) -> None:
-        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.snapshot_format == "binary":
+            body = _encode_binary_snapshot(self.users)
+        else:
+            body = self._encode_json()
+        self._write_snapshot(body)
+
+    def export_json(self, path: Path) -> None:
+        """Write the current configuration as plain JSON (no checksum)."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(self._encode_json())
+
+    def import_json(self, path: Path) -> None:
+        """Replace the current configuration with a JSON export and persist it."""
+        self.users = self._read_snapshot(path, accept_edits=True)
+        self._rebuild_index()
+        self.save()
+
+    def _encode_json(self) -> bytes:
         data = {
             "users": {
                 str(user_id): {
                     "next_task_id": payload["next_task_id"],
-                    "tasks": [self._task_to_json(task) for task in payload["tasks"]],
+                    "tasks": [
+                        self._task_to_json(task) for task in payload["tasks"].values()
+                    ],
                 }
                 for user_id, payload in self.users.items()
             }
         }
-
-        with self.path.open("w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        return json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
 
     def _save_to_disk(self) -> None:
         self.save()
 
+    # ------------------------------------------------------------------
+    # Snapshot files
+    # ------------------------------------------------------------------
+    def _backup_path(self, index: int) -> Path:
+        return self.path.with_name(f"{self.path.name}.{index}")
+
+    def _snapshot_paths(self) -> List[Path]:
+        return [self.path] + [
+            self._backup_path(index) for index in range(1, self.backups + 1)
+        ]
+
+    def _read_newest_snapshot(
+        self, *, accept_edits: bool = False
+    ) -> Optional[Tuple[Dict[int, Dict[str, object]], bool]]:
+        """Return the newest snapshot that passes verification.
+
+        Falls back through the rotated backups when the live file is missing,
+        truncated or fails verification.  ``accept_edits`` applies to the live
+        file only; backups must always match their checksum.  The flag is
+        true when the live file was read and matched its checksum.  ``None``
+        means no snapshot exists yet.
+        """
+        found = False
+        for candidate in self._snapshot_paths():
+            if not candidate.exists():
+                continue
+            found = True
+            try:
+                data, signed = self._read_verified_snapshot(
+                    candidate, accept_edits=accept_edits and candidate == self.path
+                )
+            except (OSError, ValueError) as err:
+                logger.warning("Skipping unreadable snapshot %s: %s", candidate, err)
+                continue
+            if candidate != self.path:
+                logger.warning("Recovered configuration from backup %s", candidate)
+                return data, False
+            return data, signed
+
+        if found:
+            raise RuntimeError(f"No valid configuration snapshot found for {self.path}")
+        return None
+
+    @classmethod
+    def _read_snapshot(
+        cls, path: Path, *, accept_edits: bool = False
+    ) -> Dict[int, Dict[str, object]]:
+        """Read and verify a snapshot file in either format."""
+        return cls._read_verified_snapshot(path, accept_edits=accept_edits)[0]
+
+    @classmethod
+    def _read_verified_snapshot(
+        cls, path: Path, *, accept_edits: bool = False
+    ) -> Tuple[Dict[int, Dict[str, object]], bool]:
+        """Read a snapshot and tell whether it matched its checksum.
+
+        Binary snapshots must match.  A JSON snapshot whose sidecar checksum
+        does not match raises ``ValueError`` unless ``accept_edits`` is set,
+        in which case it is accepted as an edit made outside the bot when it
+        parses, and re-signed on the next save.  JSON without a sidecar (a
+        plain export, or a snapshot of an earlier version) is accepted
+        unsigned.  Truncated JSON fails to parse and raises ``ValueError``.
+        """
+        raw = path.read_bytes()
+        if raw.startswith(CHECKSUM_HEADER_PREFIX):
+            header, _, body = raw.partition(b"\n")
+            expected = header[len(CHECKSUM_HEADER_PREFIX):].decode("ascii").strip()
+            signed = hashlib.sha256(body).hexdigest() == expected
+            if body.startswith(BINARY_SNAPSHOT_MAGIC):
+                if not signed:
+                    raise ValueError("checksum mismatch")
+                return _decode_binary_snapshot(body), True
+            if not signed and not accept_edits:
+                raise ValueError("checksum mismatch")
+            # Inline JSON checksums are rewritten to the sidecar format.
+            signed = False
+        else:
+            body = raw
+            if body.startswith(BINARY_SNAPSHOT_MAGIC):
+                raise ValueError("binary snapshot without checksum")
+            expected = _read_checksum(path)
+            signed = expected == hashlib.sha256(body).hexdigest()
+            if expected is not None and not signed and not accept_edits:
+                raise ValueError("checksum mismatch")
+
+        data = json.loads(body.decode("utf-8"))
+        if not isinstance(data, dict):
+            raise ValueError("snapshot root must be an object")
+        users = cls._users_from_json(data)
+        if not signed and _checksum_path(path).exists():
+            logger.warning("%s was changed outside the bot; accepting the edit", path)
+        return users, signed
+
+    @classmethod
+    def _users_from_json(cls, data: Dict[str, object]) -> Dict[int, Dict[str, object]]:
+        users: Dict[int, Dict[str, object]] = {}
+        for user_id_str, payload in data.get("users", {}).items():
+            user_id = int(user_id_str)
+            next_id = int(payload.get("next_task_id", 1))
+            tasks: Dict[int, ForwardTask] = {}
+            for task_json in payload.get("tasks", []):
+                task = cls._task_from_json(user_id, task_json)
+                tasks[task.task_id] = task
+            users[user_id] = {
+                "next_task_id": next_id,
+                "tasks": tasks,
+            }
+        return users
+
+    def _write_snapshot(self, body: bytes) -> None:
+        """Atomically replace the live snapshot with ``body``.
+
+        The data is written to a temporary file, fsynced and renamed over the
+        live file so a crash never leaves a truncated config behind.  A crash
+        between the snapshot and its sidecar checksum leaves a JSON snapshot
+        that fails verification, so the next load falls back to the previous
+        snapshot, kept as the first backup.
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256(body).hexdigest().encode("ascii")
+        binary = body.startswith(BINARY_SNAPSHOT_MAGIC)
+        tmp_path = self.path.with_name(f"{self.path.name}.tmp")
+        with tmp_path.open("wb") as f:
+            if binary:
+                f.write(CHECKSUM_HEADER_PREFIX + digest + b"\n")
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._rotate_backups()
+        os.replace(tmp_path, self.path)
+        if not binary:
+            _write_atomic(_checksum_path(self.path), digest + b"\n")
+        self._fsync_directory()
+        self.snapshot_stat = self.stat_snapshot()
+
+    def _rotate_backups(self) -> None:
+        if self.backups <= 0 or not self.path.exists():
+            return
+        for index in range(self.backups, 1, -1):
+            for older, newer in _with_checksums(
+                self._backup_path(index - 1), self._backup_path(index)
+            ):
+                if older.exists():
+                    os.replace(older, newer)
+        # Link rather than move, so the live snapshot exists at every moment
+        # until the new one is renamed over it.
+        for live, backup in _with_checksums(self.path, self._backup_path(1)):
+            backup.unlink(missing_ok=True)
+            if live.exists():
+                _link_or_copy(live, backup)
+
+    def _fsync_directory(self) -> None:
+        try:
+            fd = os.open(self.path.parent, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            # Some platforms (e.g. Windows) cannot fsync directories.
+            pass
+        finally:
+            os.close(fd)
+
     # ------------------------------------------------------------------
     # Task manipulation
     # ------------------------------------------------------------------
@@ -87,7 +591,7 @@ class ConfigStore:
         payload = self.users.get(owner_id)
         if not payload:
             return []
-        return list(payload["tasks"])
+        return list(payload["tasks"].values())
 
     def add_task(
         self,
@@ -103,80 +607,241 @@ class ConfigStore:
         min_media_size: Optional[int] = None,
         max_media_size: Optional[int] = None,
     ) -> ForwardTask:
-        payload = self.users.setdefault(owner_id, {"next_task_id": 1, "tasks": []})
+        payload = self.users.setdefault(owner_id, {"next_task_id": 1, "tasks": {}})
         task_id = payload["next_task_id"]
         payload["next_task_id"] = task_id + 1
 
-        max_media_size = (
-            DEFAULT_MAX_MEDIA_SIZE if max_media_size is None else max_media_size
-        )
-
-        task = ForwardTask(
-            task_id=task_id,
-            owner_id=owner_id,
+        task = self._new_task(
+            owner_id,
+            task_id,
             source_id=source_id,
             source_name=source_name,
             target_id=target_id,
             target_name=target_name,
-            media_types=list(media_types) or ["all"],
-            caption=caption or None,
+            media_types=media_types,
+            caption=caption,
             forward_replies=forward_replies,
             min_media_size=min_media_size,
             max_media_size=max_media_size,
-            skip_duplicates=False,
-            remove_links=False,
         )
 
-        payload["tasks"].append(task)
+        payload["tasks"][task_id] = task
         self._index_task(task)
-        self.save()
+        self._commit()
         return task
 
     def get_task(self, owner_id: int, task_id: int) -> Optional[ForwardTask]:
-        for task in self.list_tasks(owner_id):
-            if task.task_id == task_id:
-                return task
-        return None
+        payload = self.users.get(owner_id)
+        if not payload:
+            return None
+        return payload["tasks"].get(task_id)
 
     def remove_task(self, owner_id: int, task_id: int) -> bool:
         payload = self.users.get(owner_id)
         if not payload:
             return False
 
-        tasks: List[ForwardTask] = payload["tasks"]
-        for index, task in enumerate(tasks):
-            if task.task_id == task_id:
-                tasks.pop(index)
-                self._rebuild_index()
-                self.save()
-                return True
-        return False
+        task = payload["tasks"].pop(task_id, None)
+        if task is None:
+            return False
+        self._unindex_task(owner_id, task_id, task.source_id)
+        self._commit()
+        return True
 
     def update_task(self, task: ForwardTask) -> None:
         owner_payload = self.users.get(task.owner_id)
         if not owner_payload:
             return
-        for idx, existing in enumerate(owner_payload["tasks"]):
-            if existing.task_id == task.task_id:
-                owner_payload["tasks"][idx] = task
-                break
-        self._rebuild_index()
-        self.save()
+        existing = owner_payload["tasks"].get(task.task_id)
+        if existing is None:
+            return
+        owner_payload["tasks"][task.task_id] = task
+        self._unindex_task(task.owner_id, task.task_id, existing.source_id)
+        self._index_task(task)
+        self._commit()
+
+    def import_tasks(
+        self, owner_id: int, entries: Iterable[Dict[str, object]]
+    ) -> List[ForwardTask]:
+        """Add tasks given in the JSON task format to ``owner_id`` in one batch.
+
+        Task ids in ``entries`` are ignored and new ones assigned.  Every entry
+        is checked with :func:`task_json_errors` before anything is added; if
+        any is malformed, ``ValueError`` lists the bad rows (numbered from 1)
+        and nothing is imported.
+        """
+        entries = list(entries)
+        problems = [
+            f"Row {row}: {'; '.join(errors)}"
+            for row, errors in enumerate(map(task_json_errors, entries), start=1)
+            if errors
+        ]
+        if problems:
+            raise ValueError("\n".join(problems))
+        parsed = [self._task_from_json(owner_id, entry) for entry in entries]
+        added: List[ForwardTask] = []
+        with self.batch():
+            for spec in parsed:
+                task = self.add_task(
+                    owner_id,
+                    source_id=spec.source_id,
+                    source_name=spec.source_name,
+                    target_id=spec.target_id,
+                    target_name=spec.target_name,
+                    media_types=spec.media_types,
+                    caption=spec.caption,
+                    forward_replies=spec.forward_replies,
+                    min_media_size=spec.min_media_size,
+                    max_media_size=spec.max_media_size,
+                )
+                if spec.skip_duplicates or spec.remove_links:
+                    task = replace(
+                        task,
+                        skip_duplicates=spec.skip_duplicates,
+                        remove_links=spec.remove_links,
+                    )
+                    self.update_task(task)
+                added.append(task)
+        return added
+
+    @contextmanager
+    def batch(self) -> Iterator["ConfigStore"]:
+        """Group several mutations into one routing update and one write.
+
+        ``add_task``/``update_task``/``remove_task`` calls inside the block
+        only stage their changes; readers keep seeing the previous routing
+        snapshot until the block exits.  If the block raises, every staged
+        change is discarded.  Batches may be nested; only the outermost one
+        commits.  The block must not await.
+        """
+        if self._batch_depth:
+            self._batch_depth += 1
+            try:
+                yield self
+            finally:
+                self._batch_depth -= 1
+            return
+
+        savepoint = self._begin_batch()
+        self._batch_depth = 1
+        try:
+            yield self
+        except BaseException:
+            self._batch_depth = 0
+            self._rollback_batch(savepoint)
+            raise
+        self._batch_depth = 0
+        self._commit()
 
-    def get_tasks_for_source(self, source_id: int) -> List[ForwardTask]:
-        return list(self.source_index.get(source_id, []))
+    def get_tasks_for_source(self, source_id: int) -> Tuple[TaskRoute, ...]:
+        """Return the routes for ``source_id``; the tuple is shared, not copied."""
+        return self.routing.get(source_id)
 
     # ------------------------------------------------------------------
     # Internal helpers
     # ------------------------------------------------------------------
     def _rebuild_index(self) -> None:
-        self.source_index.clear()
+        buckets: Dict[int, List[TaskRoute]] = {}
         for payload in self.users.values():
-            for task in payload["tasks"]:
-                self._index_task(task)
+            for task in payload["tasks"].values():
+                buckets.setdefault(task.source_id, []).append(self._route_of(task))
+        self._replace_routes(buckets)
+
+    def _replace_routes(self, buckets: Dict[int, List[TaskRoute]]) -> None:
+        draft = EMPTY_ROUTES.edit()
+        for source_id, routes in buckets.items():
+            draft.set(source_id, tuple(routes))
+        self._draft_routes = draft
+        self._publish_routes()
+
+    def _route_of(self, task: ForwardTask) -> TaskRoute:
+        return task
+
+    def _commit(self) -> None:
+        if self._batch_depth:
+            return
+        self._publish_routes()
+        self.save()
+
+    def _begin_batch(self) -> object:
+        # Tasks are immutable, so copying the containers is enough to restore.
+        return {
+            owner_id: {
+                "next_task_id": payload["next_task_id"],
+                "tasks": dict(payload["tasks"]),
+            }
+            for owner_id, payload in self.users.items()
+        }
+
+    def _rollback_batch(self, savepoint: object) -> None:
+        self.users = savepoint  # type: ignore[assignment]
+        self._draft_routes = None
+
+    def _stage_routes(self) -> RouteDraft:
+        # Only the shards a mutation touches are copied (once per published
+        # version); buckets are tuples shared until their source changes.
+        if self._draft_routes is None:
+            self._draft_routes = self.routing.routes.edit()
+        return self._draft_routes
+
+    def _publish_routes(self) -> None:
+        draft = self._draft_routes
+        if draft is None:
+            return
+        self._draft_routes = None
+        self.routing = RoutingSnapshot(self.routing.version + 1, draft.freeze())
 
     def _index_task(self, task: ForwardTask) -> None:
-        self.source_index.setdefault(task.source_id, []).append(task)
+        draft = self._stage_routes()
+        draft.set(task.source_id, draft.get(task.source_id) + (self._route_of(task),))
+
+    def _unindex_task(self, owner_id: int, task_id: int, source_id: int) -> None:
+        draft = self._stage_routes()
+        bucket = draft.get(source_id)
+        if not bucket:
+            return
+        draft.set(
+            source_id,
+            tuple(
+                route
+                for route in bucket
+                if route.owner_id != owner_id or route.task_id != task_id
+            ),
+        )
+
+    @staticmethod
+    def _new_task(
+        owner_id: int,
+        task_id: int,
+        *,
+        source_id: int,
+        source_name: str,
+        target_id: int,
+        target_name: str,
+        media_types: Iterable[str],
+        caption: Optional[str],
+        forward_replies: bool,
+        min_media_size: Optional[int],
+        max_media_size: Optional[int],
+    ) -> ForwardTask:
+        max_media_size = (
+            DEFAULT_MAX_MEDIA_SIZE if max_media_size is None else max_media_size
+        )
+        return ForwardTask(
+            task_id=task_id,
+            owner_id=owner_id,
+            source_id=source_id,
+            source_name=source_name,
+            target_id=target_id,
+            target_name=target_name,
+            media_mask=media_mask_from_types(media_types) or MEDIA_ALL,
+            caption=caption or None,
+            forward_replies=forward_replies,
+            min_media_size=min_media_size,
+            max_media_size=max_media_size,
+            skip_duplicates=False,
+            remove_links=False,
+        )
 
     @staticmethod
     def _task_to_json(task: ForwardTask) -> Dict[str, object]:
@@ -186,7 +851,7 @@ class ConfigStore:
             "source_name": task.source_name,
             "target_id": task.target_id,
             "target_name": task.target_name,
-            "media_types": task.media_types,
+            "media_types": list(task.media_types),
             "caption": task.caption,
             "forward_replies": task.forward_replies,
             "min_media_size": task.min_media_size,
@@ -204,7 +869,7 @@ class ConfigStore:
             source_name=str(payload.get("source_name", "Unknown")),
             target_id=int(payload.get("target_id")),
             target_name=str(payload.get("target_name", "Unknown")),
-            media_types=list(payload.get("media_types", ["all"])),
+            media_mask=media_mask_from_types(payload.get("media_types", ["all"])),
             caption=payload.get("caption"),
             forward_replies=bool(payload.get("forward_replies", True)),
             min_media_size=(
@@ -221,3 +886,203 @@ class ConfigStore:
             remove_links=bool(payload.get("remove_links", False)),
         )
 
+
+def _checksum_path(path: Path) -> Path:
+    return path.with_name(f"{path.name}{CHECKSUM_SUFFIX}")
+
+
+def _read_checksum(path: Path) -> Optional[str]:
+    try:
+        return _checksum_path(path).read_text("ascii").strip()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def _with_checksums(source: Path, target: Path) -> Tuple[Tuple[Path, Path], ...]:
+    return (source, target), (_checksum_path(source), _checksum_path(target))
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    with tmp_path.open("wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _link_or_copy(source: Path, target: Path) -> None:
+    try:
+        os.link(source, target)
+    except OSError:
+        # Filesystems without hard links.
+        shutil.copy2(source, target)
+
+
+# ----------------------------------------------------------------------
+# Binary snapshot format
+# ----------------------------------------------------------------------
+# Layout (little endian, version 1):
+#   header   magic, version, owner count, task count, string count
+#   owners   owner_id[q], next_task_id[q], task_count[I] columns
+#   strings  byte lengths[I] followed by the UTF-8 blob; names and captions
+#            are stored once and referenced by index (-1 means None)
+#   tasks    one column per field, grouped by owner in owner order
+_BINARY_HEADER = struct.Struct("<6sHIII")
+_FLAG_FORWARD_REPLIES = 1
+_FLAG_SKIP_DUPLICATES = 2
+_FLAG_REMOVE_LINKS = 4
+
+
+def _pack_column(code: str, values: List[int]) -> bytes:
+    return struct.pack(f"<{len(values)}{code}", *values)
+
+
+def _encode_binary_snapshot(users: Dict[int, Dict[str, object]]) -> bytes:
+    strings: Dict[str, int] = {}
+
+    def ref(value: Optional[str]) -> int:
+        if value is None:
+            return -1
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(strings)
+        return index
+
+    owner_ids: List[int] = []
+    next_ids: List[int] = []
+    counts: List[int] = []
+    task_ids: List[int] = []
+    source_ids: List[int] = []
+    target_ids: List[int] = []
+    source_names: List[int] = []
+    target_names: List[int] = []
+    captions: List[int] = []
+    masks: List[int] = []
+    flags: List[int] = []
+    min_sizes: List[int] = []
+    max_sizes: List[int] = []
+
+    for owner_id, payload in users.items():
+        tasks = payload["tasks"]
+        owner_ids.append(owner_id)
+        next_ids.append(int(payload["next_task_id"]))
+        counts.append(len(tasks))
+        for task in tasks.values():
+            task_ids.append(task.task_id)
+            source_ids.append(task.source_id)
+            target_ids.append(task.target_id)
+            source_names.append(ref(task.source_name))
+            target_names.append(ref(task.target_name))
+            captions.append(ref(task.caption))
+            masks.append(task.media_mask)
+            flags.append(
+                (_FLAG_FORWARD_REPLIES if task.forward_replies else 0)
+                | (_FLAG_SKIP_DUPLICATES if task.skip_duplicates else 0)
+                | (_FLAG_REMOVE_LINKS if task.remove_links else 0)
+            )
+            min_sizes.append(-1 if task.min_media_size is None else task.min_media_size)
+            max_sizes.append(-1 if task.max_media_size is None else task.max_media_size)
+
+    encoded = [value.encode("utf-8") for value in strings]
+    return b"".join(
+        [
+            _BINARY_HEADER.pack(
+                BINARY_SNAPSHOT_MAGIC,
+                BINARY_SNAPSHOT_VERSION,
+                len(owner_ids),
+                len(task_ids),
+                len(encoded),
+            ),
+            _pack_column("q", owner_ids),
+            _pack_column("q", next_ids),
+            _pack_column("I", counts),
+            _pack_column("I", [len(value) for value in encoded]),
+            b"".join(encoded),
+            _pack_column("q", task_ids),
+            _pack_column("q", source_ids),
+            _pack_column("q", target_ids),
+            _pack_column("i", source_names),
+            _pack_column("i", target_names),
+            _pack_column("i", captions),
+            _pack_column("H", masks),
+            _pack_column("B", flags),
+            _pack_column("q", min_sizes),
+            _pack_column("q", max_sizes),
+        ]
+    )
+
+
+def _decode_binary_snapshot(body: bytes) -> Dict[int, Dict[str, object]]:
+    try:
+        magic, version, owner_count, task_count, string_count = (
+            _BINARY_HEADER.unpack_from(body, 0)
+        )
+    except struct.error as err:
+        raise ValueError("truncated binary snapshot") from err
+    if magic != BINARY_SNAPSHOT_MAGIC:
+        raise ValueError("not a binary snapshot")
+    if version != BINARY_SNAPSHOT_VERSION:
+        raise ValueError(f"unsupported binary snapshot version {version}")
+
+    offset = _BINARY_HEADER.size
+
+    def column(code: str, count: int) -> Tuple[int, ...]:
+        nonlocal offset
+        layout = struct.Struct(f"<{count}{code}")
+        try:
+            values = layout.unpack_from(body, offset)
+        except struct.error as err:
+            raise ValueError("truncated binary snapshot") from err
+        offset += layout.size
+        return values
+
+    owner_ids = column("q", owner_count)
+    next_ids = column("q", owner_count)
+    counts = column("I", owner_count)
+
+    strings: List[str] = []
+    for length in column("I", string_count):
+        strings.append(sys.intern(body[offset:offset + length].decode("utf-8")))
+        offset += length
+
+    task_ids = column("q", task_count)
+    source_ids = column("q", task_count)
+    target_ids = column("q", task_count)
+    source_names = column("i", task_count)
+    target_names = column("i", task_count)
+    captions = column("i", task_count)
+    masks = column("H", task_count)
+    flags = column("B", task_count)
+    min_sizes = column("q", task_count)
+    max_sizes = column("q", task_count)
+    if offset != len(body):
+        raise ValueError("unexpected trailing data in binary snapshot")
+
+    users: Dict[int, Dict[str, object]] = {}
+    position = 0
+    for owner_id, next_id, count in zip(owner_ids, next_ids, counts):
+        tasks: Dict[int, ForwardTask] = {}
+        for index in range(position, position + count):
+            flag = flags[index]
+            caption = captions[index]
+            min_size = min_sizes[index]
+            max_size = max_sizes[index]
+            tasks[task_ids[index]] = ForwardTask(
+                task_ids[index],
+                owner_id,
+                source_ids[index],
+                target_ids[index],
+                masks[index],
+                None if caption < 0 else strings[caption],
+                bool(flag & _FLAG_FORWARD_REPLIES),
+                None if min_size < 0 else min_size,
+                None if max_size < 0 else max_size,
+                bool(flag & _FLAG_SKIP_DUPLICATES),
+                bool(flag & _FLAG_REMOVE_LINKS),
+                source_name=strings[source_names[index]],
+                target_name=strings[target_names[index]],
+            )
+        position += count
+        users[owner_id] = {"next_task_id": next_id, "tasks": tasks}
+    return users
@@ -0,0 +1,329 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from config_store import (
+    ConfigStore,
+    ForwardTask,
+    TaskRoute,
+    logger,
+    media_mask_from_types,
+)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS owners (
+    owner_id INTEGER PRIMARY KEY,
+    next_task_id INTEGER NOT NULL DEFAULT 1
+);
+
+CREATE TABLE IF NOT EXISTS tasks (
+    owner_id INTEGER NOT NULL,
+    task_id INTEGER NOT NULL,
+    source_id INTEGER NOT NULL,
+    source_name TEXT NOT NULL,
+    target_id INTEGER NOT NULL,
+    target_name TEXT NOT NULL,
+    media_types TEXT NOT NULL,
+    caption TEXT,
+    forward_replies INTEGER NOT NULL,
+    min_media_size INTEGER,
+    max_media_size INTEGER,
+    skip_duplicates INTEGER NOT NULL,
+    remove_links INTEGER NOT NULL,
+    PRIMARY KEY (owner_id, task_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_tasks_owner ON tasks (owner_id);
+CREATE INDEX IF NOT EXISTS idx_tasks_source ON tasks (source_id);
+"""
+
+TASK_COLUMNS = (
+    "owner_id",
+    "task_id",
+    "source_id",
+    "source_name",
+    "target_id",
+    "target_name",
+    "media_types",
+    "caption",
+    "forward_replies",
+    "min_media_size",
+    "max_media_size",
+    "skip_duplicates",
+    "remove_links",
+)
+
+ROUTE_COLUMNS = tuple(
+    column for column in TASK_COLUMNS if column not in ("source_name", "target_name")
+)
+
+# Owners whose full task records are kept in memory at once.
+DEFAULT_OWNER_CACHE_SIZE = 256
+
+_SELECT_TASKS = f"SELECT {', '.join(TASK_COLUMNS)} FROM tasks"
+_SELECT_ROUTES = f"SELECT {', '.join(ROUTE_COLUMNS)} FROM tasks"
+_INSERT_TASK = (
+    f"INSERT OR REPLACE INTO tasks ({', '.join(TASK_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in TASK_COLUMNS)})"
+)
+_UPDATE_TASK = (
+    "UPDATE tasks SET "
+    + ", ".join(f"{column} = ?" for column in TASK_COLUMNS[2:])
+    + " WHERE owner_id = ? AND task_id = ?"
+)
+
+
+class SQLiteConfigStore(ConfigStore):
+    """ConfigStore backend persisted in an embedded SQLite database.
+
+    Every mutation touches a single row instead of rewriting the whole
+    configuration.  Only the compact routing index (``source_index`` of
+    :class:`TaskRoute`) is always resident; full task records are loaded per
+    owner on demand and the least recently used owners are evicted once more
+    than ``owner_cache_size`` are held.
+    """
+
+    supports_hot_reload = False
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        legacy_path: Optional[Path] = None,
+        owner_cache_size: int = DEFAULT_OWNER_CACHE_SIZE,
+    ) -> None:
+        super().__init__(path, backups=0, legacy_path=legacy_path)
+        self.owner_cache_size = max(1, owner_cache_size)
+        self._owner_cache: "OrderedDict[int, Dict[int, ForwardTask]]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    # ------------------------------------------------------------------
+    # Helpers for loading / saving
+    # ------------------------------------------------------------------
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def load(self, *, accept_edits: bool = False) -> None:
+        conn = self.conn
+        empty = conn.execute("SELECT 1 FROM owners LIMIT 1").fetchone() is None
+        if empty and self.legacy_path is not None and self.legacy_path.exists():
+            self._import_legacy(self.legacy_path, accept_edits=accept_edits)
+
+        self._owner_cache.clear()
+        buckets: Dict[int, List[TaskRoute]] = {}
+        for row in conn.execute(_SELECT_ROUTES):
+            route = self._route_from_row(row)
+            buckets.setdefault(route.source_id, []).append(route)
+        self._replace_routes(buckets)
+
+    def save(self) -> None:
+        # Every mutation is committed as it happens.
+        self.conn.commit()
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        if self._batch_depth:
+            # Committed or rolled back when the enclosing batch ends.
+            yield self.conn
+            return
+        with self.conn:
+            yield self.conn
+
+    def _begin_batch(self) -> object:
+        self.conn.commit()
+        return None
+
+    def _rollback_batch(self, savepoint: object) -> None:
+        self.conn.rollback()
+        # Cached owners may hold staged tasks that were never committed.
+        self._owner_cache.clear()
+        self._draft_routes = None
+
+    def _import_legacy(self, legacy_path: Path, *, accept_edits: bool = False) -> None:
+        users = self._read_snapshot(legacy_path, accept_edits=accept_edits)
+        with self.conn:
+            for owner_id, payload in users.items():
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO owners (owner_id, next_task_id) VALUES (?, ?)",
+                    (owner_id, int(payload["next_task_id"])),
+                )
+                rows = [self._task_to_row(task) for task in payload["tasks"].values()]
+                self.conn.executemany(_INSERT_TASK, rows)
+        logger.info("Imported %d owners from %s", len(users), legacy_path)
+
+    # ------------------------------------------------------------------
+    # Task manipulation
+    # ------------------------------------------------------------------
+    def list_tasks(self, owner_id: int) -> List[ForwardTask]:
+        return list(self._owner_tasks(owner_id).values())
+
+    def add_task(
+        self,
+        owner_id: int,
+        *,
+        source_id: int,
+        source_name: str,
+        target_id: int,
+        target_name: str,
+        media_types: Iterable[str],
+        caption: Optional[str] = None,
+        forward_replies: bool = True,
+        min_media_size: Optional[int] = None,
+        max_media_size: Optional[int] = None,
+    ) -> ForwardTask:
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT next_task_id FROM owners WHERE owner_id = ?", (owner_id,)
+            ).fetchone()
+            task_id = int(row[0]) if row else 1
+            conn.execute(
+                "INSERT OR REPLACE INTO owners (owner_id, next_task_id) VALUES (?, ?)",
+                (owner_id, task_id + 1),
+            )
+            task = self._new_task(
+                owner_id,
+                task_id,
+                source_id=source_id,
+                source_name=source_name,
+                target_id=target_id,
+                target_name=target_name,
+                media_types=media_types,
+                caption=caption,
+                forward_replies=forward_replies,
+                min_media_size=min_media_size,
+                max_media_size=max_media_size,
+            )
+            conn.execute(_INSERT_TASK, self._task_to_row(task))
+
+        self._owner_tasks(owner_id)[task_id] = task
+        self._index_task(task)
+        self._commit()
+        return task
+
+    def get_task(self, owner_id: int, task_id: int) -> Optional[ForwardTask]:
+        return self._owner_tasks(owner_id).get(task_id)
+
+    def remove_task(self, owner_id: int, task_id: int) -> bool:
+        existing = self.get_task(owner_id, task_id)
+        if existing is None:
+            return False
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM tasks WHERE owner_id = ? AND task_id = ?", (owner_id, task_id)
+            )
+        self._owner_tasks(owner_id).pop(task_id, None)
+        self._unindex_task(owner_id, task_id, existing.source_id)
+        self._commit()
+        return True
+
+    def update_task(self, task: ForwardTask) -> None:
+        existing = self.get_task(task.owner_id, task.task_id)
+        if existing is None:
+            return
+        row = self._task_to_row(task)
+        with self._transaction() as conn:
+            conn.execute(_UPDATE_TASK, row[2:] + row[:2])
+        self._owner_tasks(task.owner_id)[task.task_id] = task
+        self._unindex_task(task.owner_id, task.task_id, existing.source_id)
+        self._index_task(task)
+        self._commit()
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+    def _owner_tasks(self, owner_id: int) -> Dict[int, ForwardTask]:
+        tasks = self._owner_cache.get(owner_id)
+        if tasks is not None:
+            self._owner_cache.move_to_end(owner_id)
+            return tasks
+
+        rows = self.conn.execute(
+            f"{_SELECT_TASKS} WHERE owner_id = ? ORDER BY task_id", (owner_id,)
+        )
+        tasks = {}
+        for row in rows:
+            task = self._task_from_row(row)
+            tasks[task.task_id] = task
+        self._owner_cache[owner_id] = tasks
+        while len(self._owner_cache) > self.owner_cache_size:
+            self._owner_cache.popitem(last=False)
+        return tasks
+
+    def _route_of(self, task: ForwardTask) -> TaskRoute:
+        return task.route()
+
+    # ------------------------------------------------------------------
+    # Row conversion
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _task_to_row(task: ForwardTask) -> Tuple[object, ...]:
+        return (
+            task.owner_id,
+            task.task_id,
+            task.source_id,
+            task.source_name,
+            task.target_id,
+            task.target_name,
+            json.dumps(list(task.media_types)),
+            task.caption,
+            int(task.forward_replies),
+            task.min_media_size,
+            task.max_media_size,
+            int(task.skip_duplicates),
+            int(task.remove_links),
+        )
+
+    @staticmethod
+    def _route_from_row(row: Tuple[object, ...]) -> TaskRoute:
+        values: Dict[str, object] = dict(zip(ROUTE_COLUMNS, row))
+        return TaskRoute(
+            task_id=int(values["task_id"]),
+            owner_id=int(values["owner_id"]),
+            source_id=int(values["source_id"]),
+            target_id=int(values["target_id"]),
+            media_mask=media_mask_from_types(json.loads(str(values["media_types"]))),
+            caption=values["caption"],
+            forward_replies=bool(values["forward_replies"]),
+            min_media_size=values["min_media_size"],
+            max_media_size=values["max_media_size"],
+            skip_duplicates=bool(values["skip_duplicates"]),
+            remove_links=bool(values["remove_links"]),
+        )
+
+    @staticmethod
+    def _task_from_row(row: Tuple[object, ...]) -> ForwardTask:
+        values: Dict[str, object] = dict(zip(TASK_COLUMNS, row))
+        return ForwardTask(
+            task_id=int(values["task_id"]),
+            owner_id=int(values["owner_id"]),
+            source_id=int(values["source_id"]),
+            source_name=str(values["source_name"]),
+            target_id=int(values["target_id"]),
+            target_name=str(values["target_name"]),
+            media_mask=media_mask_from_types(json.loads(str(values["media_types"]))),
+            caption=values["caption"],
+            forward_replies=bool(values["forward_replies"]),
+            min_media_size=values["min_media_size"],
+            max_media_size=values["max_media_size"],
+            skip_duplicates=bool(values["skip_duplicates"]),
+            remove_links=bool(values["remove_links"]),
+        )
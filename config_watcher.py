@@ -0,0 +1,138 @@
+"""Reload ConfigStore snapshots that are edited outside the running bot."""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Optional
+
+from config_store import ConfigStore
+
+try:  # Optional: Linux-only, install ``inotify_simple`` to avoid polling.
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:  # pragma: no cover - depends on the platform
+    INotify = None
+    inotify_flags = None
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_INTERVAL = 2.0
+DEFAULT_DEBOUNCE = 0.5
+
+
+class ConfigWatcher:
+    """Watch a store's snapshot file and hot-apply external changes.
+
+    inotify is used when ``inotify_simple`` is installed, otherwise the file
+    is polled.  Parsing runs in a worker thread; only the final diff is
+    applied on the event loop so forwarding never sees a half-applied config.
+    """
+
+    def __init__(
+        self,
+        store: ConfigStore,
+        *,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        debounce: float = DEFAULT_DEBOUNCE,
+    ) -> None:
+        self.store = store
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self._task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+        self._inotify = None
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        if not self.store.supports_hot_reload:
+            logger.info("%s does not support hot reload", type(self.store).__name__)
+            return
+        self._changed = asyncio.Event()
+        if INotify is not None:
+            self._start_inotify()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._inotify is not None:
+            asyncio.get_running_loop().remove_reader(self._inotify.fileno())
+            self._inotify.close()
+            self._inotify = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # ------------------------------------------------------------------
+    # Change detection
+    # ------------------------------------------------------------------
+    def _start_inotify(self) -> None:
+        try:
+            inotify = INotify()
+            # Saves are atomic renames, so watch the directory rather than
+            # the file itself (its inode changes on every write).
+            inotify.add_watch(
+                str(self.store.path.parent),
+                inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO,
+            )
+        except OSError as err:
+            logger.warning(
+                "inotify unavailable, polling %s instead: %s", self.store.path, err
+            )
+            return
+        asyncio.get_running_loop().add_reader(inotify.fileno(), self._on_inotify)
+        self._inotify = inotify
+
+    def _on_inotify(self) -> None:
+        name = self.store.path.name
+        if any(event.name == name for event in self._inotify.read(timeout=0)):
+            self._changed.set()
+
+    async def _wait_for_change(self) -> None:
+        if self._inotify is not None:
+            await self._changed.wait()
+            self._changed.clear()
+            return
+        while self.store.stat_snapshot() == self.store.snapshot_stat:
+            await asyncio.sleep(self.poll_interval)
+
+    async def _run(self) -> None:
+        while True:
+            await self._wait_for_change()
+            # Let bursts of writes settle before parsing.
+            await asyncio.sleep(self.debounce)
+            try:
+                await self._reload_once()
+            except Exception:
+                logger.exception("Failed to reload %s", self.store.path)
+
+    async def _reload_once(self) -> None:
+        stat = self.store.stat_snapshot()
+        known = self.store.snapshot_stat
+        if stat is None or stat == known:
+            return
+        try:
+            users = await asyncio.to_thread(self.store.read_live_snapshot)
+        except (OSError, ValueError) as err:
+            # Keep serving the current config; try again on the next change.
+            self.store.snapshot_stat = stat
+            logger.warning("Ignoring invalid edit to %s: %s", self.store.path, err)
+            return
+        if self.store.snapshot_stat != known:
+            # The bot saved while we were parsing; its write replaced the edit.
+            return
+
+        added, removed, changed = self.store.apply_users(users)
+        self.store.snapshot_stat = stat
+        # Sign the edited snapshot (keeping the previous one as a backup).
+        self.store.save()
+        logger.info(
+            "Reloaded %s: %d added, %d removed, %d changed",
+            self.store.path,
+            added,
+            removed,
+            changed,
+        )
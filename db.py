@@ -1,13 +1,30 @@
 """MongoDB helper utilities for the channel management bot."""
 from __future__ import annotations
 
+import logging
+import threading
+import time
+from collections import OrderedDict
 from copy import deepcopy
 from datetime import datetime
 from typing import Any, Dict, List, Optional
 
 from pymongo import MongoClient, ReturnDocument
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
 
-from config import MONGO_DB_NAME, MONGO_URI
+from config import (
+    MONGO_DB_NAME,
+    MONGO_URI,
+    RECENT_POSTS_SIZE_MB,
+    UNMANAGED_CHAT_CACHE_SIZE,
+    UNMANAGED_CHAT_CACHE_TTL,
+)
+
+logger = logging.getLogger(__name__)
+
+# Server error code of an insert whose ``_id`` already exists.
+DUPLICATE_KEY = 11000
 
 client = MongoClient(MONGO_URI)
 db = client[MONGO_DB_NAME]
@@ -16,6 +33,12 @@ users = db["users"]
 channels = db["channels"]
 channel_settings = db["channel_settings"]
 action_logs = db["action_logs"]
+# Capped log of the posts duplicate detection remembers; see find_recent_posts().
+recent_posts = db["recent_posts"]
+# One /dupscan checkpoint per channel.
+dup_scans = db["dup_scans"]
+# Pending reply expiries, keyed by {"c": channel_id, "m": message_id}.
+reply_timers = db["reply_timers"]
 
 DEFAULT_CHANNEL_SETTINGS: Dict[str, Any] = {
     "duplicates": {
@@ -25,6 +48,8 @@ DEFAULT_CHANNEL_SETTINGS: Dict[str, Any] = {
         "window_type": "messages",
         "window_value": 20,
         "strategy": "delete_new",
+        "fuzzy_threshold": 0.9,
+        "phash_max_distance": 6,
     },
     "replies": {
         "enabled": False,
@@ -49,11 +74,102 @@ DEFAULT_CHANNEL_SETTINGS: Dict[str, Any] = {
 }
 
 
+# ----------------------------------------------------------------------
+# Channel cache
+# ----------------------------------------------------------------------
+# Every channel post looks up the channel and its settings, so both are served
+# from memory.  Active channels are preloaded by warm_channel_cache(); writes
+# below refresh or drop the affected entries.  Chats that are not managed are
+# remembered for UNMANAGED_CHAT_CACHE_TTL seconds so they cost no I/O either.
+# Cached documents are shared between callers and must not be mutated.
+_cache_lock = threading.Lock()
+_channel_cache: Dict[int, Dict[str, Any]] = {}
+# A ``None`` value records that the managed channel has no settings document.
+_settings_cache: Dict[int, Optional[Dict[str, Any]]] = {}
+# channel_id -> monotonic expiry, oldest first.
+_unmanaged_cache: "OrderedDict[int, float]" = OrderedDict()
+
+
+def warm_channel_cache() -> int:
+    """Preload every active channel and its settings; returns the channel count."""
+    channel_docs = {doc["channel_id"]: doc for doc in channels.find({"active": True})}
+    settings_docs = {
+        doc["channel_id"]: doc
+        for doc in channel_settings.find({"channel_id": {"$in": list(channel_docs)}})
+    }
+    with _cache_lock:
+        _channel_cache.clear()
+        _settings_cache.clear()
+        _unmanaged_cache.clear()
+        _channel_cache.update(channel_docs)
+        for channel_id in channel_docs:
+            _settings_cache[channel_id] = settings_docs.get(channel_id)
+    logger.info("Cached %d active channels", len(channel_docs))
+    return len(channel_docs)
+
+
+# Returned by the cached_* lookups when the cache cannot answer.
+CACHE_MISS: Any = object()
+
+
+def cached_channel(channel_id: int) -> Optional[Dict[str, Any]]:
+    """Answer get_channel() from memory only, or return CACHE_MISS."""
+    channel_doc = _channel_cache.get(channel_id)
+    if channel_doc is not None:
+        return channel_doc
+    if _is_cached_unmanaged(channel_id):
+        return None
+    return CACHE_MISS
+
+
+def cached_channel_settings(channel_id: int) -> Optional[Dict[str, Any]]:
+    """Answer get_channel_settings() from memory only, or return CACHE_MISS."""
+    with _cache_lock:
+        return _settings_cache.get(channel_id, CACHE_MISS)
+
+
+def invalidate_channel(channel_id: int) -> None:
+    """Drop every cached entry for ``channel_id``."""
+    with _cache_lock:
+        _channel_cache.pop(channel_id, None)
+        _settings_cache.pop(channel_id, None)
+        _unmanaged_cache.pop(channel_id, None)
+
+
+def _cache_unmanaged(channel_id: int) -> None:
+    with _cache_lock:
+        _channel_cache.pop(channel_id, None)
+        _settings_cache.pop(channel_id, None)
+        _unmanaged_cache[channel_id] = time.monotonic() + UNMANAGED_CHAT_CACHE_TTL
+        _unmanaged_cache.move_to_end(channel_id)
+        while len(_unmanaged_cache) > UNMANAGED_CHAT_CACHE_SIZE:
+            _unmanaged_cache.popitem(last=False)
+
+
+def _is_cached_unmanaged(channel_id: int) -> bool:
+    with _cache_lock:
+        expires = _unmanaged_cache.get(channel_id)
+        if expires is None:
+            return False
+        if expires < time.monotonic():
+            del _unmanaged_cache[channel_id]
+            return False
+        return True
+
+
 def ensure_indexes() -> None:
     """Create the indexes required for the collections."""
     channels.create_index("owner_user_id")
     channel_settings.create_index("channel_id", unique=True)
     action_logs.create_index("created_at")
+    dup_scans.create_index("channel_id", unique=True)
+    if RECENT_POSTS_SIZE_MB > 0:
+        if "recent_posts" not in db.list_collection_names():
+            db.create_collection(
+                "recent_posts", capped=True, size=RECENT_POSTS_SIZE_MB * 1024 * 1024
+            )
+        recent_posts.create_index([("c", 1), ("_id", -1)])
+        recent_posts.create_index([("o", 1), ("_id", -1)])
 
 
 def get_or_create_user(user_id: int, first_name: str | None = None, username: str | None = None) -> Dict[str, Any]:
@@ -96,7 +212,11 @@ def add_channel(user_id: int, channel_id: int, channel_username: str | None, tit
         upsert=True,
         return_document=ReturnDocument.AFTER,
     )
-    ensure_channel_settings(channel_id, user_id)
+    invalidate_channel(channel_id)
+    settings = ensure_channel_settings(channel_id, user_id)
+    with _cache_lock:
+        _channel_cache[channel_id] = channel_doc
+        _settings_cache[channel_id] = settings
     return channel_doc
 
 
@@ -104,6 +224,9 @@ def ensure_channel_settings(channel_id: int, owner_user_id: int) -> Dict[str, An
     """Ensure the channel has a settings document."""
     settings = channel_settings.find_one({"channel_id": channel_id})
     if settings:
+        with _cache_lock:
+            if channel_id in _channel_cache:
+                _settings_cache[channel_id] = settings
         return settings
     new_settings = deepcopy(DEFAULT_CHANNEL_SETTINGS)
     new_settings.update(
@@ -115,6 +238,9 @@ def ensure_channel_settings(channel_id: int, owner_user_id: int) -> Dict[str, An
         }
     )
     channel_settings.insert_one(new_settings)
+    with _cache_lock:
+        if channel_id in _channel_cache:
+            _settings_cache[channel_id] = new_settings
     return new_settings
 
 
@@ -125,7 +251,16 @@ def list_channels(user_id: int) -> List[Dict[str, Any]]:
 
 def get_channel(channel_id: int) -> Optional[Dict[str, Any]]:
     """Return the channel document if managed."""
-    return channels.find_one({"channel_id": channel_id, "active": True})
+    channel_doc = cached_channel(channel_id)
+    if channel_doc is not CACHE_MISS:
+        return channel_doc
+    channel_doc = channels.find_one({"channel_id": channel_id, "active": True})
+    if channel_doc is None:
+        _cache_unmanaged(channel_id)
+        return None
+    with _cache_lock:
+        _channel_cache[channel_id] = channel_doc
+    return channel_doc
 
 
 def remove_channel(user_id: int, channel_id: int) -> bool:
@@ -136,33 +271,110 @@ def remove_channel(user_id: int, channel_id: int) -> bool:
     )
     if result.modified_count:
         channel_settings.delete_one({"channel_id": channel_id})
+        _cache_unmanaged(channel_id)
         return True
     return False
 
 
 def get_channel_settings(channel_id: int) -> Optional[Dict[str, Any]]:
     """Fetch the channel settings."""
-    return channel_settings.find_one({"channel_id": channel_id})
+    settings = cached_channel_settings(channel_id)
+    if settings is not CACHE_MISS:
+        return settings
+    settings = channel_settings.find_one({"channel_id": channel_id})
+    with _cache_lock:
+        # Only managed channels are cached; others are looked up on demand.
+        if channel_id in _channel_cache:
+            _settings_cache[channel_id] = settings
+    return settings
 
 
 def update_channel_settings(channel_id: int, settings_dict: Dict[str, Any]) -> Dict[str, Any]:
     """Update the settings for a channel."""
     settings_dict["updated_at"] = datetime.utcnow()
-    return channel_settings.find_one_and_update(
+    settings = channel_settings.find_one_and_update(
         {"channel_id": channel_id},
         {"$set": settings_dict},
         return_document=ReturnDocument.AFTER,
     )
+    with _cache_lock:
+        if channel_id in _channel_cache:
+            _settings_cache[channel_id] = settings
+        else:
+            _settings_cache.pop(channel_id, None)
+    return settings
+
+
+def get_dup_scan(channel_id: int) -> Optional[Dict[str, Any]]:
+    """Return the channel's /dupscan checkpoint, if a scan was ever started."""
+    return dup_scans.find_one({"channel_id": channel_id}, {"_id": 0})
+
+
+def save_dup_scan(state: Dict[str, Any]) -> None:
+    """Replace the checkpoint of ``state["channel_id"]`` with ``state``."""
+    document = dict(state, updated_at=datetime.utcnow())
+    dup_scans.replace_one({"channel_id": state["channel_id"]}, document, upsert=True)
+
+
+def build_action_log(channel_id: int, owner_user_id: int, action: str, meta: Dict[str, Any] | None = None) -> Dict[str, Any]:
+    """Return the action_logs document for an event."""
+    return {
+        "channel_id": channel_id,
+        "owner_user_id": owner_user_id,
+        "action": action,
+        "meta": meta or {},
+        "created_at": datetime.utcnow(),
+    }
 
 
 def log_action(channel_id: int, owner_user_id: int, action: str, meta: Dict[str, Any] | None = None) -> None:
     """Persist an action log entry."""
-    action_logs.insert_one(
-        {
-            "channel_id": channel_id,
-            "owner_user_id": owner_user_id,
-            "action": action,
-            "meta": meta or {},
-            "created_at": datetime.utcnow(),
-        }
-    )
+    action_logs.insert_one(build_action_log(channel_id, owner_user_id, action, meta))
+
+
+def insert_many_unordered(collection: Collection, documents: List[Dict[str, Any]]) -> int:
+    """Insert ``documents`` in one round trip; returns how many are stored.
+
+    Rejected documents are logged and skipped rather than aborting the rest
+    of the batch.  A duplicate ``_id`` means the document was written by an
+    earlier attempt (see ``async_db.BulkWriter``) and counts as stored.
+    """
+    try:
+        return len(collection.insert_many(documents, ordered=False).inserted_ids)
+    except BulkWriteError as err:
+        details = err.details or {}
+        errors = details.get("writeErrors", [])
+        duplicates = sum(1 for error in errors if error.get("code") == DUPLICATE_KEY)
+        if len(errors) > duplicates:
+            logger.warning(
+                "%d of %d %s documents rejected",
+                len(errors) - duplicates,
+                len(documents),
+                collection.name,
+            )
+        return int(details.get("nInserted", 0)) + duplicates
+
+
+def find_recent_posts(
+    *, channel_id: int | None = None, owner_id: int | None = None, limit: int
+) -> List[Dict[str, Any]]:
+    """Return the newest ``recent_posts`` documents of a channel or an owner.
+
+    Documents are newest first and include removal markers (``"r": 1``),
+    which are written after the post they remove.
+    """
+    query = {"c": channel_id} if channel_id is not None else {"o": owner_id}
+    cursor = recent_posts.find(query, {"_id": 0}).sort("_id", -1).limit(limit)
+    return list(cursor)
+
+
+def load_reply_timers() -> List[Dict[str, Any]]:
+    """Return every pending reply timer."""
+    return list(reply_timers.find({}))
+
+
+def delete_reply_timers(keys: List[Dict[str, int]]) -> int:
+    """Remove the timers whose ``_id`` is in ``keys``; returns how many were removed."""
+    if not keys:
+        return 0
+    return reply_timers.delete_many({"_id": {"$in": keys}}).deleted_count
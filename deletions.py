@@ -0,0 +1,223 @@
+"""Coalesce message deletions per chat into batched ``delete_messages`` calls."""
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+from pyrogram import Client
+from pyrogram.errors import FloodWait, RPCError
+
+from async_db import log_action
+from config import DELETE_COALESCE_DELAY
+from rate_limit import RateLimiter, api_limiter
+
+logger = logging.getLogger(__name__)
+
+# Telegram accepts at most 100 message IDs per deleteMessages call.
+MAX_BATCH_SIZE = 100
+
+
+@dataclass(slots=True)
+class _Request:
+    message_ids: List[int]
+    owner_id: int
+    action: str
+    meta: Dict[str, Any]
+    log_chat_id: int
+    future: "asyncio.Future[List[int]]"
+
+
+@dataclass(slots=True)
+class _ChatQueue:
+    client: Client
+    requests: List[_Request] = field(default_factory=list)
+    size: int = 0
+    full: asyncio.Event = field(default_factory=asyncio.Event)
+    task: Optional["asyncio.Task[None]"] = None
+
+
+class DeletionCoalescer:
+    """Gather deletions per chat for ``delay`` seconds or ``batch_size`` IDs.
+
+    Each :meth:`submit` is logged once its IDs are processed, with the IDs
+    that were ``deleted`` and those that ``failed`` added to its meta, and
+    the reason for each failure under ``errors``.  A batch Telegram rejects
+    is split in halves and retried until every ID has an outcome.  When
+    Telegram deletes only some messages of a batch, ``get_messages`` tells
+    which are still there; if that lookup fails too, the IDs are listed as
+    ``unconfirmed`` with how many of the batch were deleted, and count as
+    neither deleted nor failed.  Every call waits for the shared limiter.
+    """
+
+    def __init__(
+        self,
+        *,
+        delay: float = 0.5,
+        batch_size: int = MAX_BATCH_SIZE,
+        limiter: RateLimiter = api_limiter,
+    ) -> None:
+        self.delay = delay
+        self.batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+        self.limiter = limiter
+        self._queues: Dict[int, _ChatQueue] = {}
+
+    def submit(
+        self,
+        client: Client,
+        chat_id: int,
+        message_ids: Iterable[int],
+        *,
+        owner_id: int,
+        action: str,
+        meta: Optional[Dict[str, Any]] = None,
+        log_chat_id: Optional[int] = None,
+    ) -> "asyncio.Future[List[int]]":
+        """Queue ``message_ids`` of ``chat_id`` for deletion.
+
+        The returned future resolves to the IDs that were deleted; callers
+        do not need to await it.
+        """
+        request = _Request(
+            message_ids=list(message_ids),
+            owner_id=owner_id,
+            action=action,
+            meta=dict(meta or {}),
+            log_chat_id=chat_id if log_chat_id is None else log_chat_id,
+            future=asyncio.get_running_loop().create_future(),
+        )
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = _ChatQueue(client)
+        queue.requests.append(request)
+        queue.size += len(request.message_ids)
+        if queue.size >= self.batch_size:
+            queue.full.set()
+        if queue.task is None:
+            queue.task = asyncio.ensure_future(self._drain(chat_id, queue))
+        return request.future
+
+    async def stop(self) -> None:
+        """Delete everything still queued without waiting for the delay."""
+        for queue in list(self._queues.values()):
+            queue.full.set()
+        tasks = [queue.task for queue in self._queues.values() if queue.task]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _drain(self, chat_id: int, queue: _ChatQueue) -> None:
+        try:
+            while queue.requests:
+                try:
+                    await asyncio.wait_for(queue.full.wait(), self.delay)
+                except asyncio.TimeoutError:
+                    pass
+                requests, queue.requests, queue.size = queue.requests, [], 0
+                queue.full.clear()
+                try:
+                    await self._process(queue.client, chat_id, requests)
+                except asyncio.CancelledError:
+                    for request in requests:
+                        request.future.cancel()
+                    raise
+                except Exception:
+                    # Keep draining; requests queued meanwhile must not stall.
+                    logger.exception("Could not process deletions in %s", chat_id)
+                    for request in requests:
+                        if not request.future.done():
+                            request.future.set_result([])
+        finally:
+            queue.task = None
+            if not queue.requests:
+                self._queues.pop(chat_id, None)
+
+    async def _process(self, client: Client, chat_id: int, requests: List[_Request]) -> None:
+        ids = list(dict.fromkeys(i for request in requests for i in request.message_ids))
+        failed: Dict[int, str] = {}
+        unconfirmed: Dict[int, str] = {}
+        for start in range(0, len(ids), self.batch_size):
+            batch = ids[start : start + self.batch_size]
+            try:
+                await self._delete(client, chat_id, batch, failed, unconfirmed)
+            except Exception as err:
+                # Network errors and timeouts fail this batch, not the queue.
+                logger.warning("Could not delete %d messages in %s: %r", len(batch), chat_id, err)
+                failed.update(dict.fromkeys(batch, repr(err)))
+        for request in requests:
+            deleted = [i for i in request.message_ids if i not in failed and i not in unconfirmed]
+            meta = dict(request.meta, deleted=deleted)
+            if any(i in failed for i in request.message_ids):
+                meta["failed"] = [i for i in request.message_ids if i in failed]
+                meta["errors"] = {str(i): failed[i] for i in meta["failed"]}
+            if any(i in unconfirmed for i in request.message_ids):
+                meta["unconfirmed"] = [i for i in request.message_ids if i in unconfirmed]
+                meta["batches"] = sorted({unconfirmed[i] for i in meta["unconfirmed"]})
+            if not request.future.done():
+                request.future.set_result(deleted)
+            try:
+                await log_action(request.log_chat_id, request.owner_id, request.action, meta)
+            except Exception:
+                logger.exception("Could not log %s in %s", request.action, chat_id)
+
+    async def _delete(
+        self,
+        client: Client,
+        chat_id: int,
+        ids: List[int],
+        failed: Dict[int, str],
+        unconfirmed: Dict[int, str],
+    ) -> None:
+        """Delete ``ids``, adding those not deleted to ``failed`` with the reason.
+
+        IDs whose outcome could not be told apart go to ``unconfirmed``.
+        """
+        while True:
+            await self.limiter.acquire()
+            try:
+                deleted = await client.delete_messages(chat_id, ids)
+            except FloodWait as err:
+                await asyncio.sleep(err.value)
+                continue
+            except RPCError as err:
+                if len(ids) == 1:
+                    logger.warning("Could not delete message %s in %s: %s", ids[0], chat_id, err)
+                    failed[ids[0]] = str(err)
+                    return
+                break
+            # Telegram reports how many of the messages it deleted; the others
+            # no longer existed (or were already deleted).
+            if deleted >= len(ids):
+                return
+            if deleted == 0:
+                failed.update(dict.fromkeys(ids, "message not found"))
+                return
+            # The count does not say which IDs were deleted, and deleting the
+            # rest again would only report them as not found.
+            remaining = await self._existing(client, chat_id, ids)
+            if remaining is None:
+                logger.warning("Deleted %d of %d messages in %s", deleted, len(ids), chat_id)
+                unconfirmed.update(dict.fromkeys(ids, f"deleted {deleted} of {len(ids)}"))
+            else:
+                failed.update(dict.fromkeys(remaining, "not deleted"))
+            return
+        # Bisect so a single bad ID costs a few extra calls, not one per ID.
+        middle = len(ids) // 2
+        await self._delete(client, chat_id, ids[:middle], failed, unconfirmed)
+        await self._delete(client, chat_id, ids[middle:], failed, unconfirmed)
+
+    async def _existing(self, client: Client, chat_id: int, ids: List[int]) -> Optional[List[int]]:
+        """IDs of ``ids`` that still exist, or None if Telegram cannot tell."""
+        while True:
+            await self.limiter.acquire()
+            try:
+                messages = await client.get_messages(chat_id, ids)
+            except FloodWait as err:
+                await asyncio.sleep(err.value)
+                continue
+            except RPCError as err:
+                logger.warning("Could not look up %d messages in %s: %s", len(ids), chat_id, err)
+                return None
+            return [message.id for message in messages if not message.empty]
+
+deletion_coalescer = DeletionCoalescer(delay=DELETE_COALESCE_DELAY)
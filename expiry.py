@@ -0,0 +1,144 @@
+"""Persisted timers that expire channel replies at their deadline.
+
+Timers live in a heap ordered by due time; one task sleeps until the
+earliest is due, pops every timer that is, and hands them to the callback
+grouped per channel so each channel costs one batched deletion.  Timers are
+also written to ``reply_timers`` (in batches) and reloaded on start, so
+replies still expire after a restart.
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+import time
+from dataclasses import dataclass
+from itertools import count
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo.errors import PyMongoError
+from pyrogram import Client
+
+from async_db import delete_reply_timers, load_reply_timers, reply_timer_writer
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True, frozen=True)
+class Timer:
+    channel_id: int
+    message_id: int
+    owner_id: int
+    root_id: int
+    # Unix time at which the reply expires.
+    due: float
+
+    def to_document(self) -> Dict[str, object]:
+        return {
+            "_id": {"c": self.channel_id, "m": self.message_id},
+            "o": self.owner_id,
+            "r": self.root_id,
+            "due": self.due,
+        }
+
+    @classmethod
+    def from_document(cls, document: Dict[str, object]) -> "Timer":
+        key = document["_id"]
+        return cls(
+            channel_id=key["c"],
+            message_id=key["m"],
+            owner_id=document["o"],
+            root_id=document["r"],
+            due=document["due"],
+        )
+
+
+ExpireCallback = Callable[[Client, int, List[Timer]], Awaitable[None]]
+
+
+class ExpiryScheduler:
+    """Call ``on_expire(client, channel_id, timers)`` once timers are due."""
+
+    def __init__(self, on_expire: ExpireCallback) -> None:
+        self.on_expire = on_expire
+        self._heap: List[Tuple[float, int, Timer]] = []
+        self._order = count()
+        self._client: Optional[Client] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    async def start(self, client: Client) -> None:
+        """Reload persisted timers and start firing them."""
+        if self._task is not None:
+            return
+        self._client = client
+        self._wakeup = asyncio.Event()
+        try:
+            documents = await load_reply_timers()
+        except (PyMongoError, asyncio.TimeoutError) as err:
+            logger.warning("Could not reload reply timers: %s", err)
+            documents = []
+        for document in documents:
+            self._push(Timer.from_document(document))
+        if documents:
+            logger.info("Reloaded %d reply timers", len(documents))
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await reply_timer_writer.stop()
+
+    async def schedule(self, timer: Timer) -> None:
+        earliest = self._heap[0][0] if self._heap else None
+        self._push(timer)
+        if self._wakeup is not None and (earliest is None or timer.due < earliest):
+            self._wakeup.set()
+        await reply_timer_writer.add(timer.to_document())
+
+    def _push(self, timer: Timer) -> None:
+        heapq.heappush(self._heap, (timer.due, next(self._order), timer))
+
+    def _pop_due(self, now: float) -> Dict[int, List[Timer]]:
+        due: Dict[int, List[Timer]] = {}
+        while self._heap and self._heap[0][0] <= now:
+            timer = heapq.heappop(self._heap)[2]
+            due.setdefault(timer.channel_id, []).append(timer)
+        return due
+
+    async def _run(self) -> None:
+        while True:
+            delay = self._heap[0][0] - time.time() if self._heap else None
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+            due = self._pop_due(time.time())
+            for channel_id, timers in due.items():
+                try:
+                    await self.on_expire(self._client, channel_id, timers)
+                except Exception:
+                    logger.exception("Failed to expire replies in %s", channel_id)
+            await self._forget([timer for timers in due.values() for timer in timers])
+
+    async def _forget(self, timers: List[Timer]) -> None:
+        try:
+            # Timers still buffered must be written before they can be removed.
+            await reply_timer_writer.flush()
+            await delete_reply_timers(
+                [timer.to_document()["_id"] for timer in timers]
+            )
+        except (PyMongoError, asyncio.TimeoutError) as err:
+            # They fire again after a restart; deleting twice is harmless.
+            logger.warning("Could not remove %d reply timers: %s", len(timers), err)
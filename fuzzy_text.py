@@ -0,0 +1,143 @@
+"""Near-duplicate text matching for the ``fuzzy_text`` duplicate criterion.
+
+Two texts match when ``SequenceMatcher(autojunk=False).ratio()`` reaches the
+channel's threshold.  That takes tens of milliseconds for posts of a thousand
+characters, so :class:`FuzzyQuery` first applies bounds that no pair reaching
+the threshold can fail:
+
+* length: the ratio is at most ``2 * min(len) / total length``;
+* 3-gram count: at ratio ``t`` the matched characters form at most ``u + 1``
+  blocks (``u`` being the unmatched characters), and a block of length ``l``
+  holds ``l - 2`` shared 3-grams.  That bounds from below how many 3-grams,
+  counted with repeats, the texts share; unrelated posts share too few.
+  Each text keeps a :class:`GramSketch`, a bitmap of its 3-grams, and the
+  shared bits of two sketches plus the 3-grams lost to bit collisions bound
+  the shared 3-grams from above;
+* LCS: the matched characters form a common subsequence, so
+  ``2 * LCS / total length`` bounds the ratio from above.  The bit-parallel
+  LCS takes about half a millisecond for two 1k-character texts.
+
+MinHash cannot replace the 3-gram bound: at a ratio of 0.9 two texts may
+share under 30% of their distinct 3-grams, about as many as unrelated posts
+in the same language.  ``python benchmarks/fuzzy_text.py`` measures the
+filter against verifying every pair.
+"""
+from __future__ import annotations
+
+from difflib import SequenceMatcher
+from typing import Dict, Iterator, Optional, Tuple
+
+GRAM = 3
+# Sketch bits per 3-gram; sizes are powers of two so that a larger sketch can
+# be folded onto a smaller one.
+SKETCH_BITS_PER_GRAM = 32
+MIN_SKETCH_BITS = 1 << 10
+MAX_SKETCH_BITS = 1 << 16
+
+
+def _gram_hashes(text: str) -> Iterator[int]:
+    """Hash the 3-grams of ``text``, the n-th repeat of a 3-gram as its own value."""
+    seen: Dict[str, int] = {}
+    for i in range(len(text) - GRAM + 1):
+        gram = text[i : i + GRAM]
+        repeat = seen.get(gram, 0)
+        seen[gram] = repeat + 1
+        yield hash((gram, repeat))
+
+
+class GramSketch:
+    """Bitmap of a text's 3-grams, one bit per (3-gram, repeat)."""
+
+    __slots__ = ("bits", "size", "grams")
+
+    def __init__(self, bits: int, size: int, grams: int) -> None:
+        self.bits = bits
+        self.size = size
+        self.grams = grams
+
+    @classmethod
+    def of(cls, text: str) -> "GramSketch":
+        grams = max(0, len(text) - GRAM + 1)
+        size = 1 << (SKETCH_BITS_PER_GRAM * grams - 1).bit_length() if grams else 1
+        size = min(MAX_SKETCH_BITS, max(MIN_SKETCH_BITS, size))
+        bitmap = bytearray(size // 8)
+        for value in _gram_hashes(text):
+            position = value & (size - 1)
+            bitmap[position >> 3] |= 1 << (position & 7)
+        return cls(int.from_bytes(bitmap, "little"), size, grams)
+
+    def fold(self, size: int) -> Tuple[int, int]:
+        """Return the bitmap folded to ``size`` bits and the 3-grams it lost to collisions."""
+        bits, current = self.bits, self.size
+        while current > size:
+            current //= 2
+            bits = (bits & ((1 << current) - 1)) | (bits >> current)
+        return bits, self.grams - bits.bit_count()
+
+
+def min_shared_grams(total: int, threshold: float) -> int:
+    """3-grams that texts of ``total`` characters share if their ratio reaches ``threshold``."""
+    matched = int(threshold * total / 2)
+    unmatched = total - 2 * matched
+    return matched - (GRAM - 1) * (unmatched + 1)
+
+
+def lcs_length(masks: Dict[str, int], length: int, other: str) -> int:
+    """Longest common subsequence of ``other`` and the text of ``masks`` (Hyyrö's bit-vector LCS)."""
+    full = (1 << length) - 1
+    row = full
+    for char in other:
+        match = row & masks.get(char, 0)
+        row = ((row + match) | (row - match)) & full
+    return length - row.bit_count()
+
+
+def similar(text: str, other: str, threshold: float) -> bool:
+    """The ``fuzzy_text`` criterion itself."""
+    if not text or not other:
+        return False
+    # autojunk would discard common characters of texts over 200 chars
+    # and make near-identical long posts score far below the threshold.
+    matcher = SequenceMatcher(None, text, other, autojunk=False)
+    # The quick ratios are cheap upper bounds of ratio().
+    return (
+        matcher.real_quick_ratio() >= threshold
+        and matcher.quick_ratio() >= threshold
+        and matcher.ratio() >= threshold
+    )
+
+
+class FuzzyQuery:
+    """One text compared with many; rules out the pairs that cannot match."""
+
+    __slots__ = ("text", "threshold", "sketch", "_folds", "_masks")
+
+    def __init__(self, text: str, threshold: float) -> None:
+        self.text = text
+        self.threshold = threshold
+        self.sketch = GramSketch.of(text)
+        self._folds: Dict[int, Tuple[int, int]] = {}
+        self._masks: Optional[Dict[str, int]] = None
+
+    def may_match(self, other: str, sketch: GramSketch) -> bool:
+        """False if ``other`` cannot reach the threshold; ``sketch`` is ``GramSketch.of(other)``."""
+        text = self.text
+        if not text or not other:
+            return False
+        total = len(text) + len(other)
+        if 2.0 * min(len(text), len(other)) / total < self.threshold:
+            return False
+        size = min(self.sketch.size, sketch.size)
+        mine = self._folds.get(size)
+        if mine is None:
+            mine = self._folds[size] = self.sketch.fold(size)
+        theirs = sketch.fold(size)
+        shared = (mine[0] & theirs[0]).bit_count() + min(mine[1], theirs[1])
+        if shared < min_shared_grams(total, self.threshold):
+            return False
+        if self._masks is None:
+            masks: Dict[str, int] = {}
+            for position, char in enumerate(text):
+                masks[char] = masks.get(char, 0) | 1 << position
+            self._masks = masks
+        return 2.0 * lcs_length(self._masks, len(text), other) / total >= self.threshold
@@ -1,63 +1,433 @@
 """Channel message handlers for automation features."""
 from __future__ import annotations
 
-from collections import defaultdict, deque
+import asyncio
+import hashlib
+import logging
+import sys
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from difflib import SequenceMatcher
-from typing import Any, Deque, Dict, List, Optional, Tuple
+from itertools import count
+from typing import Any, Awaitable, Deque, Dict, Iterator, List, Optional, Tuple
 
+from pymongo.errors import PyMongoError
 from pyrogram import Client, filters
-from pyrogram.handlers import MessageHandler
-from pyrogram.types import Message
+from pyrogram.errors import RPCError
+from pyrogram.handlers import ChatMemberUpdatedHandler, MessageHandler
+from pyrogram.types import ChatMemberUpdated, Message
+
+import fuzzy_text
+import metrics
+import phash
+from admin_roster import ADMIN_STATUSES, admin_roster
+from async_db import (
+    find_recent_posts,
+    get_channel,
+    get_channel_settings,
+    log_action,
+    recent_post_writer,
+)
+from config import (
+    DISPATCH_WORKERS,
+    PHASH_CACHE_SIZE,
+    RECENT_CACHE_MAX_CHANNELS,
+    RECENT_POSTS_SIZE_MB,
+    REPLY_TRACKER_MAX_REPLIES,
+)
+from deletions import deletion_coalescer
+from expiry import ExpiryScheduler, Timer
+from keyed_dispatch import KeyedDispatcher
+from rate_limit import RateLimiter
+from reply_tracker import ReplyTracker
+
+logger = logging.getLogger(__name__)
+
+# Criteria that compare one field for equality and can be answered by a hash lookup.
+INDEXED_CRITERIA: Tuple[str, ...] = ("text", "caption", "media", "album")
+# Criterion names saved by older versions, mapped to their replacements.
+LEGACY_CRITERIA: Dict[str, str] = {"media_file_id": "media"}
+DEFAULT_FUZZY_THRESHOLD = 0.9
+DEFAULT_PHASH_MAX_DISTANCE = 6
+# Image hashes are indexed by their eight bytes (multi-index hashing): two
+# hashes within 7 bits of each other agree on at least one byte.  Larger
+# distances fall back to comparing every hashed entry in the window.
+PHASH_CHUNKS = 8
+PHASH_INDEXED_DISTANCE = PHASH_CHUNKS - 1
+
+# fuzzy_text candidates that pass every bound of fuzzy_text.FuzzyQuery are
+# verified newest first, at most this many per post.
+FUZZY_MAX_CANDIDATES = 4
+
+
+@dataclass(slots=True, eq=False)
+class RecentEntry:
+    """A recent post as seen by duplicate detection.
+
+    Exact criteria only need equality, so text, caption, media and album are
+    kept as 64-bit hashes.  The normalised text itself is only kept when the
+    channel matches fuzzy_text.  One entry is shared by the channel window
+    and the owner window.
+    """
+
+    channel_id: int
+    message_id: int
+    seq: int
+    # Unix time of the post.
+    date: float
+    text: Optional[int] = None
+    caption: Optional[int] = None
+    media: Optional[int] = None
+    media_group_id: Optional[str] = None
+    album: Optional[int] = None
+    phash: Optional[int] = None
+    full_text: Optional[str] = None
+    # 3-gram sketch of full_text, computed by the first fuzzy lookup.
+    sketch: Optional[fuzzy_text.GramSketch] = None
+
+    def to_document(self, owner_id: int) -> Dict[str, Any]:
+        """Return the compact ``recent_posts`` document for this entry."""
+        document: Dict[str, Any] = {
+            "c": self.channel_id,
+            "m": self.message_id,
+            "o": owner_id,
+            "s": self.seq,
+            "d": self.date,
+        }
+        for key, value in (
+            ("t", self.text),
+            ("p", self.caption),
+            ("f", self.media),
+            ("a", self.album),
+            ("h", self.phash),
+        ):
+            if value is not None:
+                document[key] = _to_int64(value)
+        if self.media_group_id:
+            document["g"] = self.media_group_id
+        if self.full_text:
+            document["x"] = self.full_text
+        return document
+
+    @classmethod
+    def from_document(cls, document: Dict[str, Any]) -> "RecentEntry":
+        def unsigned(key: str) -> Optional[int]:
+            value = document.get(key)
+            return None if value is None else value & 0xFFFFFFFFFFFFFFFF
+
+        return cls(
+            channel_id=document["c"],
+            message_id=document["m"],
+            seq=document["s"],
+            date=document["d"],
+            text=unsigned("t"),
+            caption=unsigned("p"),
+            media=unsigned("f"),
+            media_group_id=document.get("g"),
+            album=unsigned("a"),
+            phash=unsigned("h"),
+            full_text=document.get("x"),
+        )
+
+    def nbytes(self) -> int:
+        size = sys.getsizeof(self)
+        for name in RecentEntry.__slots__:
+            value = getattr(self, name)
+            if value is not None:
+                size += sys.getsizeof(value)
+        if self.sketch is not None:
+            size += sys.getsizeof(self.sketch.bits)
+        return size
+
+
+class RecentWindow:
+    """Recent messages in arrival order plus a hash index per exact criterion.
+
+    Each index maps a field value to the entries carrying it, oldest first,
+    so the newest match is ``bucket[-1]``.  Every insertion and eviction goes
+    through this class to keep the indexes in step with the window.
+    Buckets are plain lists: nearly all hold a single entry, and a list costs
+    a fraction of a deque.
+    """
+
+    def __init__(self) -> None:
+        self.entries: Deque[RecentEntry] = deque()
+        self._indexes: Dict[str, Dict[Any, List[RecentEntry]]] = {
+            criterion: {} for criterion in INDEXED_CRITERIA
+        }
+        self._phash_chunks: Dict[int, List[RecentEntry]] = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self) -> Iterator[RecentEntry]:
+        return iter(self.entries)
+
+    def __reversed__(self) -> Iterator[RecentEntry]:
+        return reversed(self.entries)
+
+    def oldest(self) -> RecentEntry:
+        return self.entries[0]
+
+    def append(self, entry: RecentEntry) -> None:
+        self.entries.append(entry)
+        for criterion, index in self._indexes.items():
+            key = getattr(entry, criterion)
+            if key:
+                index.setdefault(key, []).append(entry)
+        if entry.phash is not None:
+            for key in _phash_chunk_keys(entry.phash):
+                self._phash_chunks.setdefault(key, []).append(entry)
+
+    def popleft(self) -> RecentEntry:
+        entry = self.entries.popleft()
+        self._unindex(entry)
+        return entry
+
+    def remove_message(self, channel_id: int, message_id: int) -> None:
+        for idx, entry in enumerate(self.entries):
+            if entry.message_id == message_id and entry.channel_id == channel_id:
+                del self.entries[idx]
+                self._unindex(entry)
+                return
+
+    def newest_match(
+        self, criterion: str, key: Any, exclude_group: Optional[str] = None
+    ) -> Optional[RecentEntry]:
+        if not key:
+            return None
+        bucket = self._indexes[criterion].get(key)
+        if not bucket:
+            return None
+        if exclude_group is None:
+            return bucket[-1]
+        for entry in reversed(bucket):
+            if entry.media_group_id != exclude_group:
+                return entry
+        return None
 
-from db import get_channel, get_channel_settings, log_action
+    def similar_text(self, text: str, threshold: float) -> List[RecentEntry]:
+        """Entries whose text may reach ``threshold`` against ``text``, newest first.
+
+        Returns the newest ``FUZZY_MAX_CANDIDATES`` entries that
+        :class:`fuzzy_text.FuzzyQuery` cannot rule out.
+        """
+        if not text:
+            return []
+        query = fuzzy_text.FuzzyQuery(text, threshold)
+        found: List[RecentEntry] = []
+        for entry in reversed(self.entries):
+            if not entry.full_text:
+                continue
+            if entry.sketch is None:
+                # Entries are shared by the channel and owner windows; sketch once.
+                entry.sketch = fuzzy_text.GramSketch.of(entry.full_text)
+            if not query.may_match(entry.full_text, entry.sketch):
+                continue
+            found.append(entry)
+            if len(found) == FUZZY_MAX_CANDIDATES:
+                break
+        return found
+
+    def similar_images(self, value: int, max_distance: int) -> List[RecentEntry]:
+        """Entries whose image hash is within ``max_distance`` bits, newest first."""
+        if max_distance > PHASH_INDEXED_DISTANCE:
+            pool = (entry for entry in self.entries if entry.phash is not None)
+        else:
+            pool = (
+                entry
+                for key in _phash_chunk_keys(value)
+                for entry in self._phash_chunks.get(key, ())
+            )
+        found = {
+            entry.seq: entry
+            for entry in pool
+            if (entry.phash ^ value).bit_count() <= max_distance
+        }
+        return [found[seq] for seq in sorted(found, reverse=True)]
+
+    def nbytes(self, include_entries: bool = True) -> int:
+        """Approximate memory held by the window, its indexes and its entries."""
+        size = sys.getsizeof(self.entries)
+        if include_entries:
+            size += sum(entry.nbytes() for entry in self.entries)
+        for index in (*self._indexes.values(), self._phash_chunks):
+            size += sys.getsizeof(index)
+            size += sum(sys.getsizeof(bucket) for bucket in index.values())
+        return size
+
+    def _unindex(self, entry: RecentEntry) -> None:
+        for criterion, index in self._indexes.items():
+            key = getattr(entry, criterion)
+            if key:
+                _discard(index, key, entry)
+        if entry.phash is not None:
+            for key in _phash_chunk_keys(entry.phash):
+                _discard(self._phash_chunks, key, entry)
+
+
+class WindowCache:
+    """Recent windows keyed by chat or owner, evicting the least recently used.
+
+    Idle channels are dropped whole once more than ``max_windows`` are held.
+    """
+
+    def __init__(self, max_windows: int) -> None:
+        self.max_windows = max(1, max_windows)
+        self._windows: "OrderedDict[int, RecentWindow]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._windows)
+
+    def __contains__(self, key: int) -> bool:
+        return key in self._windows
+
+    def get(self, key: int) -> Optional[RecentWindow]:
+        return self._windows.get(key)
+
+    def window(self, key: int) -> RecentWindow:
+        """Return the window for ``key``, creating it and marking it as used."""
+        window = self._windows.get(key)
+        if window is not None:
+            self._windows.move_to_end(key)
+            return window
+        window = self._windows[key] = RecentWindow()
+        while len(self._windows) > self.max_windows:
+            evicted, old = self._windows.popitem(last=False)
+            logger.debug("Evicted idle recent window %s (%d posts)", evicted, len(old))
+        return window
+
+    def items(self) -> Iterator[Tuple[int, RecentWindow]]:
+        return iter(list(self._windows.items()))
+
+    def clear(self) -> None:
+        self._windows.clear()
+
+
+def _to_int64(value: int) -> int:
+    """Reinterpret an unsigned 64-bit hash as the signed integer BSON can store."""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _phash_chunk_keys(value: int) -> Tuple[int, ...]:
+    return tuple(
+        (chunk << 8) | ((value >> (chunk * 8)) & 0xFF) for chunk in range(PHASH_CHUNKS)
+    )
 
-RecentEntry = Dict[str, Any]
 
-recent_channel_cache: Dict[int, Deque[Dict[str, Any]]] = defaultdict(deque)
-owner_recent_cache: Dict[int, Deque[Dict[str, Any]]] = defaultdict(deque)
-reply_tracker: Dict[Tuple[int, int], Deque[Dict[str, Any]]] = defaultdict(deque)
-admin_cache: Dict[Tuple[int, int], bool] = {}
+def _discard(index: Dict[Any, List[RecentEntry]], key: Any, entry: RecentEntry) -> None:
+    bucket = index.get(key)
+    if not bucket:
+        return
+    if bucket[0] is entry:
+        del bucket[0]
+    else:
+        for idx, candidate in enumerate(bucket):
+            if candidate is entry:
+                del bucket[idx]
+                break
+    if not bucket:
+        del index[key]
+
+
+# Orders entries across windows so the newest match among several criteria wins.
+# Starting from the clock keeps entries reloaded from recent_posts older than
+# the ones created after a restart.
+_entry_sequence = count(time.time_ns())
+
+recent_channel_cache = WindowCache(RECENT_CACHE_MAX_CHANNELS)
+owner_recent_cache = WindowCache(RECENT_CACHE_MAX_CHANNELS)
+# (chat_id, media_group_id) -> album signature, so each album is fetched once.
+album_signatures: "OrderedDict[Tuple[int, str], Optional[int]]" = OrderedDict()
+# file_unique_id -> perceptual hash, so each image is downloaded and hashed once.
+phash_cache: "OrderedDict[str, Optional[int]]" = OrderedDict()
+_phash_pending: Dict[str, "asyncio.Task[Optional[int]]"] = {}
+# Windows being reloaded from recent_posts, keyed by ("channel"|"owner", id).
+_restoring: Dict[Tuple[str, int], "asyncio.Task[None]"] = {}
 MAX_CACHE = 500
+reply_tracker = ReplyTracker(max_replies=REPLY_TRACKER_MAX_REPLIES, max_per_thread=MAX_CACHE)
+# Post-processing stage name -> errors raised so far.
+_stage_failures: Dict[str, int] = {}
+
+
+# Duplicate detection and reply cleanup read, check and update per-channel
+# state across awaits, so posts of one channel are processed one at a time.
+channel_dispatcher = KeyedDispatcher(workers=DISPATCH_WORKERS, name="channel.dispatch")
 
 
 async def channel_message_handler(client: Client, message: Message) -> None:
     if not message.chat or message.service:
         return
-    channel_doc = get_channel(message.chat.id)
+    await channel_dispatcher.dispatch(message.chat.id, _process_channel_message, client, message)
+
+
+async def _process_channel_message(client: Client, message: Message) -> None:
+    channel_doc = await get_channel(message.chat.id)
     if not channel_doc:
         return
-    settings = get_channel_settings(message.chat.id)
+    settings = await get_channel_settings(message.chat.id)
     if not settings:
         return
     owner_id = channel_doc["owner_user_id"]
     deleted = await process_duplicates(client, message, channel_doc, settings, owner_id)
     if deleted:
         return
-    await process_replies(client, message, channel_doc, settings)
-    await process_auto_caption(client, message, channel_doc, settings)
-    await process_auto_reactions(client, message, channel_doc, settings)
+    # The remaining stages use different API methods and do not depend on
+    # each other, so a post waits for the slowest of them rather than the sum.
+    await asyncio.gather(
+        _run_stage("replies", message, process_replies(client, message, channel_doc, settings)),
+        _run_stage("caption", message, process_auto_caption(client, message, channel_doc, settings)),
+        _run_stage("reactions", message, process_auto_reactions(client, message, channel_doc, settings)),
+    )
+
+
+async def _run_stage(name: str, message: Message, stage: Awaitable[None]) -> None:
+    """Await one post-processing stage, timing it and logging its errors."""
+    started = time.perf_counter()
+    try:
+        await stage
+    except Exception:
+        _stage_failures[name] = _stage_failures.get(name, 0) + 1
+        metrics.set_gauge(f"channel.stage.{name}.errors", _stage_failures[name])
+        logger.exception("%s stage failed for message %s in %s", name, message.id, message.chat.id)
+    finally:
+        metrics.observe(f"channel.stage.{name}", time.perf_counter() - started)
 
 
 async def process_duplicates(client: Client, message: Message, channel: Dict[str, Any], settings: Dict[str, Any], owner_id: int) -> bool:
     cfg = settings.get("duplicates", {})
+    await _restore_windows(message.chat.id, owner_id)
     if not cfg.get("enabled"):
-        _store_recent_message(message, owner_id)
+        await _store_recent_message(message, owner_id)
         return False
-    info = _extract_message_info(message)
+    info = await message_signature(client, message, cfg.get("criteria", []))
     candidates = _get_candidate_messages(channel["channel_id"], owner_id, cfg)
-    matched = _find_duplicate_match(info, candidates, cfg)
+    matched = find_duplicate_match(info, candidates, cfg)
     if matched:
         strategy = cfg.get("strategy", "delete_new")
         if strategy == "delete_new":
-            await client.delete_messages(message.chat.id, message.id)
-            log_action(message.chat.id, owner_id, "duplicate_deleted", {"message_id": message.id, "reason": matched[1]})
+            deletion_coalescer.submit(
+                client,
+                message.chat.id,
+                [message.id],
+                owner_id=owner_id,
+                action="duplicate_deleted",
+                meta={"message_id": message.id, "reason": matched[1]},
+            )
             return True
         else:
-            await client.delete_messages(matched[0]["channel_id"], matched[0]["message_id"])
-            _remove_from_cache(matched[0]["channel_id"], owner_id, matched[0]["message_id"])
-            log_action(message.chat.id, owner_id, "duplicate_old_deleted", {"message_id": matched[0]["message_id"], "reason": matched[1]})
-    _store_recent_message(message, owner_id)
+            deletion_coalescer.submit(
+                client,
+                matched[0].channel_id,
+                [matched[0].message_id],
+                owner_id=owner_id,
+                action="duplicate_old_deleted",
+                meta={"message_id": matched[0].message_id, "reason": matched[1]},
+                log_chat_id=message.chat.id,
+            )
+            await remove_from_cache(matched[0].channel_id, owner_id, matched[0].message_id)
+    await _store_recent_message(message, owner_id, info)
     return False
 
 
@@ -65,50 +435,69 @@ async def process_replies(client: Client, message: Message, channel: Dict[str, A
     cfg = settings.get("replies", {})
     if not cfg.get("enabled") or not message.reply_to_message_id:
         return
-    key = (channel["channel_id"], message.reply_to_message_id)
+    channel_id = channel["channel_id"]
+    root_id = message.reply_to_message_id
     ignore_admin = cfg.get("ignore_admin_replies", True)
     is_admin = False
     if ignore_admin and message.from_user:
-        is_admin = await _is_admin(client, channel["channel_id"], message.from_user.id)
-    entry = {
-        "message_id": message.id,
-        "from_user_id": message.from_user.id if message.from_user else None,
-        "is_admin": is_admin,
-        "date": message.date,
-    }
-    tracker = reply_tracker[key]
-    tracker.append(entry)
-    if len(tracker) > MAX_CACHE:
-        tracker.popleft()
+        is_admin = await _is_admin(client, channel_id, message.from_user.id)
+    # Admin replies are never cleaned up while admins are exempt.
+    reply_tracker.add(channel_id, root_id, message.id, protected=ignore_admin and is_admin)
     mode = cfg.get("mode", "keep_latest")
     to_delete: List[int] = []
     now = datetime.utcnow()
     if mode == "keep_latest":
-        for prev in list(tracker)[:-1]:
-            if ignore_admin and prev["is_admin"]:
-                continue
-            to_delete.append(prev["message_id"])
+        to_delete = reply_tracker.keep_latest(channel_id, root_id, message.id)
     elif mode == "delete_all_after_time":
         limit = cfg.get("time_limit_minutes", 60)
         root_date = message.reply_to_message.date if message.reply_to_message else message.date
-        if (now - root_date) > timedelta(minutes=limit) and not (ignore_admin and is_admin):
-            to_delete.append(message.id)
-        for prev in list(tracker):
-            if prev is entry:
-                continue
-            if (now - prev["date"]) > timedelta(minutes=limit) and not (ignore_admin and prev["is_admin"]):
-                to_delete.append(prev["message_id"])
+        if not (ignore_admin and is_admin):
+            if (now - root_date) > timedelta(minutes=limit):
+                to_delete.append(message.id)
+                reply_tracker.remove(channel_id, root_id, to_delete)
+            else:
+                # Earlier replies are expired by reply_expiry when they are due.
+                await reply_expiry.schedule(
+                    Timer(
+                        channel_id=channel_id,
+                        message_id=message.id,
+                        owner_id=channel["owner_user_id"],
+                        root_id=root_id,
+                        due=message.date.timestamp() + limit * 60,
+                    )
+                )
     elif mode == "delete_if_count_gt_n":
         max_count = max(1, cfg.get("max_replies", 3))
-        candidates = [p for p in tracker if not (ignore_admin and p["is_admin"])]
-        while len(candidates) > max_count:
-            victim = candidates.pop(0)
-            to_delete.append(victim["message_id"])
+        to_delete = reply_tracker.keep_newest(channel_id, root_id, max_count)
     if to_delete:
-        await client.delete_messages(channel["channel_id"], to_delete)
-        tracker = deque([p for p in tracker if p["message_id"] not in to_delete], maxlen=MAX_CACHE)
-        reply_tracker[key] = tracker
-        log_action(channel["channel_id"], channel["owner_user_id"], "reply_cleanup", {"deleted": to_delete})
+        deletion_coalescer.submit(
+            client,
+            channel_id,
+            to_delete,
+            owner_id=channel["owner_user_id"],
+            action="reply_cleanup",
+        )
+
+
+async def _expire_replies(client: Client, channel_id: int, timers: List[Timer]) -> None:
+    """Delete replies whose time limit has passed, if the channel still wants that."""
+    settings = await get_channel_settings(channel_id) or {}
+    cfg = settings.get("replies", {})
+    if not cfg.get("enabled") or cfg.get("mode") != "delete_all_after_time":
+        return
+    expired = {timer.message_id for timer in timers}
+    deletion_coalescer.submit(
+        client,
+        channel_id,
+        sorted(expired),
+        owner_id=timers[0].owner_id,
+        action="reply_cleanup",
+    )
+    for timer in timers:
+        reply_tracker.remove(channel_id, timer.root_id, [timer.message_id])
+
+
+reply_expiry = ExpiryScheduler(_expire_replies)
 
 
 async def process_auto_caption(client: Client, message: Message, channel: Dict[str, Any], settings: Dict[str, Any]) -> None:
@@ -140,7 +529,7 @@ async def process_auto_caption(client: Client, message: Message, channel: Dict[s
             if updated is None:
                 return
             await client.edit_message_text(message.chat.id, message.id, updated)
-        log_action(message.chat.id, channel["owner_user_id"], "caption_applied", {"message_id": message.id})
+        await log_action(message.chat.id, channel["owner_user_id"], "caption_applied", {"message_id": message.id})
     except Exception:
         return
 
@@ -168,24 +557,63 @@ async def process_auto_reactions(client: Client, message: Message, channel: Dict
         except Exception:
             continue
     if emojis:
-        log_action(message.chat.id, channel["owner_user_id"], "reactions_added", {"message_id": message.id, "emojis": emojis})
-
-
-def _extract_message_info(message: Message) -> Dict[str, Any]:
+        await log_action(message.chat.id, channel["owner_user_id"], "reactions_added", {"message_id": message.id, "emojis": emojis})
+
+
+async def message_signature(
+    client: Client,
+    message: Message,
+    criteria: List[str],
+    limiter: Optional[RateLimiter] = None,
+) -> RecentEntry:
+    """Build the cache entry for ``message`` with everything ``criteria`` compare.
+
+    Bulk jobs pass ``limiter`` so the album and thumbnail requests this may
+    make count against their rate limit; cached results make none.
+    """
+    info = _extract_message_info(message, keep_text="fuzzy_text" in criteria)
+    if "album" in criteria and message.media_group_id:
+        info.album = await _album_signature(client, message, limiter)
+    if "phash" in criteria:
+        info.phash = await _image_phash(client, message, limiter)
+    return info
+
+
+def _extract_message_info(message: Message, keep_text: bool = False) -> RecentEntry:
+    """Build the cache entry for ``message``.
+
+    ``keep_text`` keeps the normalised text for fuzzy_text; album and phash
+    are filled in by process_duplicates when those criteria are enabled.
+    """
     text_content = (message.text or message.caption or "").strip().lower()
     caption_text = (message.caption or "").strip().lower()
-    media_id = _get_media_file_id(message)
-    return {
-        "channel_id": message.chat.id,
-        "message_id": message.id,
-        "text": text_content,
-        "caption": caption_text,
-        "media_file_id": media_id,
-        "date": message.date,
-    }
+    return RecentEntry(
+        channel_id=message.chat.id,
+        message_id=message.id,
+        seq=next(_entry_sequence),
+        date=message.date.timestamp() if message.date else time.time(),
+        text=_text_hash(text_content),
+        caption=_text_hash(caption_text),
+        media=_get_media_key(message),
+        media_group_id=message.media_group_id,
+        full_text=text_content if keep_text and text_content else None,
+    )
+
+
+def _media_hash(value: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), "little")
+
+
+def _text_hash(text: str) -> Optional[int]:
+    return _media_hash(text.encode()) if text else None
 
 
-def _get_media_file_id(message: Message) -> Optional[str]:
+def _get_media_key(message: Message) -> Optional[int]:
+    """Return a 64-bit hash of the media's ``file_unique_id``.
+
+    Unlike ``file_id``, ``file_unique_id`` is the same for every bot and
+    session and survives re-uploads and forwards of the same file.
+    """
     fields = [
         "photo",
         "animation",
@@ -199,78 +627,296 @@ def _get_media_file_id(message: Message) -> Optional[str]:
     for field in fields:
         value = getattr(message, field, None)
         if value:
-            return value.file_id
+            return _media_hash(value.file_unique_id.encode())
     return None
 
 
-def _store_recent_message(message: Message, owner_id: int) -> None:
-    info = _extract_message_info(message)
-    channel_deque = recent_channel_cache[message.chat.id]
-    channel_deque.append(info)
-    if len(channel_deque) > MAX_CACHE:
-        channel_deque.popleft()
-    owner_deque = owner_recent_cache[owner_id]
-    owner_deque.append(info)
-    if len(owner_deque) > MAX_CACHE:
-        owner_deque.popleft()
+async def _album_signature(
+    client: Client, message: Message, limiter: Optional[RateLimiter] = None
+) -> Optional[int]:
+    """Hash the media of every item in the message's album, order-independently."""
+    key = (message.chat.id, message.media_group_id)
+    if key in album_signatures:
+        album_signatures.move_to_end(key)
+        return album_signatures[key]
+    if limiter is not None:
+        await limiter.acquire()
+    try:
+        items = await client.get_media_group(message.chat.id, message.id)
+    except RPCError:
+        items = [message]
+    item_keys = sorted(filter(None, (_get_media_key(item) for item in items)))
+    signature = (
+        _media_hash(b"".join(k.to_bytes(8, "little") for k in item_keys))
+        if item_keys
+        else None
+    )
+    album_signatures[key] = signature
+    while len(album_signatures) > MAX_CACHE:
+        album_signatures.popitem(last=False)
+    return signature
+
+
+def _smallest_thumbnail(message: Message) -> Tuple[Optional[str], Optional[str]]:
+    """Return ``(file_unique_id, thumbnail file_id)`` for the message's image."""
+    for field in ("photo", "video", "animation", "document", "sticker"):
+        media = getattr(message, field, None)
+        if media:
+            thumbs = getattr(media, "thumbs", None)
+            if not thumbs:
+                return media.file_unique_id, None
+            smallest = min(
+                thumbs, key=lambda thumb: (thumb.width or 0) * (thumb.height or 0)
+            )
+            return media.file_unique_id, smallest.file_id
+    return None, None
+
+
+async def _image_phash(
+    client: Client, message: Message, limiter: Optional[RateLimiter] = None
+) -> Optional[int]:
+    """Perceptual hash of the message's smallest thumbnail, cached per file."""
+    unique_id, thumb_file_id = _smallest_thumbnail(message)
+    if unique_id is None:
+        return None
+    if unique_id in phash_cache:
+        phash_cache.move_to_end(unique_id)
+        return phash_cache[unique_id]
+    if thumb_file_id is None or not phash.AVAILABLE:
+        return None
+    # Copies posted at the same time share one download.
+    task = _phash_pending.get(unique_id)
+    if task is None:
+        task = asyncio.ensure_future(_download_and_hash(client, thumb_file_id, limiter))
+        _phash_pending[unique_id] = task
+        task.add_done_callback(lambda _: _phash_pending.pop(unique_id, None))
+    try:
+        value = await asyncio.shield(task)
+    except Exception as err:
+        # Only definitive results are cached; a failed download or a broken
+        # worker pool is retried the next time the image is seen.
+        logger.warning(
+            "Could not hash the image of message %s in %s: %r", message.id, message.chat.id, err
+        )
+        return None
+    phash_cache[unique_id] = value
+    while len(phash_cache) > PHASH_CACHE_SIZE:
+        phash_cache.popitem(last=False)
+    return value
+
+
+async def _download_and_hash(
+    client: Client, file_id: str, limiter: Optional[RateLimiter] = None
+) -> Optional[int]:
+    """Hash a thumbnail; ``None`` if it is not an image, raises if it could not be fetched."""
+    if limiter is not None:
+        await limiter.acquire()
+    buffer = await client.download_media(file_id, in_memory=True)
+    if buffer is None:
+        raise OSError(f"download of {file_id} returned nothing")
+    return await phash.hash_image(buffer.getvalue())
+
+
+async def _store_recent_message(message: Message, owner_id: int, info: Optional[RecentEntry] = None) -> None:
+    if info is None:
+        info = _extract_message_info(message)
+    channel_window = recent_channel_cache.window(message.chat.id)
+    channel_window.append(info)
+    if len(channel_window) > MAX_CACHE:
+        channel_window.popleft()
+    owner_window = owner_recent_cache.window(owner_id)
+    owner_window.append(info)
+    if len(owner_window) > MAX_CACHE:
+        owner_window.popleft()
+    if RECENT_POSTS_SIZE_MB > 0:
+        await recent_post_writer.add(info.to_document(owner_id))
+
+
+async def _restore_windows(channel_id: int, owner_id: int) -> None:
+    """Reload the channel and owner windows from recent_posts on first use.
+
+    Windows are only missing after a restart or an LRU eviction.  Concurrent
+    posts of the same channel wait for a single reload.
+    """
+    if RECENT_POSTS_SIZE_MB <= 0:
+        return
+    for scope, key, cache in (
+        ("channel", channel_id, recent_channel_cache),
+        ("owner", owner_id, owner_recent_cache),
+    ):
+        if key in cache:
+            continue
+        task = _restoring.get((scope, key))
+        if task is None:
+            task = asyncio.ensure_future(_restore_window(scope, key, owner_id))
+            _restoring[(scope, key)] = task
+            task.add_done_callback(lambda _, k=(scope, key): _restoring.pop(k, None))
+        await asyncio.shield(task)
+
+
+async def _restore_window(scope: str, key: int, owner_id: int) -> None:
+    cache = recent_channel_cache if scope == "channel" else owner_recent_cache
+    try:
+        if scope == "channel":
+            documents = await find_recent_posts(channel_id=key, limit=MAX_CACHE)
+        else:
+            documents = await find_recent_posts(owner_id=key, limit=MAX_CACHE)
+    except (PyMongoError, asyncio.TimeoutError) as err:
+        logger.warning("Could not reload recent posts of %s %s: %s", scope, key, err)
+        documents = []
+    if key in cache:
+        return
+
+    # Entries still held by the other scope's windows are reused, not copied.
+    peers: Dict[int, Dict[Tuple[int, int], RecentEntry]] = {}
+
+    def shared_entry(channel: int, message_id: int) -> Optional[RecentEntry]:
+        if scope == "channel":
+            peer = owner_recent_cache.get(owner_id)
+        else:
+            peer = recent_channel_cache.get(channel)
+        if peer is None:
+            return None
+        known = peers.get(id(peer))
+        if known is None:
+            known = peers[id(peer)] = {(e.channel_id, e.message_id): e for e in peer}
+        return known.get((channel, message_id))
+
+    seen = set()
+    entries: List[RecentEntry] = []
+    for document in documents:
+        ident = (document["c"], document["m"])
+        if ident in seen:
+            continue
+        # Removal markers come before (newer than) the post they remove.
+        seen.add(ident)
+        if document.get("r"):
+            continue
+        entries.append(shared_entry(*ident) or RecentEntry.from_document(document))
+    window = cache.window(key)
+    for entry in sorted(entries, key=lambda entry: entry.seq):
+        window.append(entry)
+    if entries:
+        logger.debug("Reloaded %d recent posts of %s %s", len(entries), scope, key)
 
 
-def _get_candidate_messages(channel_id: int, owner_id: int, cfg: Dict[str, Any]) -> List[Dict[str, Any]]:
+def _get_candidate_messages(channel_id: int, owner_id: int, cfg: Dict[str, Any]) -> RecentWindow:
     if cfg.get("scope") == "global":
-        deq = owner_recent_cache[owner_id]
+        window = owner_recent_cache.window(owner_id)
     else:
-        deq = recent_channel_cache[channel_id]
-    _trim_deque(deq, cfg)
-    return list(deq)
+        window = recent_channel_cache.window(channel_id)
+    trim_window(window, cfg)
+    return window
 
 
-def _trim_deque(deq: Deque[Dict[str, Any]], cfg: Dict[str, Any]) -> None:
+def trim_window(window: RecentWindow, cfg: Dict[str, Any], now: Optional[float] = None) -> None:
+    """Drop entries outside the configured window, measured back from ``now``."""
     window_type = cfg.get("window_type", "messages")
     window_value = max(1, int(cfg.get("window_value", 20)))
     if window_type == "messages":
-        while len(deq) > window_value:
-            deq.popleft()
+        while len(window) > window_value:
+            window.popleft()
     else:
-        cutoff = datetime.utcnow() - timedelta(minutes=window_value)
-        while deq and deq[0]["date"] < cutoff:
-            deq.popleft()
+        cutoff = (time.time() if now is None else now) - window_value * 60
+        while window and window.oldest().date < cutoff:
+            window.popleft()
 
 
-def _find_duplicate_match(info: Dict[str, Any], candidates: List[Dict[str, Any]], cfg: Dict[str, Any]) -> Optional[Tuple[Dict[str, Any], str]]:
-    criteria = cfg.get("criteria", [])
-    for candidate in reversed(candidates):
+def find_duplicate_match(info: RecentEntry, candidates: RecentWindow, cfg: Dict[str, Any]) -> Optional[Tuple[RecentEntry, str]]:
+    criteria = [LEGACY_CRITERIA.get(c, c) for c in cfg.get("criteria", [])]
+    # Exact criteria are hash lookups; keep the newest candidate they find.
+    best: Optional[Tuple[RecentEntry, str]] = None
+    for criterion in criteria:
+        if criterion not in INDEXED_CRITERIA:
+            continue
+        exclude_group = None
+        if criterion == "album":
+            # Items of the same album share its signature but are not duplicates.
+            exclude_group = info.media_group_id
+            if not exclude_group:
+                continue
+        candidate = candidates.newest_match(criterion, getattr(info, criterion), exclude_group)
+        if candidate is not None and (best is None or candidate.seq > best[0].seq):
+            best = candidate, criterion
+    threshold = float(cfg.get("fuzzy_threshold", DEFAULT_FUZZY_THRESHOLD))
+    max_distance = int(cfg.get("phash_max_distance", DEFAULT_PHASH_MAX_DISTANCE))
+    similar: Dict[int, RecentEntry] = {}
+    if "fuzzy_text" in criteria and info.full_text:
+        similar.update((c.seq, c) for c in candidates.similar_text(info.full_text, threshold))
+    if "phash" in criteria and info.phash is not None:
+        similar.update(
+            (c.seq, c) for c in candidates.similar_images(info.phash, max_distance)
+        )
+    # Only index candidates newer than the exact match need verifying
+    # (inclusive, so criteria order decides ties as before).
+    for seq in sorted(similar, reverse=True):
+        if best is not None and seq < best[0].seq:
+            break
+        candidate = similar[seq]
         for criterion in criteria:
-            if _matches_criterion(info, candidate, criterion):
+            if _matches_criterion(info, candidate, criterion, threshold, max_distance):
                 return candidate, criterion
-    return None
+    return best
 
 
-def _matches_criterion(info: Dict[str, Any], candidate: Dict[str, Any], criterion: str) -> bool:
+def _matches_criterion(
+    info: RecentEntry,
+    candidate: RecentEntry,
+    criterion: str,
+    threshold: float = DEFAULT_FUZZY_THRESHOLD,
+    max_distance: int = DEFAULT_PHASH_MAX_DISTANCE,
+) -> bool:
     if criterion == "text":
-        return bool(info["text"]) and info["text"] == candidate.get("text")
+        return bool(info.text) and info.text == candidate.text
     if criterion == "caption":
-        return bool(info["caption"]) and info["caption"] == candidate.get("caption")
-    if criterion == "media_file_id":
-        return bool(info["media_file_id"]) and info["media_file_id"] == candidate.get("media_file_id")
+        return bool(info.caption) and info.caption == candidate.caption
+    if criterion in ("media", "media_file_id"):
+        return bool(info.media) and info.media == candidate.media
+    if criterion == "album":
+        return (
+            bool(info.album and info.media_group_id)
+            and info.album == candidate.album
+            and info.media_group_id != candidate.media_group_id
+        )
     if criterion == "fuzzy_text":
-        if not info["text"] or not candidate.get("text"):
+        return fuzzy_text.similar(info.full_text or "", candidate.full_text or "", threshold)
+    if criterion == "phash":
+        if info.phash is None or candidate.phash is None:
             return False
-        ratio = SequenceMatcher(None, info["text"], candidate.get("text", "")).ratio()
-        return ratio >= 0.9
+        return (info.phash ^ candidate.phash).bit_count() <= max_distance
     return False
 
 
-def _remove_from_cache(channel_id: int, owner_id: int, message_id: int) -> None:
-    channel_deque = recent_channel_cache[channel_id]
-    for idx, item in enumerate(list(channel_deque)):
-        if item["message_id"] == message_id:
-            del channel_deque[idx]
-            break
-    owner_deque = owner_recent_cache[owner_id]
-    for idx, item in enumerate(list(owner_deque)):
-        if item["message_id"] == message_id and item["channel_id"] == channel_id:
-            del owner_deque[idx]
-            break
+async def remove_from_cache(channel_id: int, owner_id: int, message_id: int) -> None:
+    for window in (recent_channel_cache.get(channel_id), owner_recent_cache.get(owner_id)):
+        if window is not None:
+            window.remove_message(channel_id, message_id)
+    if RECENT_POSTS_SIZE_MB > 0:
+        # Capped collections cannot delete, so record the removal instead.
+        await recent_post_writer.add(
+            {"c": channel_id, "m": message_id, "o": owner_id, "r": 1}
+        )
+
+
+async def newest_seen_message_id(channel_id: int, owner_id: int) -> Optional[int]:
+    """Return the newest post of the channel that duplicate detection has seen."""
+    await _restore_windows(channel_id, owner_id)
+    window = recent_channel_cache.get(channel_id)
+    if not window:
+        return None
+    return max(entry.message_id for entry in window)
+
+
+def recent_cache_usage(channel_id: int) -> Tuple[int, int]:
+    """Return the channel's cached post count and their approximate size in bytes.
+
+    Entries are shared with the owner window and counted here, under their
+    channel.
+    """
+    window = recent_channel_cache.get(channel_id)
+    if window is None:
+        return 0, 0
+    return len(window), window.nbytes()
 
 
 def _render_caption(template: str, message: Message, channel: Dict[str, Any]) -> str:
@@ -299,13 +945,20 @@ def _merge_caption(existing: str, template: str, behavior: str) -> Optional[str]
 
 
 async def _is_admin(client: Client, channel_id: int, user_id: int) -> bool:
-    key = (channel_id, user_id)
-    if key in admin_cache:
-        return admin_cache[key]
-    member = await client.get_chat_member(channel_id, user_id)
-    is_admin = member.status in ("administrator", "creator")
-    admin_cache[key] = is_admin
-    return is_admin
+    return await admin_roster.is_admin(client, channel_id, user_id)
+
+
+async def chat_member_updated_handler(_: Client, update: ChatMemberUpdated) -> None:
+    member = update.new_chat_member or update.old_chat_member
+    if member is None or member.user is None:
+        # Without the user, only a fresh fetch can tell what changed.
+        admin_roster.invalidate(update.chat.id)
+        return
+    is_admin = (
+        update.new_chat_member is not None
+        and update.new_chat_member.status in ADMIN_STATUSES
+    )
+    admin_roster.apply_member_update(update.chat.id, member.user.id, is_admin)
 
 
 def register(app: Client) -> None:
@@ -315,3 +968,4 @@ def register(app: Client) -> None:
             filters.channel & ~filters.service,
         )
     )
+    app.add_handler(ChatMemberUpdatedHandler(chat_member_updated_handler, filters.channel))
@@ -1,14 +1,14 @@
 """Command handlers for the channel management bot."""
 from __future__ import annotations
 
-from typing import Any, Callable, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from pyrogram import Client, filters
 from pyrogram.errors import RPCError
 from pyrogram.handlers import MessageHandler
 from pyrogram.types import Message
 
-from db import (
+from async_db import (
     add_channel,
     get_channel_settings,
     get_or_create_user,
@@ -16,6 +16,9 @@ from db import (
     remove_channel,
     update_channel_settings,
 )
+import phash
+from handlers import dup_scan
+from handlers.channel_events import recent_cache_usage
 
 ConversationHandler = Callable[[Client, Message, Dict[str, Any]], Any]
 
@@ -141,7 +144,7 @@ async def cmd_start(client: Client, message: Message) -> None:
     if not message.from_user:
         return
     user = message.from_user
-    get_or_create_user(user.id, user.first_name, user.username)
+    await get_or_create_user(user.id, user.first_name, user.username)
     text = (
         "👋 **Welcome to the Channel Management Bot!**\n\n"
         "Add me as an administrator to your channels and use /addchannel here in DM to link them. "
@@ -163,7 +166,8 @@ async def cmd_help(_: Client, message: Message) -> None:
         "/reply_settings – Configure reply cleanup.\n"
         "/caption_settings – Configure auto captions.\n"
         "/reaction_settings – Configure reactions.\n"
-        "/status – Display channel status summary."
+        "/status – Display channel status summary.\n"
+        "/dupscan – Remove duplicates from a channel's existing posts (`/dupscan stop` to pause)."
     )
     await message.reply_text(text)
 
@@ -172,13 +176,13 @@ async def cmd_listchannels(_: Client, message: Message) -> None:
     if not message.from_user:
         return
     user_id = message.from_user.id
-    channels_docs = list_channels(user_id)
+    channels_docs = await list_channels(user_id)
     if not channels_docs:
         await message.reply_text("You do not have any channels linked. Use /addchannel to add one.")
         return
     response_lines: List[str] = []
     for idx, channel in enumerate(channels_docs, start=1):
-        settings = get_channel_settings(channel["channel_id"]) or {}
+        settings = await get_channel_settings(channel["channel_id"]) or {}
         response_lines.append(f"{idx}. {_format_channel_line(channel, settings)}")
     await message.reply_text("\n\n".join(response_lines))
 
@@ -187,7 +191,7 @@ async def cmd_addchannel(client: Client, message: Message) -> None:
     if not message.from_user:
         return
     user = message.from_user
-    get_or_create_user(user.id, user.first_name, user.username)
+    await get_or_create_user(user.id, user.first_name, user.username)
     await message.reply_text(
         "Please forward a message from the target channel or send its @username / ID."
     )
@@ -210,7 +214,7 @@ async def _handle_addchannel_input(client: Client, message: Message, state: Dict
         await message.reply_text(str(exc))
         conversation_manager.stop(user_id)
         return
-    add_channel(
+    await add_channel(
         user_id,
         channel.id,
         channel.username,
@@ -246,7 +250,7 @@ async def cmd_removechannel(client: Client, message: Message) -> None:
     if not message.from_user:
         return
     user_id = message.from_user.id
-    channels_docs = list_channels(user_id)
+    channels_docs = await list_channels(user_id)
     if not channels_docs:
         await message.reply_text("No channels found. Use /addchannel first.")
         return
@@ -272,7 +276,7 @@ async def _handle_remove_channel_selection(client: Client, message: Message, sta
         return
     if not await _ensure_access_or_notify(client, message, selection):
         return
-    removed = remove_channel(user_id, selection["channel_id"])
+    removed = await remove_channel(user_id, selection["channel_id"])
     if removed:
         await message.reply_text(
             f"Channel {selection['title']} has been removed."
@@ -286,7 +290,7 @@ async def cmd_settings(client: Client, message: Message) -> None:
     if not message.from_user:
         return
     user_id = message.from_user.id
-    channels_docs = list_channels(user_id)
+    channels_docs = await list_channels(user_id)
     if not channels_docs:
         await message.reply_text("You have no channels configured.")
         return
@@ -351,7 +355,7 @@ async def cmd_dup_settings(client: Client, message: Message) -> None:
     if not message.from_user:
         return
     user_id = message.from_user.id
-    channels_docs = list_channels(user_id)
+    channels_docs = await list_channels(user_id)
     if not channels_docs:
         await message.reply_text("You do not have channels registered.")
         return
@@ -401,30 +405,62 @@ async def _handle_dup_toggle(client: Client, message: Message, state: Dict[str,
         return
     state["context"]["enabled"] = answer == "on"
     if not state["context"]["enabled"]:
-        update_channel_settings(channel["channel_id"], {"duplicates.enabled": False})
+        await update_channel_settings(channel["channel_id"], {"duplicates.enabled": False})
         await message.reply_text("Duplicate cleaner disabled.")
         conversation_manager.stop(user_id)
         return
     await message.reply_text(
         "Select criteria (comma separated numbers):\n"
-        "1) Same text\n2) Same media file\n3) Same caption\n4) Fuzzy text"
+        + "\n".join(f"{number}) {label}" for number, (_, label) in _dup_criteria().items())
     )
     conversation_manager.set_next(user_id, _handle_dup_criteria)
 
 
+def _dup_criteria() -> Dict[str, Tuple[str, str]]:
+    """Criteria offered by /dup_settings, by menu number: (criterion, label)."""
+    criteria = {
+        "1": ("text", "Same text"),
+        "2": ("media", "Same media file"),
+        "3": ("caption", "Same caption"),
+        "4": ("fuzzy_text", "Fuzzy text"),
+        "5": ("album", "Same album"),
+    }
+    if phash.AVAILABLE:
+        criteria["6"] = ("phash", "Similar image")
+    return criteria
+
+
 async def _handle_dup_criteria(client: Client, message: Message, state: Dict[str, Any]) -> None:
     user_id = message.from_user.id
     choices = [c.strip() for c in (message.text or "").split(",") if c.strip()]
-    mapping = {"1": "text", "2": "media_file_id", "3": "caption", "4": "fuzzy_text"}
-    selected = [mapping[c] for c in choices if c in mapping]
+    mapping = _dup_criteria()
+    selected = [mapping[c][0] for c in choices if c in mapping]
     if not selected:
         await message.reply_text("Please send numbers like `1,2`.")
         return
     state["context"]["criteria"] = selected
+    state["context"]["fuzzy_threshold"] = 0.9
+    if "fuzzy_text" in selected:
+        await message.reply_text("Fuzzy similarity threshold in percent? (50-100, e.g. 90)")
+        conversation_manager.set_next(user_id, _handle_dup_fuzzy_threshold)
+        return
     await message.reply_text("Scope? Type `channel` or `global`.")
     conversation_manager.set_next(user_id, _handle_dup_scope)
 
 
+async def _handle_dup_fuzzy_threshold(client: Client, message: Message, state: Dict[str, Any]) -> None:
+    try:
+        percent = float((message.text or "").strip().rstrip("%"))
+    except ValueError:
+        percent = 0
+    if not 50 <= percent <= 100:
+        await message.reply_text("Enter a number between 50 and 100.")
+        return
+    state["context"]["fuzzy_threshold"] = percent / 100
+    await message.reply_text("Scope? Type `channel` or `global`.")
+    conversation_manager.set_next(message.from_user.id, _handle_dup_scope)
+
+
 async def _handle_dup_scope(client: Client, message: Message, state: Dict[str, Any]) -> None:
     answer = (message.text or "").strip().lower()
     if answer not in {"channel", "global"}:
@@ -472,9 +508,10 @@ async def _handle_dup_strategy(client: Client, message: Message, state: Dict[str
             "window_type": state["context"]["window_type"],
             "window_value": state["context"]["window_value"],
             "strategy": state["context"]["strategy"],
+            "fuzzy_threshold": state["context"]["fuzzy_threshold"],
         }
     }
-    update_channel_settings(channel["channel_id"], update)
+    await update_channel_settings(channel["channel_id"], update)
     await message.reply_text(
         f"Duplicates enabled with criteria {', '.join(update['duplicates']['criteria'])}."
     )
@@ -485,7 +522,7 @@ async def cmd_reply_settings(client: Client, message: Message) -> None:
     if not message.from_user:
         return
     user_id = message.from_user.id
-    channels_docs = list_channels(user_id)
+    channels_docs = await list_channels(user_id)
     if not channels_docs:
         await message.reply_text("No channels found.")
         return
@@ -532,7 +569,7 @@ async def _handle_reply_toggle(client: Client, message: Message, state: Dict[str
         return
     state["context"]["enabled"] = answer == "on"
     if not state["context"]["enabled"]:
-        update_channel_settings(channel["channel_id"], {"replies.enabled": False})
+        await update_channel_settings(channel["channel_id"], {"replies.enabled": False})
         await message.reply_text("Reply cleanup disabled.")
         conversation_manager.stop(user_id)
         return
@@ -602,7 +639,7 @@ async def _handle_reply_ignore_admin(client: Client, message: Message, state: Di
             "ignore_admin_replies": answer == "yes",
         }
     }
-    update_channel_settings(channel["channel_id"], update)
+    await update_channel_settings(channel["channel_id"], update)
     await message.reply_text("Reply cleanup updated.")
     conversation_manager.stop(user_id)
 
@@ -611,7 +648,7 @@ async def cmd_caption_settings(client: Client, message: Message) -> None:
     if not message.from_user:
         return
     user_id = message.from_user.id
-    channels_docs = list_channels(user_id)
+    channels_docs = await list_channels(user_id)
     if not channels_docs:
         await message.reply_text("No channels configured.")
         return
@@ -658,7 +695,7 @@ async def _handle_caption_toggle(client: Client, message: Message, state: Dict[s
         return
     state["context"]["enabled"] = answer == "on"
     if not state["context"]["enabled"]:
-        update_channel_settings(channel["channel_id"], {"caption.enabled": False})
+        await update_channel_settings(channel["channel_id"], {"caption.enabled": False})
         await message.reply_text("Auto caption disabled.")
         conversation_manager.stop(user_id)
         return
@@ -705,7 +742,7 @@ async def _handle_caption_template(client: Client, message: Message, state: Dict
             "template": template,
         }
     }
-    update_channel_settings(channel["channel_id"], update)
+    await update_channel_settings(channel["channel_id"], update)
     await message.reply_text("Caption template saved.")
     conversation_manager.stop(user_id)
 
@@ -714,7 +751,7 @@ async def cmd_reaction_settings(client: Client, message: Message) -> None:
     if not message.from_user:
         return
     user_id = message.from_user.id
-    channels_docs = list_channels(user_id)
+    channels_docs = await list_channels(user_id)
     if not channels_docs:
         await message.reply_text("No channels configured.")
         return
@@ -761,7 +798,7 @@ async def _handle_reaction_toggle(client: Client, message: Message, state: Dict[
         return
     state["context"]["enabled"] = answer == "on"
     if not state["context"]["enabled"]:
-        update_channel_settings(channel["channel_id"], {"reactions.enabled": False})
+        await update_channel_settings(channel["channel_id"], {"reactions.enabled": False})
         await message.reply_text("Auto reactions disabled.")
         conversation_manager.stop(user_id)
         return
@@ -794,7 +831,7 @@ async def _handle_reaction_emojis(client: Client, message: Message, state: Dict[
             "emojis": emojis,
         }
     }
-    update_channel_settings(channel["channel_id"], update)
+    await update_channel_settings(channel["channel_id"], update)
     await message.reply_text("Auto reactions updated.")
     conversation_manager.stop(user_id)
 
@@ -803,7 +840,7 @@ async def cmd_status(client: Client, message: Message) -> None:
     if not message.from_user:
         return
     user_id = message.from_user.id
-    channels_docs = list_channels(user_id)
+    channels_docs = await list_channels(user_id)
     if not channels_docs:
         await message.reply_text("No channels configured.")
         return
@@ -832,18 +869,75 @@ async def _handle_status_selection(client: Client, message: Message, state: Dict
     conversation_manager.stop(message.from_user.id)
 
 
+async def cmd_dupscan(client: Client, message: Message) -> None:
+    if not message.from_user:
+        return
+    user_id = message.from_user.id
+    channels_docs = await list_channels(user_id)
+    if not channels_docs:
+        await message.reply_text("No channels configured.")
+        return
+    stop = len(message.command) > 1 and message.command[1].lower() == "stop"
+    await message.reply_text(
+        f"Send the channel number or ID to {'stop scanning' if stop else 'scan for duplicates'}:\n" +
+        "\n".join(
+            f"{idx}. {c['title']} ({c.get('channel_username') or c['channel_id']})"
+            for idx, c in enumerate(channels_docs, start=1)
+        )
+    )
+    conversation_manager.start(
+        user_id,
+        _handle_dupscan_selection,
+        {"channels": channels_docs, "stop": stop},
+    )
+
+
+async def _handle_dupscan_selection(client: Client, message: Message, state: Dict[str, Any]) -> None:
+    context = state["context"]
+    selection = _parse_channel_selection(message.text or "", context["channels"])
+    if not selection:
+        await message.reply_text("Invalid selection.")
+        return
+    if not await _ensure_access_or_notify(client, message, selection):
+        return
+    conversation_manager.stop(message.from_user.id)
+    if context["stop"]:
+        if dup_scan.cancel_scan(selection["channel_id"]):
+            await message.reply_text("Stopping the scan. Run /dupscan again to resume it.")
+        else:
+            await message.reply_text("No scan is running for that channel.")
+        return
+    if dup_scan.is_running(selection["channel_id"]):
+        await message.reply_text(
+            dup_scan.current_progress(selection) or "A scan of this channel is already running."
+        )
+        return
+    settings = await get_channel_settings(selection["channel_id"]) or {}
+    duplicates = settings.get("duplicates", {})
+    if not duplicates.get("enabled"):
+        await message.reply_text("Enable the duplicate cleaner with /dup_settings first; the scan uses its settings.")
+        return
+    status = await message.reply_text("Starting duplicate scan…")
+    try:
+        await dup_scan.start_scan(client, selection, duplicates, status)
+    except dup_scan.ScanError as exc:
+        await status.edit_text(str(exc))
+
+
 async def show_status_summary(message: Message, channel: Dict[str, Any]) -> None:
-    settings = get_channel_settings(channel["channel_id"]) or {}
+    settings = await get_channel_settings(channel["channel_id"]) or {}
     duplicates = settings.get("duplicates", {})
     replies = settings.get("replies", {})
     caption = settings.get("caption", {})
     reactions = settings.get("reactions", {})
+    cached_posts, cached_bytes = recent_cache_usage(channel["channel_id"])
     text = (
         f"Channel: **{channel['title']}** ({channel.get('channel_username') or channel['channel_id']})\n"
         f"Duplicates: {'ON' if duplicates.get('enabled') else 'OFF'} (criteria: {', '.join(duplicates.get('criteria', []))})\n"
         f"Replies: {'ON' if replies.get('enabled') else 'OFF'} (mode: {replies.get('mode')})\n"
         f"Caption: {'ON' if caption.get('enabled') else 'OFF'} (apply_to: {', '.join(caption.get('apply_to', []))})\n"
-        f"Reactions: {'ON' if reactions.get('enabled') else 'OFF'} (scope: {reactions.get('scope')})"
+        f"Reactions: {'ON' if reactions.get('enabled') else 'OFF'} (scope: {reactions.get('scope')})\n"
+        f"Duplicate cache: {cached_posts} posts, {cached_bytes / 1024:.1f} KB"
     )
     await message.reply_text(text)
 
@@ -864,6 +958,7 @@ def register(app: Client) -> None:
     app.add_handler(MessageHandler(cmd_caption_settings, filters.private & filters.command("caption_settings")))
     app.add_handler(MessageHandler(cmd_reaction_settings, filters.private & filters.command("reaction_settings")))
     app.add_handler(MessageHandler(cmd_status, filters.private & filters.command("status")))
+    app.add_handler(MessageHandler(cmd_dupscan, filters.private & filters.command("dupscan")))
     app.add_handler(
         MessageHandler(
             conversation_router,
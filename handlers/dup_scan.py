@@ -0,0 +1,228 @@
+"""Retroactive duplicate scan over a channel's existing posts (/dupscan).
+
+Bots cannot call ``messages.getHistory``, so the history is read by message
+ID with ``get_messages`` in pages of up to 200, oldest first.  Each post goes
+through the same signature and window logic as live duplicate detection, in
+a window private to the scan.  Victims are deleted through the deletion
+coalescer after every page, and the position, counters and window are
+checkpointed in ``dup_scans`` so an interrupted scan resumes where it
+stopped.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from pyrogram import Client
+from pyrogram.errors import FloodWait, RPCError
+from pyrogram.types import Message
+
+from async_db import get_dup_scan, log_action, save_dup_scan
+from deletions import deletion_coalescer
+from handlers.channel_events import (
+    MAX_CACHE,
+    RecentEntry,
+    RecentWindow,
+    find_duplicate_match,
+    message_signature,
+    newest_seen_message_id,
+    remove_from_cache,
+    trim_window,
+)
+from rate_limit import api_limiter
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 200
+PROGRESS_INTERVAL = 15.0
+
+# channel_id -> running scan, and the latest state of each running scan.
+_running: Dict[int, "asyncio.Task[None]"] = {}
+_progress: Dict[int, Dict[str, Any]] = {}
+
+
+class ScanError(Exception):
+    """A scan cannot be started; the message is meant for the owner."""
+
+
+def is_running(channel_id: int) -> bool:
+    return channel_id in _running
+
+
+def progress_text(channel: Dict[str, Any], state: Dict[str, Any]) -> str:
+    scanned_to = max(0, state["next_id"] - 1)
+    return (
+        f"Duplicate scan of **{channel['title']}** ({state['status']}): "
+        f"{scanned_to}/{state['newest_id']} message IDs checked, "
+        f"{state['posts']} posts, {state['duplicates']} duplicates, "
+        f"{state['deleted']} deleted"
+        + (f", {state['failed']} could not be deleted." if state.get("failed") else ".")
+    )
+
+
+def current_progress(channel: Dict[str, Any]) -> Optional[str]:
+    state = _progress.get(channel["channel_id"])
+    return progress_text(channel, state) if state else None
+
+
+async def start_scan(
+    client: Client, channel: Dict[str, Any], cfg: Dict[str, Any], status: Message
+) -> None:
+    """Start or resume the scan of ``channel``, reporting progress in ``status``.
+
+    Raises :class:`ScanError` when the scan cannot start.
+    """
+    channel_id = channel["channel_id"]
+    if channel_id in _running:
+        raise ScanError("A scan of this channel is already running.")
+    state = await get_dup_scan(channel_id)
+    if state and state.get("status") != "done":
+        resumed = True
+    else:
+        newest_id = await newest_seen_message_id(channel_id, channel["owner_user_id"])
+        if not newest_id:
+            raise ScanError(
+                "I have not seen any post in this channel yet. Publish a post "
+                "(or wait for the next one) and run /dupscan again."
+            )
+        resumed = False
+        state = {
+            "channel_id": channel_id,
+            "owner_user_id": channel["owner_user_id"],
+            "newest_id": newest_id,
+            "next_id": 1,
+            "posts": 0,
+            "duplicates": 0,
+            "deleted": 0,
+            "failed": 0,
+            "window": [],
+        }
+    state["status"] = "running"
+    text = progress_text(channel, state)
+    if resumed:
+        text = f"Resuming from message {state['next_id']}.\n{text}"
+    await _report(status, text)
+    _progress[channel_id] = state
+    task = asyncio.ensure_future(_run_scan(client, channel, cfg, state, status))
+    _running[channel_id] = task
+    task.add_done_callback(lambda _: _running.pop(channel_id, None))
+
+
+def cancel_scan(channel_id: int) -> bool:
+    """Stop a running scan; its checkpoint is kept so it can be resumed."""
+    task = _running.get(channel_id)
+    if task is None:
+        return False
+    task.cancel()
+    return True
+
+
+async def _run_scan(
+    client: Client,
+    channel: Dict[str, Any],
+    cfg: Dict[str, Any],
+    state: Dict[str, Any],
+    status: Message,
+) -> None:
+    channel_id = channel["channel_id"]
+    owner_id = channel["owner_user_id"]
+    criteria = cfg.get("criteria", [])
+    delete_new = cfg.get("strategy", "delete_new") == "delete_new"
+    window = RecentWindow()
+    for document in state["window"]:
+        window.append(RecentEntry.from_document(document))
+    last_report = time.monotonic()
+    try:
+        while state["next_id"] <= state["newest_id"]:
+            first = state["next_id"]
+            last = min(first + PAGE_SIZE - 1, state["newest_id"])
+            victims: List[int] = []
+            for message in await _get_page(client, channel_id, list(range(first, last + 1))):
+                if message.empty or message.service:
+                    continue
+                state["posts"] += 1
+                info = await message_signature(client, message, criteria, api_limiter)
+                trim_window(window, cfg, now=info.date)
+                matched = find_duplicate_match(info, window, cfg)
+                if matched:
+                    state["duplicates"] += 1
+                    if delete_new:
+                        victims.append(info.message_id)
+                        continue
+                    victims.append(matched[0].message_id)
+                    window.remove_message(channel_id, matched[0].message_id)
+                window.append(info)
+                if len(window) > MAX_CACHE:
+                    window.popleft()
+            if victims:
+                deleted, failed = await _delete_victims(client, channel_id, owner_id, victims)
+                state["deleted"] += deleted
+                state["failed"] = state.get("failed", 0) + failed
+            state["next_id"] = last + 1
+            state["window"] = [entry.to_document(owner_id) for entry in window]
+            await save_dup_scan(state)
+            if time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                await _report(status, progress_text(channel, state))
+        state["status"] = "done"
+        state["window"] = []
+    except asyncio.CancelledError:
+        state["status"] = "cancelled"
+        raise
+    except Exception:
+        logger.exception("Duplicate scan of %s failed", channel_id)
+        state["status"] = "failed"
+    finally:
+        _progress.pop(channel_id, None)
+        try:
+            await save_dup_scan(state)
+        except Exception:
+            logger.exception("Could not save the scan checkpoint of %s", channel_id)
+        text = progress_text(channel, state)
+        if state["status"] != "done":
+            text += "\nRun /dupscan again to resume."
+        await _report(status, text)
+        await log_action(
+            channel_id,
+            owner_id,
+            "duplicate_scan",
+            {
+                key: state.get(key, 0)
+                for key in ("status", "next_id", "posts", "duplicates", "deleted", "failed")
+            },
+        )
+
+
+async def _get_page(client: Client, channel_id: int, message_ids: List[int]) -> List[Message]:
+    while True:
+        await api_limiter.acquire()
+        try:
+            return await client.get_messages(channel_id, message_ids)
+        except FloodWait as err:
+            await asyncio.sleep(err.value)
+
+
+async def _delete_victims(
+    client: Client, channel_id: int, owner_id: int, message_ids: List[int]
+) -> Tuple[int, int]:
+    """Delete ``message_ids``; returns how many were deleted and how many were not."""
+    deleted = await deletion_coalescer.submit(
+        client,
+        channel_id,
+        message_ids,
+        owner_id=owner_id,
+        action="duplicate_scan_deleted",
+    )
+    for message_id in deleted:
+        # The newest posts may also be in the live duplicate windows.
+        await remove_from_cache(channel_id, owner_id, message_id)
+    return len(deleted), len(message_ids) - len(deleted)
+
+
+async def _report(status: Message, text: str) -> None:
+    try:
+        await status.edit_text(text)
+    except RPCError:
+        pass
@@ -0,0 +1,87 @@
+"""Run update handlers one at a time per key, and different keys in parallel.
+
+Pyrogram hands updates to several workers, so two posts of one chat can be
+handled at the same time and interleave at every ``await``.  Handlers that
+read, check and then update per-chat state (duplicate windows, reply
+threads, forwarded-message maps) must not interleave, but running every
+chat through a single worker is far too slow.  :class:`KeyedDispatcher`
+queues work per key (the chat ID) and runs each key's queue in order, with
+up to ``workers`` keys processed at once.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+Job = Tuple[Callable[..., Awaitable[Any]], Tuple[Any, ...], float]
+
+
+class KeyedDispatcher:
+    """Serialise jobs per key across at most ``workers`` concurrent keys.
+
+    :meth:`dispatch` returns once the job is queued, so the calling Pyrogram
+    worker is free for the next update.  At most ``max_pending`` jobs are
+    queued or running; beyond that :meth:`dispatch` waits, which pushes back
+    on Pyrogram instead of buffering without limit.  Jobs of one key run in
+    the order they were dispatched.
+
+    Queue depth and the time jobs wait before starting are reported under
+    ``name`` in :mod:`metrics`.
+    """
+
+    def __init__(self, *, workers: int, max_pending: Optional[int] = None, name: str = "dispatch") -> None:
+        self.workers = max(1, workers)
+        self.max_pending = max(self.workers, max_pending or self.workers * 64)
+        self.name = name
+        self._slots = asyncio.Semaphore(self.workers)
+        self._capacity = asyncio.Semaphore(self.max_pending)
+        self._queues: Dict[Hashable, Deque[Job]] = {}
+        self._tasks: Dict[Hashable, "asyncio.Task[None]"] = {}
+        self._pending = 0
+        metrics.register_gauge(f"{name}.pending", lambda: self._pending)
+        metrics.register_gauge(f"{name}.keys", lambda: len(self._queues))
+
+    async def dispatch(self, key: Hashable, handler: Callable[..., Awaitable[Any]], *args: Any) -> None:
+        """Queue ``handler(*args)`` to run after every earlier job of ``key``."""
+        await self._capacity.acquire()
+        self._pending += 1
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque()
+        queue.append((handler, args, time.perf_counter()))
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.ensure_future(self._drain(key, queue))
+
+    async def stop(self) -> None:
+        """Wait for every queued job to finish."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks.values()), return_exceptions=True)
+
+    async def _drain(self, key: Hashable, queue: Deque[Job]) -> None:
+        try:
+            while queue:
+                handler, args, queued_at = queue[0]
+                async with self._slots:
+                    metrics.observe(f"{self.name}.wait", time.perf_counter() - queued_at)
+                    try:
+                        await handler(*args)
+                    except Exception:
+                        logger.exception("Handler %s failed for %s", getattr(handler, "__name__", handler), key)
+                    finally:
+                        queue.popleft()
+                        self._pending -= 1
+                        self._capacity.release()
+        finally:
+            # Jobs left behind by a cancelled task are dropped with the queue.
+            self._pending -= len(queue)
+            for _ in queue:
+                self._capacity.release()
+            del self._tasks[key]
+            del self._queues[key]
@@ -1,12 +1,17 @@
 """Entrypoint for the Telegram channel management bot."""
 from __future__ import annotations
 
+import asyncio
 import logging
 
-from pyrogram import Client
+from pyrogram import Client, idle
 
-from config import API_HASH, API_ID, BOT_TOKEN, LOG_LEVEL
-from db import ensure_indexes
+import async_db
+import metrics
+import phash
+from config import API_HASH, API_ID, BOT_TOKEN, LOG_LEVEL, METRICS_LOG_INTERVAL
+from db import ensure_indexes, warm_channel_cache
+from deletions import deletion_coalescer
 from handlers import channel_events, commands
 
 logging.basicConfig(
@@ -26,13 +31,36 @@ def build_client() -> Client:
     )
 
 
+async def run(app: Client) -> None:
+    await app.start()
+    await channel_events.reply_expiry.start(app)
+    metrics_task = asyncio.create_task(metrics.log_periodically(METRICS_LOG_INTERVAL))
+    try:
+        await idle()
+    finally:
+        metrics_task.cancel()
+        # Queued posts, expiring replies and queued deletions still need the client.
+        await channel_events.channel_dispatcher.stop()
+        await channel_events.reply_expiry.stop()
+        await deletion_coalescer.stop()
+        await app.stop()
+        # Write out buffered action logs and recent posts before the process exits.
+        await async_db.action_log_writer.stop()
+        await async_db.recent_post_writer.stop()
+
+
 def main() -> None:
     logger.info("Starting channel management bot")
     ensure_indexes()
+    warm_channel_cache()
     app = build_client()
     commands.register(app)
     channel_events.register(app)
-    app.run()
+    try:
+        app.run(run(app))
+    finally:
+        phash.shutdown()
+        async_db.shutdown()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,77 @@
+"""Minimal in-process metrics shared by both bots.
+
+Gauges are either set directly or computed on demand from a callback;
+timings keep a count, total and maximum per name.  ``snapshot()`` returns a
+flat dict suitable for logging.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOG_INTERVAL = 600.0
+
+
+@dataclass(slots=True)
+class _Timing:
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+
+_gauges: Dict[str, float] = {}
+_gauge_callbacks: Dict[str, Callable[[], float]] = {}
+_timings: Dict[str, _Timing] = {}
+
+
+def set_gauge(name: str, value: float) -> None:
+    _gauges[name] = value
+
+
+def register_gauge(name: str, callback: Callable[[], float]) -> None:
+    """Report ``callback()`` as the value of ``name`` whenever metrics are read."""
+    _gauge_callbacks[name] = callback
+
+
+def observe(name: str, seconds: float) -> None:
+    timing = _timings.get(name)
+    if timing is None:
+        timing = _timings[name] = _Timing()
+    timing.count += 1
+    timing.total += seconds
+    if seconds > timing.max:
+        timing.max = seconds
+
+
+def snapshot() -> Dict[str, float]:
+    values: Dict[str, float] = dict(_gauges)
+    for name, callback in _gauge_callbacks.items():
+        try:
+            values[name] = callback()
+        except Exception:
+            logger.exception("Gauge %s failed", name)
+    for name, timing in _timings.items():
+        values[f"{name}.count"] = timing.count
+        values[f"{name}.avg_ms"] = (
+            timing.total / timing.count * 1000 if timing.count else 0.0
+        )
+        values[f"{name}.max_ms"] = timing.max * 1000
+    return values
+
+
+async def log_periodically(interval: Optional[float] = DEFAULT_LOG_INTERVAL) -> None:
+    """Log a metrics snapshot every ``interval`` seconds until cancelled."""
+    if not interval or interval <= 0:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        values = snapshot()
+        if values:
+            logger.info(
+                "metrics %s",
+                " ".join(f"{name}={value:g}" for name, value in sorted(values.items())),
+            )
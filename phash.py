@@ -0,0 +1,110 @@
+"""64-bit perceptual image hashes for the ``phash`` duplicate criterion.
+
+The hash is the classic DCT pHash: the image is reduced to 32x32 greyscale,
+the 8x8 lowest DCT frequencies are kept and each bit records whether a
+coefficient is above their median.  Recompressed or slightly resized copies
+of an image land within a few bits of each other.
+
+Pillow is listed in requirements.txt.  Installations without it get
+``AVAILABLE = False``: :func:`hash_image` returns ``None`` and the criterion
+is not offered in /dup_settings.
+"""
+from __future__ import annotations
+
+import asyncio
+import io
+import logging
+import math
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from config import PHASH_WORKERS
+
+try:  # Optional: only needed when a channel enables the phash criterion.
+    from PIL import Image
+except ImportError:  # pragma: no cover - depends on the installation
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+AVAILABLE = Image is not None
+if not AVAILABLE:
+    logger.warning("Pillow is not installed; the phash duplicate criterion is disabled")
+HASH_SIZE = 8
+_SAMPLE_SIZE = 32
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+@lru_cache(maxsize=None)
+def _dct_basis() -> Tuple[Tuple[float, ...], ...]:
+    return tuple(
+        tuple(
+            math.cos(math.pi * (2 * x + 1) * u / (2 * _SAMPLE_SIZE))
+            for x in range(_SAMPLE_SIZE)
+        )
+        for u in range(HASH_SIZE)
+    )
+
+
+def compute_phash(data: bytes) -> int:
+    """Return the 64-bit pHash of an encoded image.  Runs in a worker process."""
+    with Image.open(io.BytesIO(data)) as image:
+        small = image.convert("L").resize((_SAMPLE_SIZE, _SAMPLE_SIZE), Image.LANCZOS)
+        pixels = list(small.getdata())
+
+    basis = _dct_basis()
+    # Separable DCT that only computes the lowest HASH_SIZE frequencies:
+    # first along each row, then down each of the resulting columns.
+    rows = [
+        [
+            sum(p * c for p, c in zip(pixels[y * _SAMPLE_SIZE : (y + 1) * _SAMPLE_SIZE], b))
+            for b in basis
+        ]
+        for y in range(_SAMPLE_SIZE)
+    ]
+    coefficients = [
+        sum(rows[y][u] * basis[v][y] for y in range(_SAMPLE_SIZE))
+        for v in range(HASH_SIZE)
+        for u in range(HASH_SIZE)
+    ]
+
+    # The DC term only reflects overall brightness; leave it out of the median.
+    ordered = sorted(coefficients[1:])
+    median = (ordered[len(ordered) // 2 - 1] + ordered[len(ordered) // 2]) / 2
+    value = 0
+    for bit, coefficient in enumerate(coefficients):
+        if coefficient > median:
+            value |= 1 << bit
+    return value
+
+
+async def hash_image(data: bytes) -> Optional[int]:
+    """Hash ``data`` in the process pool; ``None`` if it cannot be decoded.
+
+    Raises ``BrokenProcessPool`` if a worker died; the next call starts a
+    new pool.
+    """
+    global _executor
+    if not AVAILABLE:
+        return None
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=max(1, PHASH_WORKERS))
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_executor, compute_phash, data)
+    except (OSError, ValueError) as err:
+        logger.debug("Could not hash image: %s", err)
+        return None
+    except BrokenProcessPool:
+        shutdown()
+        raise
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,43 @@
+"""Token-bucket rate limiting for background Telegram API calls."""
+from __future__ import annotations
+
+import asyncio
+import time
+
+from config import API_CALLS_PER_SECOND
+
+
+class RateLimiter:
+    """Allow ``rate`` calls per second on average, in bursts of up to ``burst``.
+
+    Waiters are served in arrival order, so a long job cannot starve
+    shorter ones that queued after it.
+    """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: int = 1) -> None:
+        tokens = min(tokens, self.burst)
+        async with self._lock:
+            self._refill()
+            while self._tokens < tokens:
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= tokens
+
+
+# Shared by every bulk job (history scans, batched deletions) so together
+# they stay under Telegram's flood limits.
+api_limiter = RateLimiter(API_CALLS_PER_SECOND, burst=max(1, int(API_CALLS_PER_SECOND)))
@@ -0,0 +1,121 @@
+"""Replies seen per channel post, for the reply cleanup modes.
+
+A thread is the set of replies to one post, ``(chat_id, root_id)``.  Replies
+are kept in two insertion-ordered dicts: ``protected`` ones (admin replies
+when admins are exempt) that are never selected for deletion, and the
+``others``.  Every mode therefore touches only the replies it deletes:
+keep_latest leaves at most one entry in ``others``, delete_if_count_gt_n pops
+from its front and removals are dict deletions.
+
+The tracker holds at most ``max_replies`` replies in total.  Threads are
+kept in least-recently-used order and the coldest are dropped whole once
+the budget is exceeded.
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+ThreadKey = Tuple[int, int]
+
+
+class ReplyThread:
+    __slots__ = ("protected", "others")
+
+    def __init__(self) -> None:
+        self.protected: Dict[int, None] = {}
+        self.others: Dict[int, None] = {}
+
+    def __len__(self) -> int:
+        return len(self.protected) + len(self.others)
+
+    def __iter__(self) -> Iterator[int]:
+        """Message IDs of the tracked replies, in no particular order."""
+        yield from self.protected
+        yield from self.others
+
+    def _drop_oldest(self) -> None:
+        # Message IDs grow over time, so the smaller head is the older reply.
+        heads = [
+            (next(iter(replies)), replies)
+            for replies in (self.protected, self.others)
+            if replies
+        ]
+        message_id, replies = min(heads, key=lambda head: head[0])
+        del replies[message_id]
+
+
+class ReplyTracker:
+    def __init__(self, *, max_replies: int, max_per_thread: int = 500) -> None:
+        self.max_replies = max(1, max_replies)
+        self.max_per_thread = max(1, max_per_thread)
+        self.size = 0
+        self._threads: "OrderedDict[ThreadKey, ReplyThread]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._threads)
+
+    def get(self, chat_id: int, root_id: int) -> Optional[ReplyThread]:
+        return self._threads.get((chat_id, root_id))
+
+    def add(self, chat_id: int, root_id: int, message_id: int, protected: bool = False) -> None:
+        key = (chat_id, root_id)
+        thread = self._threads.get(key)
+        if thread is None:
+            thread = self._threads[key] = ReplyThread()
+        else:
+            self._threads.move_to_end(key)
+        replies = thread.protected if protected else thread.others
+        if message_id in replies:
+            return
+        replies[message_id] = None
+        self.size += 1
+        if len(thread) > self.max_per_thread:
+            thread._drop_oldest()
+            self.size -= 1
+        self._evict()
+
+    def keep_latest(self, chat_id: int, root_id: int, latest_id: int) -> List[int]:
+        """Forget and return every unprotected reply other than ``latest_id``."""
+        thread = self._threads.get((chat_id, root_id))
+        if thread is None:
+            return []
+        victims = [message_id for message_id in thread.others if message_id != latest_id]
+        if victims:
+            thread.others = {latest_id: None} if latest_id in thread.others else {}
+            self.size -= len(victims)
+        return victims
+
+    def keep_newest(self, chat_id: int, root_id: int, count: int) -> List[int]:
+        """Forget and return the oldest unprotected replies beyond ``count``."""
+        thread = self._threads.get((chat_id, root_id))
+        if thread is None or len(thread.others) <= count:
+            return []
+        victims: List[int] = []
+        others = iter(thread.others)
+        for _ in range(len(thread.others) - count):
+            victims.append(next(others))
+        for message_id in victims:
+            del thread.others[message_id]
+        self.size -= len(victims)
+        return victims
+
+    def remove(self, chat_id: int, root_id: int, message_ids: Iterable[int]) -> None:
+        key = (chat_id, root_id)
+        thread = self._threads.get(key)
+        if thread is None:
+            return
+        for message_id in message_ids:
+            for replies in (thread.others, thread.protected):
+                if message_id in replies:
+                    del replies[message_id]
+                    self.size -= 1
+                    break
+        if not thread:
+            del self._threads[key]
+
+    def _evict(self) -> None:
+        # The thread just added to is the most recent one and goes last.
+        while self.size > self.max_replies and len(self._threads) > 1:
+            _, thread = self._threads.popitem(last=False)
+            self.size -= len(thread)
@@ -0,0 +1,44 @@
+"""ConfigStore.import_tasks: validation of entries from outside the bot."""
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from config_store import ConfigStore
+
+VALID = {"source_id": -1001, "target_id": -2001, "media_types": ["photo"], "caption": "hi"}
+
+
+@pytest.mark.parametrize("backend", ["json", "binary"])
+def test_malformed_rows_reject_the_whole_file(backend: str, tmp_path: Path) -> None:
+    store = ConfigStore(tmp_path / "config", snapshot_format=backend)
+    store.load()
+    entries = [
+        VALID,
+        dict(VALID, caption=123),
+        dict(VALID, media_types="photo"),
+        VALID,
+        dict(VALID, skip_duplicates="yes", max_media_size=1.5),
+    ]
+    with pytest.raises(ValueError) as excinfo:
+        store.import_tasks(1, entries)
+    rows = [line.split(":", 1)[0] for line in str(excinfo.value).splitlines()]
+    assert rows == ["Row 2", "Row 3", "Row 5"]
+    assert store.list_tasks(1) == []
+    assert not store.source_index
+
+    # The store still saves after the rejected import.
+    added = store.import_tasks(1, [VALID, dict(VALID, skip_duplicates=True)])
+    assert [task.caption for task in added] == ["hi", "hi"]
+    assert added[1].skip_duplicates
+    restarted = ConfigStore(tmp_path / "config", snapshot_format=backend)
+    restarted.load()
+    assert len(restarted.list_tasks(1)) == 2
+
+
+def test_chat_ids_must_be_numbers(tmp_path: Path) -> None:
+    store = ConfigStore(tmp_path / "config.json")
+    store.load()
+    with pytest.raises(ValueError, match="source_id"):
+        store.import_tasks(1, [dict(VALID, source_id="@channel")])
@@ -0,0 +1,130 @@
+"""Randomised checks of ConfigStore's incremental routing index.
+
+Every operation is followed by a comparison of ``source_index`` with the
+index ``_rebuild_index()`` builds from scratch for the same tasks.
+"""
+from __future__ import annotations
+
+import random
+from dataclasses import replace
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import pytest
+
+from config_store import ConfigStore, ForwardTask, TaskRoute
+from config_store_sqlite import SQLiteConfigStore
+
+OWNERS = (1, 2, 3)
+SOURCES = (-1001, -1002, -1003, -1004, -1005)
+MEDIA = ("all", "photo", "video", "document", "text")
+STEPS = 400
+
+
+class Rollback(Exception):
+    pass
+
+
+def make_store(backend: str, tmp_path: Path) -> ConfigStore:
+    if backend == "sqlite":
+        store: ConfigStore = SQLiteConfigStore(tmp_path / "config.sqlite3")
+    else:
+        store = ConfigStore(tmp_path / "config", snapshot_format=backend, backups=1)
+    store.load()
+    return store
+
+
+def rebuilt_index(store: ConfigStore, tmp_path: Path) -> Dict[int, Tuple[TaskRoute, ...]]:
+    if isinstance(store, SQLiteConfigStore):
+        # Routes are rebuilt from the committed rows.
+        oracle: ConfigStore = SQLiteConfigStore(store.path)
+        oracle.load()
+    else:
+        oracle = ConfigStore(tmp_path / "oracle")
+        oracle.users = store.users
+        oracle._rebuild_index()
+    return normalised(oracle.source_index)
+
+
+def normalised(index) -> Dict[int, Tuple[TaskRoute, ...]]:
+    # Updated tasks move to the end of their bucket, so compare bucket contents.
+    return {
+        source_id: tuple(sorted(routes, key=lambda route: (route.owner_id, route.task_id)))
+        for source_id, routes in index.items()
+    }
+
+
+def all_tasks(store: ConfigStore) -> List[Tuple[int, int]]:
+    return [
+        (owner_id, task.task_id) for owner_id in OWNERS for task in store.list_tasks(owner_id)
+    ]
+
+
+def changed_task(task: ForwardTask, rng: random.Random) -> ForwardTask:
+    return replace(
+        task,
+        source_id=rng.choice(SOURCES) if rng.random() < 0.5 else task.source_id,
+        skip_duplicates=not task.skip_duplicates,
+        min_media_size=rng.choice((None, 1024)),
+    )
+
+
+def random_mutation(store: ConfigStore, rng: random.Random) -> None:
+    tasks = all_tasks(store)
+    choice = rng.random()
+    if choice < 0.45 or not tasks:
+        store.add_task(
+            rng.choice(OWNERS),
+            source_id=rng.choice(SOURCES),
+            source_name="source",
+            target_id=rng.randint(-2000, -1900),
+            target_name="target",
+            media_types=rng.sample(MEDIA, rng.randint(1, 2)),
+            caption=rng.choice((None, "caption")),
+        )
+    elif choice < 0.8:
+        owner_id, task_id = rng.choice(tasks)
+        store.update_task(changed_task(store.get_task(owner_id, task_id), rng))
+    else:
+        owner_id, task_id = rng.choice(tasks)
+        assert store.remove_task(owner_id, task_id)
+
+
+@pytest.mark.parametrize("backend", ["json", "binary", "sqlite"])
+@pytest.mark.parametrize("seed", range(3))
+def test_incremental_index_matches_rebuild(backend: str, seed: int, tmp_path: Path) -> None:
+    rng = random.Random(seed)
+    store = make_store(backend, tmp_path)
+    for _ in range(STEPS):
+        snapshot = store.routing
+        published = normalised(snapshot.routes)
+        if rng.random() < 0.15:
+            rollback = rng.random() < 0.4
+            try:
+                with store.batch():
+                    for _ in range(rng.randint(1, 6)):
+                        random_mutation(store, rng)
+                    if rollback:
+                        raise Rollback
+            except Rollback:
+                assert store.routing is snapshot
+        else:
+            random_mutation(store, rng)
+        # Published snapshots are never modified in place.
+        assert normalised(snapshot.routes) == published
+        assert normalised(store.source_index) == rebuilt_index(store, tmp_path)
+    if isinstance(store, SQLiteConfigStore):
+        store.close()
+
+
+@pytest.mark.parametrize("backend", ["json", "binary"])
+def test_apply_users_matches_rebuild(backend: str, tmp_path: Path) -> None:
+    rng = random.Random(7)
+    store = make_store(backend, tmp_path)
+    other = make_store(backend, tmp_path / "other")
+    for _ in range(50):
+        for _ in range(rng.randint(1, 10)):
+            random_mutation(other, rng)
+        store.apply_users(other.read_live_snapshot())
+        assert normalised(store.source_index) == rebuilt_index(store, tmp_path)
+        assert normalised(store.source_index) == normalised(other.source_index)
@@ -0,0 +1,125 @@
+"""Snapshot files: checksums, hand edits and backup rotation."""
+from __future__ import annotations
+
+import hashlib
+import json
+from pathlib import Path
+
+import pytest
+
+from config_store import ConfigStore
+
+
+def add_task(store: ConfigStore, source_id: int = -1001) -> None:
+    store.add_task(
+        1,
+        source_id=source_id,
+        source_name="source",
+        target_id=-2001,
+        target_name="target",
+        media_types=["all"],
+    )
+
+
+def test_json_snapshot_is_plain_json(tmp_path: Path) -> None:
+    store = ConfigStore(tmp_path / "config.json")
+    store.load()
+    add_task(store)
+    data = json.loads(store.path.read_text("utf-8"))
+    assert data["users"]["1"]["tasks"][0]["source_id"] == -1001
+    assert (tmp_path / "config.json.sha256").exists()
+
+
+def test_hand_edit_is_accepted_and_resigned(tmp_path: Path) -> None:
+    store = ConfigStore(tmp_path / "config.json")
+    store.load()
+    add_task(store)
+    data = json.loads(store.path.read_text("utf-8"))
+    data["users"]["1"]["tasks"][0]["source_id"] = -1005
+    store.path.write_text(json.dumps(data), "utf-8")
+
+    assert store.reload() == (0, 0, 1)
+    assert set(store.source_index) == {-1005}
+    assert store._read_verified_snapshot(store.path)[1]
+
+    restarted = ConfigStore(tmp_path / "config.json")
+    restarted.load()
+    assert set(restarted.source_index) == {-1005}
+
+
+def test_hand_edit_while_stopped_needs_opt_in(tmp_path: Path) -> None:
+    store = ConfigStore(tmp_path / "config.json")
+    store.load()
+    add_task(store)
+    store.path.write_text(store.path.read_text("utf-8").replace("-1001", "-1002"), "utf-8")
+
+    restarted = ConfigStore(tmp_path / "config.json")
+    restarted.load(accept_edits=True)
+    assert set(restarted.source_index) == {-1002}
+    assert restarted._read_verified_snapshot(restarted.path)[1]
+
+
+def test_checksum_mismatch_falls_back_to_verified_backup(tmp_path: Path) -> None:
+    store = ConfigStore(tmp_path / "config.json", backups=2)
+    store.load()
+    add_task(store, -1001)
+    add_task(store, -1002)
+    # Damage that still parses: a flipped digit.
+    store.path.write_text(store.path.read_text("utf-8").replace("-1002", "-1009"), "utf-8")
+    with pytest.raises(ValueError):
+        ConfigStore._read_snapshot(store.path)
+
+    restarted = ConfigStore(tmp_path / "config.json", backups=2)
+    restarted.load()
+    assert set(restarted.source_index) == {-1001}
+    assert restarted._read_verified_snapshot(restarted.path)[1]
+
+
+def test_damaged_snapshot_falls_back_to_backup(tmp_path: Path) -> None:
+    store = ConfigStore(tmp_path / "config.json", backups=2)
+    store.load()
+    add_task(store, -1001)
+    add_task(store, -1002)
+    store.path.write_bytes(store.path.read_bytes()[:40])
+
+    restarted = ConfigStore(tmp_path / "config.json", backups=2)
+    restarted.load()
+    assert set(restarted.source_index) == {-1001}
+    # The recovered configuration is written back as the live snapshot.
+    assert json.loads(restarted.path.read_text("utf-8"))["users"]["1"]["tasks"]
+
+
+def test_backups_keep_previous_versions(tmp_path: Path) -> None:
+    store = ConfigStore(tmp_path / "config.json", backups=2)
+    store.load()
+    for source_id in (-1001, -1002, -1003):
+        add_task(store, source_id)
+    backup = ConfigStore._read_verified_snapshot(tmp_path / "config.json.1")
+    assert backup[1]
+    tasks = backup[0][1]["tasks"]
+    assert [task.source_id for task in tasks.values()] == [-1001, -1002]
+    # Rotation links the live file instead of moving it away.
+    assert (tmp_path / "config.json").exists()
+    assert not (tmp_path / "config.json.3").exists()
+
+
+def test_binary_snapshot_rejects_checksum_mismatch(tmp_path: Path) -> None:
+    store = ConfigStore(tmp_path / "config.bin", snapshot_format="binary")
+    store.load()
+    add_task(store)
+    raw = bytearray(store.path.read_bytes())
+    raw[-1] ^= 0xFF
+    store.path.write_bytes(bytes(raw))
+    with pytest.raises(ValueError):
+        ConfigStore._read_snapshot(store.path)
+
+
+def test_legacy_inline_checksum_is_migrated(tmp_path: Path) -> None:
+    path = tmp_path / "config.json"
+    task = {"task_id": 1, "source_id": -1001, "target_id": -2001}
+    body = json.dumps({"users": {"1": {"next_task_id": 2, "tasks": [task]}}}).encode("utf-8")
+    path.write_bytes(b"#sha256=" + hashlib.sha256(body).hexdigest().encode() + b"\n" + body)
+    store = ConfigStore(path)
+    store.load()
+    assert set(store.source_index) == {-1001}
+    assert json.loads(path.read_text("utf-8"))["users"]["1"]["next_task_id"] == 2
@@ -0,0 +1,68 @@
+"""FuzzyQuery must never rule out a pair that SequenceMatcher matches."""
+from __future__ import annotations
+
+import random
+from difflib import SequenceMatcher
+
+import pytest
+
+from fuzzy_text import FuzzyQuery, GramSketch, similar
+
+WORDS = (
+    "the of and to in is for that on with as this by be are from at or new "
+    "channel post today join our free video photo link update news daily "
+    "best offer price sale more info here click now read full story"
+).split()
+ALPHABET = "abcdefghijklmnopqrstuvwxyz "
+
+
+def make_text(rng: random.Random, length: int) -> str:
+    words = []
+    while sum(len(word) + 1 for word in words) < length:
+        words.append(rng.choice(WORDS))
+    return " ".join(words)[:length]
+
+
+def edit(rng: random.Random, text: str, edits: int) -> str:
+    chars = list(text)
+    for _ in range(edits):
+        position = rng.randrange(len(chars) + 1)
+        op = rng.random()
+        if op < 0.4 and position < len(chars):
+            chars[position] = rng.choice(ALPHABET)
+        elif op < 0.7 or position >= len(chars):
+            chars.insert(position, rng.choice(ALPHABET))
+        else:
+            del chars[position]
+    return "".join(chars)
+
+
+def ratio(text: str, other: str) -> float:
+    return SequenceMatcher(None, text, other, autojunk=False).ratio()
+
+
+@pytest.mark.parametrize("threshold", [0.8, 0.9, 0.95])
+def test_filter_keeps_every_match(threshold: float) -> None:
+    rng = random.Random(int(threshold * 100))
+    matched = 0
+    for _ in range(300):
+        text = make_text(rng, rng.randint(10, 400))
+        other = edit(rng, text, rng.randint(0, max(1, len(text) // 6)))
+        if rng.random() < 0.3:
+            # Edits in one block rather than scattered.
+            start = rng.randrange(len(other) + 1)
+            other = other[:start] + make_text(rng, rng.randint(1, 40)) + other[start + 20 :]
+        query = FuzzyQuery(text, threshold)
+        if ratio(text, other) >= threshold:
+            matched += 1
+            assert query.may_match(other, GramSketch.of(other)), (text, other)
+            assert similar(text, other, threshold)
+    assert matched > 30
+
+
+def test_filter_rejects_unrelated_posts() -> None:
+    rng = random.Random(1)
+    texts = [make_text(rng, 1000) for _ in range(60)]
+    query = FuzzyQuery(texts[0], 0.9)
+    passed = [other for other in texts[1:] if query.may_match(other, GramSketch.of(other))]
+    assert not passed